@@ -1,5 +1,9 @@
 from .server import Server
 from .handlers import RouteHandler, StaticFileHandler, MatchableHandlerABC
+from .cache import FileCache
+from .compression import Compressor
+from .dispatch import WorkQueue, Overloaded, Priority
+from .limits import AdaptiveLimiter, Bulkhead, RateLimiter, RateLimited
 from .types import (
     Request,
     Response,
@@ -7,12 +11,17 @@ from .types import (
     HTMLResponse,
     JSONResponse,
     ErrorResponse,
+    EncodedResponse,
     FileResponse,
     FileTypeResponse,
     RedirectResponse,
     TemporaryRedirect,
     PermanentRedirect,
     RequestBody,
+    RequestStream,
+    PayloadTooLarge,
+    HeadersTooLarge,
+    MissingParameter,
     Query,
     Body,
     Route,
@@ -28,6 +37,7 @@ from .types import (
 from .tags import (
     tag,
     methods,
+    constant,
     get,
     post,
     put,
@@ -4,24 +4,27 @@ from socketpulse.server import Server
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Serve a module or class.")
-    parser.add_argument("module_or_class", help="The module or class to serve.")
+    parser.add_argument("module_or_class", help="The module or class to serve, e.g. socketpulse.samples.sample.Sample "
+                                                "(or 'sample' as a shortcut for that).")
     # add help text for the other arguments
-    parser.add_argument("--host", help="The host to bind to.", default="*", type=str)
-    parser.add_argument("--port", help="The port to bind to.", default=8080, type=int)
+    parser.add_argument("--host", help="The host to bind to.", default=Server.default_host, type=str)
+    parser.add_argument("--port", help="The port to bind to.", default=Server.default_port, type=int)
     parser.add_argument("--errors", help="The error mode to use.", default="hide", type=str, choices=["hide", "short", "show", "tb","traceback"])
+    parser.add_argument("--workers", help="The number of worker processes to fork.", default=Server.default_workers, type=int)
+    parser.add_argument("--reuse-port", help="Give each worker its own SO_REUSEPORT listening socket.", action="store_true")
+    parser.add_argument("--cpu-affinity", help="Pin each worker to its own CPU.", action="store_true")
+    parser.add_argument("--no-compression", help="Don't gzip/deflate response bodies.", action="store_true")
 
     args = parser.parse_args()
-    Server.serve(args.module_or_class, host=args.host, port=args.port, error_mode=args.errors)
+    m = args.module_or_class
+    if m == "sample":
+        m = "socketpulse.samples.sample.Sample"
+    from socketpulse.types import set_default_error_mode
+    set_default_error_mode({"show": "traceback", "tb": "traceback"}.get(args.errors, args.errors))
+    Server.serve(m, host=args.host, port=args.port,
+                 workers=args.workers, reuse_port=args.reuse_port, cpu_affinity=args.cpu_affinity,
+                 compression=not args.no_compression)
 
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python -m socketpulse <import.path.of.module.or.class>")
-        print("Example: python -m socketpulse socketpulse.samples.sample.Sample")
-        print(f"Sample Shortcut: python -m socketpulse sample")
-        sys.exit(1)
-    m = sys.argv[1]
-    if m == "sample":
-        m = "socketpulse.samples.sample.Sample"
-    Server.serve(m)
+    main()
@@ -0,0 +1,188 @@
+"""Reusable receive buffers, filled with recv_into instead of concatenating freshly allocated chunks."""
+import socket
+
+
+class BufferPool:
+    """Free lists of small and large bytearrays shared by the connections of one worker process.
+
+    Connections only hold a buffer while they have unconsumed bytes in it, so idle keep-alive connections
+    don't pin any memory, and busy ones reuse the same few buffers instead of allocating per request. Buffers
+    start small (initial_size bytes), so that many slow clients with a partial request each pin only a little
+    memory, and are swapped for large ones (buffer_size bytes) when a request or a fast client needs the room.
+    """
+    default_initial_size = 4 * 1024
+    default_buffer_size = 64 * 1024
+    default_max_buffers = 64
+    min_buffer_size = 16 * 1024
+    max_buffer_size = 1024 * 1024
+
+    def __init__(self, buffer_size: int = default_buffer_size, max_buffers: int = default_max_buffers,
+                 initial_size: int = default_initial_size):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.initial_size = min(initial_size, buffer_size)
+        self._small: list[bytearray] = []
+        self._large: list[bytearray] = []
+
+    @classmethod
+    def for_socket(cls, sock: socket.socket, max_buffers: int = default_max_buffers) -> "BufferPool":
+        """A pool of buffers as large as the socket's receive buffer (which accepted sockets inherit), so one
+        recv_into can take everything the kernel has queued."""
+        try:
+            size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except OSError:
+            size = cls.default_buffer_size
+        return cls(min(max(size, cls.min_buffer_size), cls.max_buffer_size), max_buffers)
+
+    def acquire(self, size: int = 0) -> bytearray:
+        """A buffer of at least size bytes: a small one if that is enough, else a large one, else (past buffer_size)
+        one that isn't pooled."""
+        if size <= self.initial_size:
+            free, size = self._small, self.initial_size
+        elif size <= self.buffer_size:
+            free, size = self._large, self.buffer_size
+        else:
+            return bytearray(size)
+        try:
+            return free.pop()
+        except IndexError:
+            return bytearray(size)
+
+    def release(self, buffer: bytearray) -> None:
+        # buffers that grew past the pool size (for an oversized request head) are left to the garbage collector
+        if len(buffer) == self.initial_size:
+            free = self._small
+        elif len(buffer) == self.buffer_size:
+            free = self._large
+        else:
+            return
+        if len(free) < self.max_buffers:
+            free.append(buffer)
+
+    def __repr__(self):
+        return (f"BufferPool(initial_size={self.initial_size}, buffer_size={self.buffer_size}, "
+                f"max_buffers={self.max_buffers}, free={len(self._small)}+{len(self._large)})")
+
+
+class RecvBuffer:
+    """The bytes received from one connection and not consumed yet.
+
+    Data is received straight into a pooled bytearray with recv_into. find remembers how far it has scanned, so
+    looking for the end of a request head only ever scans the newly received bytes. The buffer is a small one
+    until a receive fills it, which means the client has more queued: then large ones are used, so that one
+    recv_into takes everything the kernel has, until a receive returns less than a small buffer holds.
+    """
+    __slots__ = ("pool", "_buffer", "_start", "_end", "_scanned", "_large")
+
+    def __init__(self, pool: BufferPool):
+        self.pool = pool
+        self._buffer = None
+        self._start = 0
+        self._end = 0
+        self._scanned = 0
+        self._large = False
+
+    def fill(self, sock: socket.socket, min_size: int = 1) -> int:
+        """Receives as much as fits in the buffer (at least min_size bytes of room) from the socket.
+        Returns the number of bytes received, 0 if the client closed the connection."""
+        self.reserve(min_size)
+        with memoryview(self._buffer) as view, view[self._end:] as free:
+            n = sock.recv_into(free)
+            filled = n == len(free)
+        self._end += n
+        if filled:
+            self._large = True
+        elif n < self.pool.initial_size:
+            self._large = False
+        if self._start == self._end:
+            self.release()
+        elif filled and len(self._buffer) < self.pool.buffer_size:
+            self.resize(self.pool.buffer_size)
+        return n
+
+    def reserve(self, size: int) -> None:
+        """Makes room for at least size more bytes after the buffered ones."""
+        if self._buffer is None:
+            self._buffer = self.pool.acquire(max(size, self.pool.buffer_size if self._large else 0))
+        if len(self._buffer) - self._end >= size:
+            return
+        n = self._end - self._start
+        if n + size > len(self._buffer):
+            self.resize(n + size)
+        elif self._start:
+            # move the unconsumed bytes to the front
+            self._buffer[:n] = self._buffer[self._start:self._end]
+            self._scanned -= self._start
+            self._start, self._end = 0, n
+
+    def resize(self, size: int) -> None:
+        """Moves the buffered bytes to the front of a buffer of at least size bytes, handing the old one back."""
+        n = self._end - self._start
+        buffer = self.pool.acquire(size)
+        buffer[:n] = self._buffer[self._start:self._end]
+        self.pool.release(self._buffer)
+        self._buffer = buffer
+        self._scanned -= self._start
+        self._start, self._end = 0, n
+
+    def find(self, sep: bytes) -> int:
+        """The offset of sep from the start of the buffered bytes, or -1. Bytes already scanned by a previous call
+        aren't scanned again."""
+        if self._buffer is None:
+            return -1
+        i = self._buffer.find(sep, max(self._start, self._scanned - len(sep) + 1), self._end)
+        if i == -1:
+            self._scanned = self._end
+            return -1
+        return i - self._start
+
+    def peek(self, n: int | None = None) -> bytes:
+        """The first n buffered bytes (all of them by default), without consuming them."""
+        if self._buffer is None:
+            return b''
+        end = self._end if n is None else min(self._start + n, self._end)
+        with memoryview(self._buffer) as view:
+            return bytes(view[self._start:end])
+
+    def take(self, n: int | None = None) -> bytes:
+        """Removes and returns the first n buffered bytes (all of them by default)."""
+        data = self.peek(n)
+        self.skip(len(data))
+        return data
+
+    def skip(self, n: int) -> None:
+        """Discards the first n buffered bytes."""
+        self._start = min(self._start + n, self._end)
+        self._scanned = max(self._scanned, self._start)
+        if self._start == self._end:
+            self.release()
+
+    def unread(self, data: bytes) -> None:
+        """Puts bytes back in front of the buffered ones (the start of a pipelined request found past a body)."""
+        if not data:
+            return
+        if self._buffer is not None and self._start >= len(data):
+            self._start -= len(data)
+            self._buffer[self._start:self._start + len(data)] = data
+            self._scanned = self._start
+            return
+        rest = self.take()
+        self.reserve(len(data) + len(rest))
+        self._buffer[self._end:self._end + len(data) + len(rest)] = data + rest
+        self._end += len(data) + len(rest)
+
+    def release(self) -> None:
+        """Hands the (empty) storage back to the pool."""
+        if self._buffer is not None:
+            self.pool.release(self._buffer)
+        self._buffer = None
+        self._start = self._end = self._scanned = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __bool__(self):
+        return self._end > self._start
+
+    def __repr__(self):
+        return f"RecvBuffer({len(self)} bytes)"
@@ -0,0 +1,132 @@
+"""In-memory caches for static files and compressed responses."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from pathlib import Path
+
+
+class CachedFile:
+    """A file's validators and pre-built response headers, plus its contents if it is small enough to keep."""
+    __slots__ = ("path", "mtime_ns", "size", "etag", "last_modified", "headers", "body")
+
+    def __init__(self, path: Path, st: os.stat_result, content_type: str, body: bytes | None = None):
+        self.path = path
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        if body is not None:
+            self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        else:
+            self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(st.st_size),
+            "Last-Modified": self.last_modified,
+            "ETag": self.etag,
+            "Accept-Ranges": "bytes",
+        }
+        self.body = body
+
+    def is_fresh(self, st: os.stat_result) -> bool:
+        return st.st_mtime_ns == self.mtime_ns and st.st_size == self.size
+
+
+class FileCache:
+    """A thread-safe LRU cache of CachedFiles keyed by path, bounded by the total size of the cached contents.
+
+    Entries are revalidated against the file's mtime and size (one stat, done by the caller) on every lookup.
+    Files larger than max_file_size keep their headers cached but are always streamed from disk.
+    """
+    default_max_bytes = 64 * 1024 * 1024
+    default_max_file_size = 1024 * 1024
+
+    def __init__(self, max_bytes: int = default_max_bytes, max_file_size: int = default_max_file_size):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, st: os.stat_result, content_type: str) -> CachedFile:
+        """Returns the cached entry for the file whose current stat is st, (re)loading it if it changed."""
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.is_fresh(st):
+                self._entries.move_to_end(key)
+                return entry
+
+        body = None
+        if st.st_size <= min(self.max_file_size, self.max_bytes):
+            with open(path, "rb") as f:
+                body = f.read()
+        entry = CachedFile(path, st, content_type, body)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None and old.body is not None:
+                self.total_bytes -= len(old.body)
+            self._entries[key] = entry
+            if body is not None:
+                self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.body is not None:
+                    self.total_bytes -= len(evicted.body)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return str(path) in self._entries
+
+
+class LRUCache:
+    """A thread-safe LRU mapping of keys to bytes values, bounded by the total length of the values."""
+    default_max_bytes = 32 * 1024 * 1024
+
+    def __init__(self, max_bytes: int = default_max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            self._entries[key] = value
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -0,0 +1,203 @@
+"""Content-Encoding negotiation and compression of response bodies."""
+import gzip
+import os
+import zlib
+
+from socketpulse.cache import LRUCache
+from socketpulse.types import Request, Response, EncodedResponse, FileBody, StreamBody, HTTPStatusCode, HTTPMethod
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Parses an Accept-Encoding header into {coding: qvalue}, e.g. "gzip;q=0.8, br" -> {"gzip": 0.8, "br": 1.0}."""
+    codings = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class Compressor:
+    """Compresses response bodies with the best encoding the client accepts.
+
+    Only bodies of compressible content types and at least min_size bytes are compressed. Files streamed from disk
+    are served from a precompressed sibling (e.g. app.js.gz next to app.js) when one is at least as new as the file,
+    and otherwise only compressed if they are at most max_size bytes. Compressed bodies of responses with an ETag are
+    kept in an LRU cache keyed by ETag, so repeated requests for the same file or resource aren't compressed again.
+    """
+    encodings = {
+        "gzip": lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+        "deflate": lambda data, level: zlib.compress(data, level),
+    }
+    stream_wbits = {"gzip": 31, "deflate": 15}
+    precompressed_suffixes = {"gzip": ".gz"}
+    default_min_size = 1024
+    default_max_size = 8 * 1024 * 1024
+    default_level = 6
+    default_cache_size = LRUCache.default_max_bytes
+    default_content_types = (
+        "text/",
+        "application/json",
+        "application/javascript",
+        "application/xml",
+        "application/x-yaml",
+        "application/toml",
+        "image/svg+xml",
+        "model/gltf+json",
+        "model/obj",
+    )
+
+    def __init__(self,
+                 min_size: int = default_min_size,
+                 max_size: int = default_max_size,
+                 level: int = default_level,
+                 content_types: tuple[str, ...] = default_content_types,
+                 cache_size: int = default_cache_size):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.level = level
+        self.content_types = tuple(content_types)
+        self.cache = LRUCache(cache_size) if cache_size else None
+
+    def is_compressible(self, content_type: str | None) -> bool:
+        if not content_type:
+            return False
+        content_type = content_type.split(";")[0].strip().lower()
+        return any(content_type.startswith(t) if t.endswith("/") else content_type == t for t in self.content_types)
+
+    def negotiate(self, accept_encoding: str | None) -> str | None:
+        """The supported encoding the client prefers (gzip on ties), or None to send the body as is."""
+        if not accept_encoding:
+            return None
+        codings = parse_accept_encoding(accept_encoding)
+        wildcard = codings.get("*", 0.0)
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = codings.get(encoding, wildcard)
+            if q > best_q:
+                best, best_q = encoding, q
+        if best is not None and codings.get("identity", 0.0) > best_q:
+            return None
+        return best
+
+    def compress(self, response: Response, request: Request) -> Response:
+        """Compresses the response body in place if the request accepts a supported encoding. EncodedResponses are
+        shared between requests, so they are always sent as they are."""
+        status = response.status_code
+        if (isinstance(response, EncodedResponse) or status.is_informational() or status in (HTTPStatusCode.NO_CONTENT, HTTPStatusCode.PARTIAL_CONTENT,
+                                                    HTTPStatusCode.NOT_MODIFIED)
+                or "Content-Encoding" in response.headers
+                or not self.is_compressible(response.headers.get("Content-Type"))):
+            return response
+        body = response.body
+        if isinstance(body, StreamBody):
+            if body.is_async() or "Content-Length" in response.headers or (body.length or self.min_size) < self.min_size:
+                return response
+        elif not isinstance(body, (bytes, FileBody)) or len(body) < self.min_size:
+            return response
+
+        vary = response.headers.get("Vary")
+        if not vary:
+            response.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower() and vary.strip() != "*":
+            response.headers["Vary"] = f"{vary}, Accept-Encoding"
+
+        encoding = self.negotiate(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+        if request.method == HTTPMethod.HEAD:
+            return self.compress_head(response, encoding)
+
+        if isinstance(body, StreamBody):
+            response.body = StreamBody(self.compress_stream(body, encoding))
+            self.set_encoding(response, encoding)
+            return response
+
+        compressed = self.precompressed(body, encoding) if isinstance(body, FileBody) else None
+        if compressed is None:
+            etag = response.headers.get("ETag")
+            key = (etag, encoding)
+            if etag and self.cache is not None:
+                compressed = self.cache.get(key)
+            if compressed is None:
+                if len(body) > self.max_size:
+                    return response
+                compressed = self.encodings[encoding](bytes(body), self.level)
+                if etag and self.cache is not None:
+                    self.cache.put(key, compressed)
+
+        response.body = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        self.set_encoding(response, encoding)
+        return response
+
+    def compress_head(self, response: Response, encoding: str) -> Response:
+        """Sets the headers a GET for the response would get, without compressing a body that is never sent.
+        Content-Length is only kept if the compressed length is known without compressing (a precompressed file or
+        a cached body): otherwise it is left out, which HEAD responses are allowed to do."""
+        body = response.body
+        length = None
+        if isinstance(body, StreamBody):
+            pass
+        elif isinstance(body, FileBody) and (precompressed := self.precompressed(body, encoding)) is not None:
+            length = precompressed.length
+        else:
+            etag = response.headers.get("ETag")
+            cached = self.cache.get((etag, encoding)) if etag and self.cache is not None else None
+            if cached is not None:
+                length = len(cached)
+            elif len(body) > self.max_size:
+                # a GET would get it as it is
+                return response
+        if length is None:
+            if isinstance(body, StreamBody):
+                body.close()
+            response.headers.pop("Content-Length", None)
+            # a body of unknown length, which HEAD responses leave the framing headers out for
+            response.body = StreamBody(iter(()))
+        else:
+            response.headers["Content-Length"] = str(length)
+        self.set_encoding(response, encoding)
+        return response
+
+    @staticmethod
+    def set_encoding(response: Response, encoding: str) -> None:
+        response.headers["Content-Encoding"] = encoding
+        etag = response.headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            # the compressed bytes differ from the identity representation, so the ETag can only be weak
+            response.headers["ETag"] = "W/" + etag
+
+    def compress_stream(self, body: StreamBody, encoding: str):
+        """Compresses a streamed body chunk by chunk, flushing after each one so nothing is held back."""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.stream_wbits[encoding])
+        for chunk in body.chunks():
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    def precompressed(self, body: FileBody, encoding: str) -> FileBody | None:
+        """A FileBody of the file's precompressed sibling for this encoding, if it exists and isn't stale."""
+        suffix = self.precompressed_suffixes.get(encoding)
+        if suffix is None or body.offset:
+            return None
+        try:
+            original = os.stat(body.path)
+            st = os.stat(body.path.with_name(body.path.name + suffix))
+        except OSError:
+            return None
+        if body.length != original.st_size or st.st_mtime_ns < original.st_mtime_ns:
+            return None
+        return FileBody(body.path.with_name(body.path.name + suffix), length=st.st_size)
+
+    def __repr__(self):
+        return f"Compressor(min_size={self.min_size}, max_size={self.max_size}, level={self.level})"
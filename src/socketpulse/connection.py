@@ -1,71 +1,511 @@
+import asyncio
+import inspect
+import itertools
+import os
 import socket
 import logging
+import time
+from collections import deque
+from contextlib import suppress
+from functools import partial
+from tempfile import SpooledTemporaryFile
 
-from socketpulse.types import Request, Response
+from socketpulse.buffers import BufferPool, RecvBuffer
+from socketpulse.compression import Compressor
+from socketpulse.dispatch import Overloaded, Priority, WorkQueue
+from socketpulse.limits import AdaptiveLimiter, RateLimiter, RateLimited
+from socketpulse.tags import gettag
+from socketpulse.types import Request, Response, EncodedResponse, HTTPVersion, HTTPMethod, HTTPStatusCode, \
+    FileBody, MultipartBody, StreamBody, RequestStream, PayloadTooLarge, HeadersTooLarge, http_date
 
 logger = logging.getLogger("socketpulse")
 
+# tells the kernel more data follows, so a short head is sent in the same packet as the start of the body
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+# the most buffers passed to one sendmsg call (the usual IOV_MAX)
+IOV_MAX = 1024
+
+
+class BodyDecoder:
+    """Incrementally decodes a request body framed by Content-Length or by chunked transfer encoding.
+
+    Bytes received from the client are fed in as they arrive; feed returns the body bytes they contained and, once
+    the body is complete, the bytes past its end (the start of a pipelined request).
+    """
+    __slots__ = ("chunked", "max_size", "received", "remaining", "state", "_line")
+    SIZE, DATA, DATA_END, TRAILER, DONE = range(5)
+    max_line = 8192
+
+    def __init__(self, length: int = 0, chunked: bool = False, max_size: int | None = None):
+        self.chunked = chunked
+        self.max_size = max_size
+        self.received = 0
+        self._line = b''
+        if chunked:
+            self.state = self.SIZE
+            self.remaining = 0
+        else:
+            if max_size is not None and length > max_size:
+                raise PayloadTooLarge(f"Request body of {length} bytes is larger than {max_size} bytes")
+            self.state = self.DATA if length else self.DONE
+            self.remaining = length
+
+    @property
+    def done(self) -> bool:
+        return self.state == self.DONE
+
+    def needs_line(self) -> bool:
+        """Whether the decoder is waiting for a chunk size or trailer line (rather than a known number of bytes)."""
+        return self.state in (self.SIZE, self.TRAILER)
+
+    def feed(self, data: bytes) -> tuple[bytes, bytes]:
+        """Returns (body bytes, bytes past the end of the body) contained in data."""
+        out = []
+        pos, n = 0, len(data)
+        while pos < n and self.state != self.DONE:
+            if self.state in (self.DATA, self.DATA_END):
+                take = min(self.remaining, n - pos)
+                if self.state == self.DATA:
+                    out.append(data[pos:pos + take])
+                self.remaining -= take
+                pos += take
+                if not self.remaining:
+                    if self.state == self.DATA and self.chunked:
+                        self.state, self.remaining = self.DATA_END, 2
+                    else:
+                        self.state = self.SIZE if self.chunked else self.DONE
+                continue
+            i = data.find(b'\n', pos)
+            if i == -1:
+                self._line += data[pos:]
+                pos = n
+                if len(self._line) > self.max_line:
+                    raise ValueError("Chunked request body line too long")
+                break
+            line, self._line = (self._line + data[pos:i]).rstrip(b'\r'), b''
+            pos = i + 1
+            if self.state == self.TRAILER:
+                if not line:
+                    self.state = self.DONE
+                continue
+            size = int(line.split(b';', 1)[0].strip(), 16)
+            if not size:
+                self.state = self.TRAILER
+            elif self.max_size is not None and self.received + sum(map(len, out)) + size > self.max_size:
+                raise PayloadTooLarge(f"Request body is larger than {self.max_size} bytes")
+            else:
+                self.state, self.remaining = self.DATA, size
+        body = b''.join(out)
+        self.received += len(body)
+        return body, (data[pos:] if self.state == self.DONE else b'')
+
 
 class Connection:
+    __slots__ = ("socket", "client_addr", "chunk_size", "cleanup_event", "handler", "keep_alive_timeout",
+                 "max_keep_alive_requests", "compressor", "max_body_size", "spool_threshold", "max_header_size",
+                 "max_headers", "buffer_pool", "limiter", "classify", "rate_limiter", "num_requests", "_buffer",
+                 "_linger")
     default_chunk_size: int = 1024
+    default_keep_alive_timeout: float = 5.0
+    default_max_keep_alive_requests: int = 100
+    default_max_body_size: int | None = None
+    default_spool_threshold: int = 1024 * 1024
+    default_max_header_size: int = 16 * 1024
+    default_max_headers: int = 100
+    end_of_header: bytes = b'\r\n\r\n'
+    continue_response: bytes = b'HTTP/1.1 100 Continue\r\n\r\n'
+    linger_timeout: float = 2.0
 
     def __init__(self,
                  handler,
                  connection_socket: socket.socket,
                  client_address: tuple,
                  cleanup_event,
-                 chunk_size: int = default_chunk_size):
+                 chunk_size: int = default_chunk_size,
+                 keep_alive_timeout: float | None = default_keep_alive_timeout,
+                 max_keep_alive_requests: int | None = default_max_keep_alive_requests,
+                 compressor: Compressor | None = None,
+                 max_body_size: int | None = default_max_body_size,
+                 spool_threshold: int = default_spool_threshold,
+                 max_header_size: int = default_max_header_size,
+                 max_headers: int = default_max_headers,
+                 buffer_pool: BufferPool | None = None,
+                 limiter: AdaptiveLimiter | None = None,
+                 classify=None,
+                 rate_limiter: RateLimiter | None = None):
         self.socket = connection_socket
         self.client_addr = client_address
         self.chunk_size = chunk_size
         self.cleanup_event = cleanup_event
         self.handler = handler
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.compressor = compressor
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.buffer_pool = buffer_pool if buffer_pool is not None else BufferPool()
+        self.limiter = limiter
+        self.classify = classify
+        self.rate_limiter = rate_limiter
 
-        self._rep = None
+        self.num_requests = 0
+        self._buffer = RecvBuffer(self.buffer_pool)
+        self._linger = False
 
     def handle(self):
-        request = self.receive_request(self.socket)
-        if self.check_cleanup():
-            return request, None, False
-        response = self.handler(request)
-        if self.check_cleanup():
-            return request, response, False
-        self.send_response(self.socket, response)
+        """Serves requests on the socket until the client or the server decides to close the connection."""
+        request, response = None, None
+        if self.keep_alive_timeout:
+            self.socket.settimeout(self.keep_alive_timeout)
+        try:
+            while True:
+                try:
+                    request = self.receive_request(self.socket)
+                except (ValueError, RateLimited) as e:
+                    logger.debug("%s sent an invalid request: %r", self, e)
+                    self._linger = True
+                    self.send_response(self.socket, self.error_response(e))
+                    break
+                if request is None:
+                    break
+                if self.check_cleanup():
+                    return request, None, False
+                self.num_requests += 1
+                keep_alive = self.keep_alive(request)
+                response = self.reject(request)
+                if response is not None:
+                    keep_alive = False
+                    self._linger = True
+                else:
+                    response = self.handle_request(request)
+                    finished = self.finish_request(request)
+                    self._linger = not finished
+                    keep_alive = keep_alive and finished and self.is_delimited(response, request)
+                if self.check_cleanup():
+                    return request, response, False
+                self.send_response(self.socket, response, request=request, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (socket.timeout, ConnectionError) as e:
+            logger.debug("%s closed: %r", self, e)
+        finally:
+            self.close()
         return request, response, True
 
-    def receive_request(self, connection_socket: socket.socket, chunk_size: int = None) -> Request:
+    def priority(self, request: Request, handler=None) -> int:
+        """The priority class the request is dispatched with: what classify returns for it, unless that is None,
+        else the `priority` tag of its handler (found through the RouteHandler if not given), else Priority.NORMAL."""
+        try:
+            if self.classify is not None and (priority := self.classify(request)) is not None:
+                return priority
+            if handler is None:
+                priority_of = getattr(self.handler, "priority_of", None)
+                if priority_of is not None:
+                    return priority_of(request)
+                handler = self.handler
+            return gettag(handler, "priority", Priority.NORMAL)
+        except Exception as e:
+            # called on the serving loop, which a broken classifier must not take down
+            logger.exception(e)
+            return Priority.NORMAL
+
+    def handle_request(self, request: Request) -> Response:
+        """Calls the handler. Async handlers are run to completion on a fresh event loop.
+        With a limiter, requests over its concurrency limit get a 503 without calling the handler."""
+        if self.limiter is not None:
+            if not self.limiter.acquire():
+                return self.error_response(self.limiter.overloaded(), request)
+            start = time.monotonic()
+        try:
+            response = self.handler(request)
+            if inspect.isawaitable(response):
+                response = asyncio.run(response)
+        finally:
+            if self.limiter is not None:
+                self.limiter.release(time.monotonic() - start)
+        return self.compress(response, request)
+
+    def compress(self, response: Response, request: Request) -> Response:
+        if self.compressor is None:
+            return response
+        return self.compressor.compress(response, request)
+
+    def keep_alive(self, request: Request) -> bool:
+        """Whether the connection should stay open after responding to the request."""
+        if not self.keep_alive_timeout:
+            return False
+        if self.max_keep_alive_requests and self.num_requests >= self.max_keep_alive_requests:
+            return False
+        connection_header = request.headers.get("Connection", "").lower()
+        if "close" in connection_header:
+            return False
+        if request.version == HTTPVersion.HTTP_1_1:
+            return True
+        return "keep-alive" in connection_header
+
+    def receive_request(self, connection_socket: socket.socket, chunk_size: int = None) -> Request | None:
+        """Reads the next request from the socket.
+
+        Returns None if the client closed the connection (or stayed idle past the keep-alive timeout)
+        before sending a complete request head. Bytes received past the end of the request are kept for the next call.
+        Raises ValueError if the request head is malformed (HeadersTooLarge if it is too large).
+        """
         if chunk_size is None:
             chunk_size = self.chunk_size
 
-        new_line = b'\r\n'
-        end_of_header = 2 * new_line
+        buffer = self._buffer
+        while (i := buffer.find(self.end_of_header)) == -1:
+            if len(buffer) > self.max_header_size:
+                raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+            if self.cleanup_event and self.cleanup_event.is_set():
+                return None
+            try:
+                received = buffer.fill(connection_socket, chunk_size)
+            except socket.timeout:
+                if buffer:
+                    raise
+                return None
+            if not received:
+                return None
 
-        request_data = b''
-        while not self.cleanup_event or not self.cleanup_event.is_set():
-            chunk = connection_socket.recv(chunk_size)
-            request_data += chunk
-            if end_of_header in request_data:
-                break
-            if not chunk:
-                break
+        if i > self.max_header_size:
+            raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+        request = self.parse_request(buffer.take(i))
+        buffer.skip(len(self.end_of_header))
+        length, chunked = self.body_framing(request)
+        if not chunked and len(buffer) >= length:
+            request.body = buffer.take(length)
+        else:
+            # the rest of the body is only received as the handler reads it
+            request.stream = RequestStream(self.receive_body(request, length, chunked),
+                                           length=None if chunked else length)
+        return request
+
+    def parse_request(self, pre_body_bytes: bytes) -> Request:
+        """Parses a request head, headers included. Raises ValueError if it is malformed (or its body framing is
+        invalid), or HeadersTooLarge if it has more than max_headers fields. Raises RateLimited, before parsing
+        anything, if the rate limiter tells clients apart by address and this one is over its limit."""
+        if self.rate_limiter is not None and self.rate_limiter.header is None:
+            if wait := self.rate_limiter.acquire(self.rate_limiter.address_key(self.client_addr)):
+                raise self.rate_limiter.rate_limited(wait)
+        request = Request.from_components(pre_body_bytes, b'', self.client_addr, self.socket)
+        request.parse_headers(self.max_headers)
+        self.body_framing(request)
+        return request
+
+    def receive_body(self, request: Request, length: int, chunked: bool):
+        """Yields the body of the current request as it is received from the (blocking) socket."""
+        decoder = BodyDecoder(length, chunked, self.max_body_size)
+        if self.expects_continue(request):
+            self.socket.sendall(self.continue_response)
+        while True:
+            body, rest = decoder.feed(self._buffer.take())
+            if body:
+                yield body
+            if decoder.done:
+                self._buffer.unread(rest)
+                return
+            if not self._buffer.fill(self.socket, self.chunk_size):
+                raise ConnectionError("Connection closed before the request body was received")
+
+    def over_rate_limit(self) -> RateLimited | None:
+        """RateLimited if the rate limiter tells clients apart by address and this one has no token left (without
+        taking one), so a connection can be turned away before it is dispatched."""
+        if self.rate_limiter is None or self.rate_limiter.header is not None:
+            return None
+        if wait := self.rate_limiter.wait_time(self.rate_limiter.address_key(self.client_addr)):
+            return self.rate_limiter.rate_limited(wait)
+        return None
 
-        # Extract headers
-        pre_body_bytes, body = request_data.split(end_of_header, 1)
+    def reject(self, request: Request) -> Response | None:
+        """The response to send without handling the request: a 429 if the rate limiter tells clients apart by a
+        header and this one is over its limit, or a 413 if its declared body is larger than max_body_size."""
+        if self.rate_limiter is not None and self.rate_limiter.header is not None:
+            if wait := self.rate_limiter.acquire(self.rate_limiter.key(request)):
+                return self.error_response(self.rate_limiter.rate_limited(wait), request)
+        if self.max_body_size is None:
+            return None
+        length, _ = self.body_framing(request)
+        if length <= self.max_body_size:
+            return None
+        return self.error_response(PayloadTooLarge(), request)
 
-        # Parsing Content-Length if present for requests with body
-        if b'Content-Length:' in pre_body_bytes:
-            length = int(pre_body_bytes.split(b'Content-Length: ')[1].split(new_line)[0])
-            while len(body) < length and not self.cleanup_event or not self.cleanup_event.is_set():
-                body += connection_socket.recv(chunk_size)
+    @staticmethod
+    def error_response(e: Exception, request: Request | None = None) -> Response:
+        """The response to a request that can't be handled because it is too large (413, 431), malformed (400),
+        shed by an overloaded server (503, with Retry-After), or from a rate limited client (429, with Retry-After)."""
+        return EncodedResponse.canned(getattr(e, "status_code", HTTPStatusCode.BAD_REQUEST), getattr(e, "retry_after", None))
+
+    def shed(self, e: Overloaded) -> None:
+        """Answers a connection the server won't serve (it is overloaded, or the client is rate limited) with a 503
+        (429) and closes it, without reading its request or waiting for the client."""
+        with suppress(OSError):
+            self.socket.setblocking(False)
+            # discard what the client already sent, so closing doesn't reset the connection before it reads the 503
+            with suppress(BlockingIOError, InterruptedError):
+                while self.socket.recv(RequestStream.chunk_size):
+                    pass
+            self.socket.send(self.error_response(e).encoded())
+        self.close()
+
+    def finish_request(self, request: Request) -> bool:
+        """Discards what the handler left unread of a streamed request body, so the next request can be read.
+        Returns False if the connection can't be reused (too much left unread, or the body was invalid)."""
+        if request._stream is None:
+            return True
+        try:
+            return request.stream.drain(self.spool_threshold)
+        except (PayloadTooLarge, ValueError, ConnectionError, socket.timeout):
+            return False
+
+    @staticmethod
+    def body_framing(request: Request) -> tuple[int, bool]:
+        """(Content-Length, whether the body uses chunked transfer encoding) of the request.
+        Raises ValueError for an invalid Content-Length."""
+        headers = request.headers
+        transfer_encoding = headers.get("Transfer-Encoding")
+        if transfer_encoding is not None and "chunked" in transfer_encoding.lower():
+            return 0, True
+        content_length = headers.get("Content-Length")
+        if not content_length:
+            return 0, False
+        length = int(content_length)
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length {content_length!r}")
+        return length, False
+
+    @staticmethod
+    def expects_continue(request: Request) -> bool:
+        return request.headers.get("Expect", "").lower() == "100-continue"
+
+    def send_response(self, connection_socket: socket.socket, response: Response, request: Request | None = None, keep_alive: bool = False):
+        """Sends the head and body as separate buffers, without joining them into one bytes object."""
+        head, body = self.encode(response, request, keep_alive)
+        if isinstance(body, (FileBody, MultipartBody, StreamBody)):
+            pending = [head]
+            for part in self.body_parts(body):
+                if isinstance(part, FileBody):
+                    self.send_buffers(connection_socket, pending, more=part.length > 0)
+                    pending = []
+                    part.send(connection_socket)
+                elif isinstance(part, StreamBody):
+                    self.send_buffers(connection_socket, pending)
+                    pending = []
+                    self.send_stream(connection_socket, part)
+                else:
+                    pending.append(part)
+            self.send_buffers(connection_socket, pending)
         else:
-            body = b''
+            self.send_buffers(connection_socket, [head, body])
+        if not keep_alive:
+            if self._linger:
+                self.linger()
+            connection_socket.close()
+
+    def linger(self):
+        """Discards what the client is still sending (for at most linger_timeout seconds) after the response to a
+        request whose body wasn't read. Closing with unread data resets the connection, which can make the client
+        lose the response before it reads it."""
+        with suppress(OSError):
+            self.socket.shutdown(socket.SHUT_WR)
+            deadline = time.monotonic() + self.linger_timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                self.socket.settimeout(remaining)
+                if not self.socket.recv(RequestStream.chunk_size):
+                    break
+
+    @classmethod
+    def send_buffers(cls, connection_socket: socket.socket, buffers: list, more: bool = False) -> None:
+        """Sends the buffers in order with as few sendmsg (writev) calls as possible, picking up where a partial
+        write stopped. With more=True the kernel is told that more data follows (MSG_MORE)."""
+        views = deque(memoryview(b) for b in buffers if len(b))
+        while views:
+            cls.send_some(connection_socket, views, MSG_MORE if more else 0)
+
+    @staticmethod
+    def send_some(connection_socket: socket.socket, views: deque, flags: int = 0) -> int:
+        """One sendmsg call for the queued buffers (or send of the first one, where there is no sendmsg).
+        Removes what was sent from views and returns its length."""
+        if hasattr(connection_socket, "sendmsg"):
+            sent = connection_socket.sendmsg(list(itertools.islice(views, IOV_MAX)), (), flags)
+        else:
+            sent = connection_socket.send(views[0])
+        n = sent
+        while n:
+            view = views[0]
+            if n < len(view):
+                views[0] = view[n:]
+                break
+            n -= len(view)
+            views.popleft()
+        return sent
 
-        r = Request.from_components(pre_body_bytes, body, self.client_addr, self.socket)
-        return r
+    @staticmethod
+    def send_stream(connection_socket: socket.socket, body: StreamBody):
+        """Sends each chunk of the body as soon as it is produced."""
+        try:
+            for data in body.framed():
+                connection_socket.sendall(data)
+        except (socket.timeout, ConnectionError):
+            raise
+        except Exception as e:
+            # the head is already sent, so all we can do is cut the response short
+            logger.exception(e)
+            raise ConnectionAbortedError("Response stream failed") from e
 
-    def send_response(self, connection_socket: socket.socket, response: Response):
-        connection_socket.send(bytes(response))
-        connection_socket.close()
+    def encode_response(self, response: Response, request: Request | None = None, keep_alive: bool = False) -> bytes:
+        """Adds the framing headers (Content-Length, Connection) to the response and serializes it."""
+        head, body = self.encode(response, request, keep_alive)
+        return head + bytes(body)
+
+    @staticmethod
+    def body_parts(body) -> list:
+        """The bytes and FileBody parts a response body is sent as, in order."""
+        if isinstance(body, MultipartBody):
+            return body.parts
+        return [body]
+
+    def encode(self, response: Response, request: Request | None = None, keep_alive: bool = False) -> tuple[bytes, object]:
+        """The serialized head and the body to send after it. An EncodedResponse comes back whole, as the head."""
+        if isinstance(response, EncodedResponse):
+            return response.encoded(request, keep_alive), b""
+        head = self.encode_head(response, request, keep_alive)
+        return head, response.body
+
+    def encode_head(self, response: Response, request: Request | None = None, keep_alive: bool = False) -> bytes:
+        """Adds the framing headers (Content-Length or Transfer-Encoding, Connection) to the response and
+        serializes everything but the body."""
+        body = response.body
+        if response.status_code.is_informational() or response.status_code in (204, 304):
+            pass
+        elif isinstance(body, StreamBody) and body.length is None and "Content-Length" not in response.headers:
+            if request is not None and request.method == HTTPMethod.HEAD:
+                # the length is unknown without producing the body, so HEAD responses leave the framing out
+                pass
+            elif request is None or request.version != HTTPVersion.HTTP_1_0:
+                response.headers["Transfer-Encoding"] = "chunked"
+                body.chunked = True
+        elif "Content-Length" not in response.headers:
+            response.headers["Content-Length"] = str(len(body))
+        if request is not None and request.method == HTTPMethod.HEAD:
+            # HEAD responses keep their headers (including Content-Length) but never carry a body
+            if isinstance(body, StreamBody):
+                body.close()
+            response.body = b""
+        response.headers["Connection"] = "keep-alive" if keep_alive else "close"
+        if "Date" not in response.headers:
+            response.headers["Date"] = http_date()
+        return response.pre_body_bytes()
+
+    @staticmethod
+    def is_delimited(response: Response, request: Request) -> bool:
+        """Whether the client can tell where the response body ends without the connection being closed.
+        Only streamed bodies of unknown length sent to HTTP/1.0 clients (which don't support chunked) can't be."""
+        body = response.body
+        return not (isinstance(body, StreamBody) and body.length is None and request.version == HTTPVersion.HTTP_1_0
+                    and "Content-Length" not in response.headers and request.method != HTTPMethod.HEAD)
 
     def check_cleanup(self):
         if self.cleanup_event and self.cleanup_event.is_set():
@@ -74,13 +514,497 @@ class Connection:
         return False
 
     def close(self):
+        self._buffer.release()
         self.socket.close()
 
     def __repr__(self):
-        if self._rep is None:
-            r = ""
-            if self.chunk_size != self.default_chunk_size:
-                r += f", chunk_size={self.chunk_size}"
+        # only built when actually logged: the debug messages pass the connection as a lazy %s argument
+        r = ""
+        if self.chunk_size != self.default_chunk_size:
+            r += f", chunk_size={self.chunk_size}"
+        if self.keep_alive_timeout != self.default_keep_alive_timeout:
+            r += f", keep_alive_timeout={self.keep_alive_timeout}"
+        if self.max_keep_alive_requests != self.default_max_keep_alive_requests:
+            r += f", max_keep_alive_requests={self.max_keep_alive_requests}"
+        if self.compressor is not None:
+            r += f", compressor={self.compressor}"
+        if self.max_body_size != self.default_max_body_size:
+            r += f", max_body_size={self.max_body_size}"
+        if self.spool_threshold != self.default_spool_threshold:
+            r += f", spool_threshold={self.spool_threshold}"
+        if self.max_header_size != self.default_max_header_size:
+            r += f", max_header_size={self.max_header_size}"
+        if self.max_headers != self.default_max_headers:
+            r += f", max_headers={self.max_headers}"
+        if self.limiter is not None:
+            r += f", limiter={self.limiter}"
+        if self.classify is not None:
+            r += f", classify={self.classify}"
+        if self.rate_limiter is not None:
+            r += f", rate_limiter={self.rate_limiter}"
+
+        return f'<{self.__class__.__name__}({self.socket}, {self.client_addr}, {self.cleanup_event}{r})>'
+
+
+class SelectorConnection(Connection):
+    """A non-blocking Connection driven by a selector event loop.
+
+    The connection is a small state machine: it buffers bytes while READING until a complete request is framed
+    (RECEIVING large or chunked bodies into a temporary file spooled to disk past spool_threshold),
+    stays HANDLING while the request is being handled, then drains the encoded response while WRITING
+    before going back to READING (keep-alive) or closing.
+
+    The chunks of streamed bodies are produced by calling produce(connection, chunks), which must arrange for
+    produced(future) to be called on the event loop once the next chunk is ready, so that slow generators don't
+    block the loop. Without produce, they are produced on the loop.
+    """
+    READING = "reading"
+    RECEIVING = "receiving"
+    HANDLING = "handling"
+    WRITING = "writing"
+    LINGERING = "lingering"
+    CLOSED = "closed"
+    __slots__ = ("state", "last_active", "_keep_alive", "_request", "_pending", "_decoder", "_spool", "_out", "_parts",
+                 "_file", "_file_offset", "_file_remaining", "_chunks", "_linger_deadline", "produce", "producing")
+
+    def __init__(self, *args, produce=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket.setblocking(False)
+        self.state = self.READING
+        self.last_active = time.monotonic()
+        self._keep_alive = False
+        self._request = None
+        self._pending = None
+        self._decoder = None
+        self._spool = None
+        self._out = deque()
+        self._parts = deque()
+        self._file = None
+        self._file_offset = 0
+        self._file_remaining = 0
+        self._chunks = None
+        self._linger_deadline = 0.0
+        self.produce = produce
+        self.producing = False
+
+    def read(self) -> Request | Response | None:
+        """Reads whatever is available on the socket. Returns a Request once a complete one has been received
+        (or the Response to send without handling it, if it was rejected)."""
+        try:
+            received = self._buffer.fill(self.socket, self.chunk_size)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except ConnectionError:
+            self.close()
+            return None
+        if not received:
+            self.close()
+            return None
+        if self.state == self.LINGERING:
+            self._buffer.skip(received)
+            return None
+        self.last_active = time.monotonic()
+        if self.state == self.RECEIVING:
+            return self.receive_body()
+        return self.next_request()
+
+    def next_request(self) -> Request | Response | None:
+        """Returns the next buffered request, if a complete one has been received (or the Response to send without
+        handling it, if it was rejected)."""
+        if self.state != self.READING:
+            return None
+        try:
+            if self._pending is None:
+                i = self._buffer.find(self.end_of_header)
+                if i == -1:
+                    if len(self._buffer) > self.max_header_size:
+                        raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+                    return None
+                if i > self.max_header_size:
+                    raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+                self._pending = self.parse_request(self._buffer.take(i))
+                self._buffer.skip(len(self.end_of_header))
+            request = self._pending
+            length, chunked = self.body_framing(request)
+        except (ValueError, RateLimited) as e:
+            logger.debug("%s sent an invalid request: %r", self, e)
+            self.state = self.HANDLING
+            self._keep_alive, self._linger = False, True
+            return self.error_response(e)
+        if (not chunked and length <= self.spool_threshold and len(self._buffer) < length
+                and not self.expects_continue(request)):
+            # small bodies are buffered until they are complete
+            self._buffer.reserve(length - len(self._buffer))
+            return None
+        self._pending = None
+        self.num_requests += 1
+        self._keep_alive = self.keep_alive(request)
+        self._request = request
+        self.state = self.HANDLING
+
+        rejection = self.reject(request)
+        if rejection is not None:
+            self._keep_alive, self._linger = False, True
+            return rejection
+        if not chunked and len(self._buffer) >= length:
+            request.body = self._buffer.take(length)
+            return request
+
+        self._decoder = BodyDecoder(length, chunked, self.max_body_size)
+        self._spool = SpooledTemporaryFile(max_size=self.spool_threshold)
+        if self.expects_continue(request):
+            with suppress(BlockingIOError, InterruptedError, ConnectionError):
+                self.socket.send(self.continue_response)
+        self.state = self.RECEIVING
+        return self.receive_body()
+
+    def receive_body(self) -> Request | Response | None:
+        """Spools the buffered body bytes. Returns the request once its body is complete."""
+        try:
+            body, rest = self._decoder.feed(self._buffer.take())
+        except (PayloadTooLarge, ValueError) as e:
+            self.close_spool()
+            self.state = self.HANDLING
+            self._keep_alive, self._linger = False, True
+            return self.error_response(e, self._request)
+        self._spool.write(body)
+        if not self._decoder.done:
+            return None
+        self._buffer.unread(rest)
+        self._spool.seek(0)
+        self._request.stream = RequestStream.from_file(self._spool, self._decoder.received)
+        self._decoder, self._spool = None, None
+        self.state = self.HANDLING
+        return self._request
+
+    def close_spool(self):
+        if self._spool is not None:
+            self._spool.close()
+        self._decoder, self._spool = None, None
+
+    def set_response(self, response: Response):
+        """Queues the response to the current request for writing."""
+        self._keep_alive = self._keep_alive and self.is_delimited(response, self._request)
+        head, body = self.encode(response, self._request, self._keep_alive)
+        self._out.append(memoryview(head))
+        if isinstance(body, (FileBody, MultipartBody, StreamBody)):
+            self._parts.extend(self.body_parts(body))
+            self.gather_parts()
+        elif body:
+            self._out.append(memoryview(body))
+        self._request = None
+        self.state = self.WRITING
+
+    def next_part(self) -> bool:
+        """Starts writing the next queued body part. Returns False when there are none left."""
+        self.close_file()
+        if not self._parts:
+            return False
+        part = self._parts.popleft()
+        if isinstance(part, StreamBody):
+            self._chunks = part.framed()
+        elif not isinstance(part, FileBody):
+            self._out.append(memoryview(part))
+            self.gather_parts()
+        elif hasattr(os, "sendfile"):
+            self._file = part.open()
+            self._file_offset = part.offset
+            self._file_remaining = part.length
+        else:
+            self._chunks = part.chunks()
+        return True
+
+    def gather_parts(self):
+        """Moves the bytes parts at the front of the queue to the output buffers, so they go out in one sendmsg."""
+        while self._parts and not isinstance(self._parts[0], (FileBody, StreamBody)):
+            part = self._parts.popleft()
+            if len(part):
+                self._out.append(memoryview(part))
+
+    def write(self) -> bool:
+        """Writes as much of the pending response as the socket accepts. Returns True once it is fully written."""
+        try:
+            while True:
+                if self._out:
+                    # hold a short head (or part header) back to share a packet with the file region sent next
+                    more = (self._parts and isinstance(self._parts[0], FileBody) and self._parts[0].length > 0
+                            and hasattr(os, "sendfile"))
+                    self.send_some(self.socket, self._out, MSG_MORE if more else 0)
+                    self.last_active = time.monotonic()
+                    if self._out:
+                        return False
+                elif self._file is not None and self._file_remaining > 0:
+                    n = os.sendfile(self.socket.fileno(), self._file.fileno(), self._file_offset, self._file_remaining)
+                    self._file_offset += n
+                    # 0 means the file ended early (it shrank since the response was built)
+                    self._file_remaining = self._file_remaining - n if n else 0
+                    self.last_active = time.monotonic()
+                elif self._chunks is not None and self.produce is not None:
+                    # write resumes from produced once the next chunk is ready
+                    self.producing = True
+                    self.produce(self, self._chunks)
+                    return False
+                elif self._chunks is not None and (chunk := next(self._chunks, b'')):
+                    self._out.append(memoryview(chunk))
+                elif not self.next_part():
+                    break
+        except (BlockingIOError, InterruptedError):
+            return False
+        except ConnectionError:
+            self.close()
+            return True
+        except Exception as e:
+            # a streamed body failed after the head was sent, so all we can do is cut the response short
+            logger.exception(e)
+            self.close()
+            return True
+        self.close_file()
+        if self._keep_alive:
+            self.state = self.READING
+        elif self._linger:
+            self.start_linger()
+        else:
+            self.close()
+        return True
+
+    def produced(self, future) -> None:
+        """Takes the chunk that produce made ready (an empty one at the end of the stream)."""
+        self.producing = False
+        if self.state == self.CLOSED:
+            return
+        try:
+            chunk = future.result()
+        except Exception as e:
+            # a streamed body failed after the head was sent, so all we can do is cut the response short
+            logger.exception(e)
+            self.close()
+            return
+        if chunk:
+            self._out.append(memoryview(chunk))
+        else:
+            self.close_file()
+
+    def start_linger(self):
+        """Like Connection.linger, but without blocking: the event loop keeps reading (and discarding) what the
+        client sends until it closes or linger_timeout passes."""
+        try:
+            self.socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            self.close()
+            return
+        self.state = self.LINGERING
+        self._linger_deadline = time.monotonic() + self.linger_timeout
 
-            self._rep = f'<{self.__class__.__name__}({self.socket}, {self.client_addr}, {self.cleanup_event}{r})>'
-        return self._rep
+    def is_idle(self, now: float) -> bool:
+        """Whether the connection has been waiting on its client for longer than the keep-alive timeout
+        (or is done lingering)."""
+        if self.state == self.LINGERING:
+            return now > self._linger_deadline
+        if not self.keep_alive_timeout:
+            return False
+        return self.state in (self.READING, self.RECEIVING) and now - self.last_active > self.keep_alive_timeout
+
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._file_remaining = 0
+        self._chunks = None
+
+    def close(self):
+        self.state = self.CLOSED
+        self.close_file()
+        self.close_spool()
+        self._out.clear()
+        self._parts.clear()
+        super().close()
+
+
+class AsyncConnection(Connection):
+    """A Connection served by an asyncio event loop through a StreamReader/StreamWriter pair.
+
+    Async handlers are awaited on the loop; sync handlers run in the executor so they never block it.
+    """
+    __slots__ = ("reader", "writer", "executor")
+
+    def __init__(self,
+                 handler,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 cleanup_event,
+                 executor=None,
+                 **kwargs):
+        super().__init__(handler, writer.get_extra_info("socket"), writer.get_extra_info("peername"), cleanup_event, **kwargs)
+        self.reader = reader
+        self.writer = writer
+        self.executor = executor
+
+    async def handle(self):
+        request, response = None, None
+        try:
+            while not (self.cleanup_event and self.cleanup_event.is_set()):
+                try:
+                    request = await self.receive_request_async()
+                except (ValueError, RateLimited) as e:
+                    logger.debug("%s sent an invalid request: %r", self, e)
+                    request, response = None, self.error_response(e)
+                else:
+                    if request is None:
+                        break
+                    self.num_requests += 1
+                    response = self.reject(request) or await self.receive_body_async(request)
+                if response is not None:
+                    keep_alive = False
+                    self._linger = True
+                else:
+                    keep_alive = self.keep_alive(request)
+                    response = self.compress(await self.handle_request_async(request), request)
+                    keep_alive = keep_alive and self.is_delimited(response, request)
+                head, body = self.encode(response, request, keep_alive)
+                self.writer.write(head)
+                for part in self.body_parts(body):
+                    if isinstance(part, FileBody):
+                        await self.writer.drain()
+                        with part.open() as f:
+                            await asyncio.get_running_loop().sendfile(self.writer.transport, f, part.offset, part.length)
+                    elif isinstance(part, StreamBody):
+                        await self.send_stream_async(part)
+                    else:
+                        self.writer.write(part)
+                await self.writer.drain()
+                if not keep_alive:
+                    if self._linger:
+                        await self.linger_async()
+                    break
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.debug("%s closed: %r", self, e)
+        finally:
+            self.close()
+        return request, response, True
+
+    async def linger_async(self):
+        """Connection.linger for the stream reader."""
+        with suppress(OSError, asyncio.TimeoutError):
+            self.writer.write_eof()
+            deadline = time.monotonic() + self.linger_timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                if not await asyncio.wait_for(self.reader.read(RequestStream.chunk_size), remaining):
+                    break
+
+    async def send_stream_async(self, body: StreamBody):
+        """Writes each chunk of the body as soon as it is produced. Async sources are iterated on the loop,
+        sync ones in the executor so a slow generator never blocks it."""
+        try:
+            if body.is_async():
+                async for chunk in body.source:
+                    chunk = body.encode(chunk)
+                    if chunk:
+                        self.writer.write(body.frame(chunk))
+                        await self.writer.drain()
+                if body.chunked:
+                    self.writer.write(b"0\r\n\r\n")
+            else:
+                loop = asyncio.get_running_loop()
+                chunks = body.framed()
+                while (data := await loop.run_in_executor(self.executor, next, chunks, None)) is not None:
+                    self.writer.write(data)
+                    await self.writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # the head is already sent, so all we can do is cut the response short
+            logger.exception(e)
+            raise ConnectionAbortedError("Response stream failed") from e
+
+    async def receive_request_async(self) -> Request | None:
+        """Reads the head of the next request from the stream, or returns None if the client closed or idled out.
+        The body is received by receive_body_async."""
+        try:
+            pre_body_bytes = await asyncio.wait_for(self.reader.readuntil(self.end_of_header),
+                                                    self.keep_alive_timeout or None)
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+        pre_body_bytes = pre_body_bytes[:-len(self.end_of_header)]
+        if len(pre_body_bytes) > self.max_header_size:
+            raise HeadersTooLarge(f"Request head is larger than {self.max_header_size} bytes")
+        return self.parse_request(pre_body_bytes)
+
+    async def receive_body_async(self, request: Request) -> Response | None:
+        """Receives the request body: small ones into memory, large or chunked ones into a temporary file spooled to
+        disk past spool_threshold. Returns the response to send instead of handling the request if the body is too
+        large or malformed."""
+        length, chunked = self.body_framing(request)
+        if (length or chunked) and self.expects_continue(request):
+            self.writer.write(self.continue_response)
+        if not chunked and length <= self.spool_threshold:
+            if length:
+                request.body = await self.reader.readexactly(length)
+            return None
+
+        spool = SpooledTemporaryFile(max_size=self.spool_threshold)
+        try:
+            decoder = BodyDecoder(length, chunked, self.max_body_size)
+            while not decoder.done:
+                if decoder.needs_line():
+                    data = await self.reader.readuntil(b'\n')
+                else:
+                    data = await self.reader.read(min(decoder.remaining, RequestStream.chunk_size))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', None)
+                body, _ = decoder.feed(data)
+                spool.write(body)
+        except (PayloadTooLarge, ValueError) as e:
+            spool.close()
+            return self.error_response(e, request)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        request.stream = RequestStream.from_file(spool, decoder.received)
+        return None
+
+    async def handle_request_async(self, request: Request) -> Response:
+        try:
+            resolve = getattr(self.handler, "resolve", None)
+            if resolve is not None:
+                if self.handler.can_resolve_on_loop(request):
+                    resolved = resolve(request)
+                else:
+                    # matching the route may touch the filesystem, which would block every connection on the loop
+                    resolved = await asyncio.get_running_loop().run_in_executor(self.executor, resolve, request)
+                if isinstance(resolved, Response):
+                    return resolved
+                handler, route_params = resolved
+                call = partial(handler, request, route_params) if route_params else partial(handler, request)
+            else:
+                handler = self.handler
+                call = partial(handler, request)
+
+            if self.limiter is not None:
+                if not self.limiter.acquire():
+                    return self.error_response(self.limiter.overloaded(), request)
+                start = time.monotonic()
+            try:
+                if gettag(handler, "is_async", False):
+                    return await call()
+                if isinstance(self.executor, WorkQueue):
+                    future = self.executor.submit_with_priority(self.priority(request, handler), call)
+                    response = await asyncio.wrap_future(future)
+                else:
+                    response = await asyncio.get_running_loop().run_in_executor(self.executor, call)
+                if inspect.isawaitable(response):
+                    response = await response
+                return response
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(time.monotonic() - start)
+        except Overloaded as e:
+            return self.error_response(e, request)
+        except Exception as e:
+            logger.exception(e)
+            return EncodedResponse.canned(HTTPStatusCode.INTERNAL_SERVER_ERROR)
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,257 @@
+"""The thread pool that connections and requests are dispatched to, with a bounded queue that sheds work it can't
+serve in time instead of letting latency and memory grow without limit."""
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+
+logger = logging.getLogger("socketpulse")
+
+
+class Overloaded(RuntimeError):
+    """Raised by submit, or set on the future of queued work, when the server sheds work instead of running it.
+    Connections answer it with 503 Service Unavailable and a Retry-After header."""
+    status_code = 503
+
+    def __init__(self, message: str = "Service Unavailable", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Priority:
+    """Priority classes of dispatched work. A WorkQueue serves higher classes first; any int works as a class."""
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+
+class QueueStats:
+    """What a WorkQueue has done so far, and how long work waited in it before a thread started it.
+
+    wait_time is an exponentially weighted moving average (in seconds) of recent waits, max_wait_time the longest
+    wait seen. threads_started and threads_retired count how the pool grew and shrank.
+    """
+    __slots__ = ("submitted", "started", "rejected", "dropped", "expired", "wait_time", "max_wait_time",
+                 "threads_started", "threads_retired")
+    smoothing = 0.1
+
+    def __init__(self):
+        self.submitted = 0
+        self.started = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.expired = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.threads_started = 0
+        self.threads_retired = 0
+
+    def record_wait(self, wait: float) -> None:
+        self.started += 1
+        self.wait_time += (wait - self.wait_time) * self.smoothing
+        if wait > self.max_wait_time:
+            self.max_wait_time = wait
+
+    def __repr__(self):
+        return (f"QueueStats(submitted={self.submitted}, started={self.started}, rejected={self.rejected}, "
+                f"dropped={self.dropped}, expired={self.expired}, wait_time={self.wait_time:.4f}, "
+                f"max_wait_time={self.max_wait_time:.4f}, threads_started={self.threads_started}, "
+                f"threads_retired={self.threads_retired})")
+
+
+class WorkQueue(Executor):
+    """A thread pool whose queue holds at most max_queue items (None for no limit).
+
+    When the queue is full, submit raises Overloaded (overflow="reject"), or sheds the oldest waiting item to make
+    room for the new one (overflow="drop_oldest", which favors the clients least likely to have given up). Items that
+    waited longer than queue_timeout seconds are shed when a thread picks them up instead of being run late. Shed
+    items get Overloaded set on their future, so whoever submitted them can still answer 503.
+
+    The pool is elastic. It starts with no threads. When no thread is idle, it starts another one (up to max_workers)
+    once queued work has waited scale_up_wait seconds, or once more items are queued than there are threads. A thread
+    that stays idle for idle_timeout seconds (None to keep threads forever) retires, down to min_workers threads.
+
+    Work submitted with submit_with_priority is queued per priority class and threads take it from the highest class
+    first. So that lower classes aren't starved under sustained load, work that has waited longer than priority_aging
+    seconds is taken first, oldest first. When the queue is full, new work sheds the oldest work of a lower class
+    before the overflow policy applies, and drop_oldest never sheds work of a higher class than the new work.
+    """
+    overflow_policies = ("reject", "drop_oldest")
+
+    def __init__(self,
+                 max_workers: int,
+                 max_queue: int | None = None,
+                 queue_timeout: float | None = None,
+                 overflow: str = "reject",
+                 retry_after: float = 1.0,
+                 thread_name_prefix: str = "socketpulse",
+                 min_workers: int = 0,
+                 idle_timeout: float | None = None,
+                 scale_up_wait: float = 0.0,
+                 priority_aging: float | None = 1.0):
+        if overflow not in self.overflow_policies:
+            raise ValueError(f"Invalid overflow policy: {overflow}. Options are "
+                             f"{', '.join(map(repr, self.overflow_policies))}.")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.overflow = overflow
+        self.retry_after = retry_after
+        self.thread_name_prefix = thread_name_prefix
+        self.min_workers = min_workers
+        self.idle_timeout = idle_timeout
+        self.scale_up_wait = scale_up_wait
+        self.priority_aging = priority_aging
+        self.stats = QueueStats()
+        self._queues: dict[int, deque[tuple[Future, callable, tuple, dict, float]]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._threads: list[threading.Thread] = []
+        self._thread_ids = itertools.count()
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.submit_with_priority(Priority.NORMAL, fn, *args, **kwargs)
+
+    def submit_with_priority(self, priority: int, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            dropped = None
+            if self.max_queue is not None and self._size >= self.max_queue:
+                lowest = min((p for p, q in self._queues.items() if q), default=None)
+                if lowest is None or lowest > priority or (lowest == priority and self.overflow == "reject"):
+                    self.stats.rejected += 1
+                    raise self.overloaded("dispatch queue is full")
+                dropped = self._queues[lowest].popleft()[0]
+                self._size -= 1
+                self.stats.dropped += 1
+            if priority not in self._queues:
+                self._queues[priority] = deque()
+                # highest class first, so _pop finds it first
+                self._queues = dict(sorted(self._queues.items(), reverse=True))
+            self._queues[priority].append((future, fn, args, kwargs, time.monotonic()))
+            self._size += 1
+            self.stats.submitted += 1
+            self._scale_up()
+            self._not_empty.notify()
+        if dropped is not None:
+            # outside the lock: the future's callbacks run right here
+            dropped.set_exception(self.overloaded("dropped from the dispatch queue to make room"))
+        return future
+
+    def overloaded(self, reason: str) -> Overloaded:
+        logger.debug("Shedding work: %s", reason)
+        return Overloaded(f"Service Unavailable ({reason})", retry_after=self.retry_after)
+
+    def _scale_up(self) -> None:
+        """Starts another thread if queued work needs one. Called with the lock held."""
+        if self._idle or len(self._threads) >= self.max_workers or not self._size:
+            return
+        if (len(self._threads) < self.min_workers or self._size > len(self._threads)
+                or time.monotonic() - min(q[0][4] for q in self._queues.values() if q) >= self.scale_up_wait):
+            self._start_thread()
+
+    def _pop(self) -> tuple[Future, callable, tuple, dict, float]:
+        """Takes the next item: the oldest one that waited past priority_aging, else the first of the highest class.
+        Called with the lock held and the queue not empty."""
+        heads = [q for q in self._queues.values() if q]
+        queue = heads[0]
+        if self.priority_aging is not None and len(heads) > 1:
+            oldest = min(heads, key=lambda q: q[0][4])
+            if time.monotonic() - oldest[0][4] > self.priority_aging:
+                queue = oldest
+        self._size -= 1
+        return queue.popleft()
+
+    def _start_thread(self) -> None:
+        t = threading.Thread(target=self._work, name=f"{self.thread_name_prefix}-{next(self._thread_ids)}",
+                             daemon=True)
+        self._threads.append(t)
+        self.stats.threads_started += 1
+        t.start()
+
+    def _next(self) -> tuple[Future, callable, tuple, dict, float] | None:
+        """Waits for the next item to run (shedding expired ones). Returns None once the pool is shut down, or once
+        this thread has been idle long enough to retire."""
+        while True:
+            with self._lock:
+                while not self._size and not self._shutdown:
+                    self._idle += 1
+                    notified = self._not_empty.wait(self.idle_timeout)
+                    self._idle -= 1
+                    if not notified and not self._size and len(self._threads) > self.min_workers:
+                        self._threads.remove(threading.current_thread())
+                        self.stats.threads_retired += 1
+                        return None
+                if not self._size:
+                    return None
+                item = self._pop()
+                # work still queued behind this item may have waited long enough to need another thread
+                self._scale_up()
+                wait = time.monotonic() - item[4]
+                if self.queue_timeout is None or wait <= self.queue_timeout:
+                    self.stats.record_wait(wait)
+                    return item
+                self.stats.expired += 1
+            # outside the lock: the future's callbacks run right here
+            item[0].set_exception(self.overloaded(f"waited {wait:.3f}s in the dispatch queue"))
+
+    def _work(self) -> None:
+        try:
+            while (item := self._next()) is not None:
+                future, fn, args, kwargs, _ = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                del item, future, fn, args, kwargs
+        finally:
+            with self._lock:
+                if threading.current_thread() in self._threads:
+                    # shut down, or died: then another thread takes over the work still queued
+                    self._threads.remove(threading.current_thread())
+                    self._scale_up()
+
+    @property
+    def queue_size(self) -> int:
+        """The number of items waiting for a thread."""
+        return self._size
+
+    @property
+    def num_threads(self) -> int:
+        """The number of threads in the pool right now."""
+        return len(self._threads)
+
+    @property
+    def idle_threads(self) -> int:
+        """The number of threads waiting for work."""
+        return self._idle
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in self._queues.values():
+                    while queue:
+                        queue.popleft()[0].cancel()
+                self._size = 0
+            self._not_empty.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for t in threads:
+                t.join()
+
+    def __repr__(self):
+        return (f"WorkQueue(max_workers={self.max_workers}, max_queue={self.max_queue}, "
+                f"queue_timeout={self.queue_timeout}, overflow={self.overflow!r}, threads={self.num_threads}, "
+                f"queued={self.queue_size})")
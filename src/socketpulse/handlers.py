@@ -2,15 +2,22 @@ import inspect
 import json
 import builtins
 import logging
+import os
+import stat
 import traceback
 from contextlib import suppress
-from functools import wraps
+from functools import lru_cache, wraps
 from pathlib import Path
 import socket
 
+from socketpulse.cache import FileCache
+from socketpulse.routing import RouteTrie, variadic_route_priority
+from socketpulse.dispatch import Priority
+from socketpulse.limits import Bulkhead, RateLimiter
 from socketpulse.tags import tag, get, gettag
-from socketpulse.types import Request, Response, Query, Body, Route, FullPath, Method, File, ClientAddr, \
-    HTTPStatusCode, ErrorResponse, Headers, ErrorModes, FileResponse, HTMLResponse, url_decode
+from socketpulse.types import Request, Response, EncodedResponse, Query, Body, Route, FullPath, Method, File, ClientAddr, \
+    HTTPStatusCode, ErrorResponse, Headers, ErrorModes, FileResponse, HTMLResponse, RequestStream, MissingParameter, \
+    url_decode
 
 logger = logging.getLogger("socketpulse")
 
@@ -23,16 +30,19 @@ class Autofill:
         return request.connection_socket
 
     def query(self, request: Request) -> Query:
-        return Query(request.path.query_args())
+        return Query(request.query)
 
     def body(self, request: Request) -> Body:
         return request.body
 
+    def stream(self, request: Request) -> RequestStream:
+        return request.stream
+
     def headers(self, request: Request) -> Headers:
         return Headers(request.headers)
 
     def route(self, request: Request) -> Route:
-        return Route(request.path.route())
+        return Route(request.route)
 
     def full_path(self, request: Request) -> FullPath:
         return FullPath(request.path)
@@ -61,6 +71,7 @@ available_types = {
     "request": Request,
     "query": Query,
     "body": Body,
+    "stream": RequestStream,
     "headers": Headers,
     "route": Route,
     "full_path": FullPath,
@@ -88,71 +99,122 @@ def _typehint_matches(typehint, others):
     return typehint in others or tryissubclass(typehint, others) or (hasattr(typehint, "__origin__") and typehint.__origin__ in others) or (hasattr(typehint, "__args__") and any(_typehint_matches(t, others) for t in typehint.__args__))
 
 
-def cast_to_typehint(value: str, typehint = inspect._empty):
+_NOT_CAST = object()
+
+
+def _cast_int(value: str):
+    if value.isdigit() or (value.startswith("-") and value[1:].isdigit()):
+        return int(value)
+    return _NOT_CAST
+
+
+def _cast_float(value: str):
+    v = value[1:] if value.startswith("-") else value
+    if v.replace(".", "", 1).isdigit():
+        return float(value)
+    return _NOT_CAST
+
 
+def _cast_bool(value: str):
+    v = value.lower()
+    if v in ["false", "f", "no", "n"]:
+        return False
+    if v in ["true", "t", "yes", "y"]:
+        return True
+    return _NOT_CAST
+
+
+def _cast_strict_bool(value: str):
+    v = value.lower()
+    if v in ["0"]:
+        return False
+    if v in ["1", "ok"]:
+        return True
+    return _NOT_CAST
+
+
+def _cast_json(start: str, end: str, wrap=None, convert=None):
+    def cast(value: str):
+        if value.startswith(start) and value.endswith(end):
+            try:
+                v = json.loads(wrap(value) if wrap else value)
+                return convert(v) if convert else v
+            except:
+                pass
+        return _NOT_CAST
+    return cast
+
+
+def _as_json_list(value: str) -> str:
+    return '[' + value[1:-1] + ']'
+
+
+def _cast_type(value: str):
+    if hasattr(builtins, value):
+        return getattr(builtins, value)
+    return globals().get(value, value)
+
+
+@lru_cache(maxsize=None)
+def _compile_caster(typehint):
+    steps = []
     # unless specifically typed as a string, cast any numeric value to int or float
     if _typehint_matches(typehint, [int, inspect._empty]):
-        if value.isdigit() or (value.startswith("-") and value[1:].isdigit())  and not '.' in value:
-            return int(value)
+        steps.append(_cast_int)
     if _typehint_matches(typehint, [float, inspect._empty]):
-        if value.isdigit() or (value.startswith("-") and value[1:].isdigit()):
-            return float(value)
+        steps.append(_cast_float)
     if _typehint_matches(typehint, [bool, inspect._empty]):
-        if value.lower() in ["false", "f", "no", "n"]:
-            return False
-        if value.lower() in ["true", "t", "yes", "y"]:
-            return True
+        steps.append(_cast_bool)
     if _typehint_matches(typehint, [bool]):
-        if value.lower() in ["0"]:
-            return False
-        if value.lower() in ["1", "ok"]:
-            return True
+        steps.append(_cast_strict_bool)
     if _typehint_matches(typehint, [list, inspect._empty]):
-        if value.startswith("[") and value.endswith("]"):
-            try:
-                return json.loads(value)
-            except:
-                pass
+        steps.append(_cast_json("[", "]"))
     if _typehint_matches(typehint, [tuple, inspect._empty]):
-        if value.startswith("(") and value.endswith(")"):
-            try:
-                s = '[' + value[1:-1] + ']'
-                return tuple(json.loads(s))
-            except:
-                pass
+        steps.append(_cast_json("(", ")", _as_json_list, tuple))
     if _typehint_matches(typehint, [dict, inspect._empty]):
-        if value.startswith("{") and value.endswith("}"):
-            try:
-                return json.loads(value)
-            except:
-                pass
+        steps.append(_cast_json("{", "}"))
     if _typehint_matches(typehint, [frozenset]):
-        if value.startswith("{") and value.endswith("}"):
-            try:
-                return frozenset(json.loads('[' + value[1:-1] + ']'))
-            except:
-                pass
+        steps.append(_cast_json("{", "}", _as_json_list, frozenset))
     if _typehint_matches(typehint, [set, inspect._empty]):
-        if value.startswith("{") and value.endswith("}"):
-            try:
-                return set(json.loads('[' + value[1:-1] + ']'))
-            except:
-                pass
+        steps.append(_cast_json("{", "}", _as_json_list, set))
+
     if typehint is bytes or tryissubclass(typehint, bytes):
-        return value.encode()
-    if typehint is bytearray or tryissubclass(typehint, bytearray):
-        return bytearray(value.encode())
-    if typehint is memoryview or tryissubclass(typehint, memoryview):
-        return memoryview(value.encode())
-    if typehint is type:
-        if hasattr(builtins, value):
-            return getattr(builtins, value)
-        return globals().get(value, value)
-    if hasattr(typehint, "__origin__"):
+        final = lambda value: value.encode()
+    elif typehint is bytearray or tryissubclass(typehint, bytearray):
+        final = lambda value: bytearray(value.encode())
+    elif typehint is memoryview or tryissubclass(typehint, memoryview):
+        final = lambda value: memoryview(value.encode())
+    elif typehint is type:
+        final = _cast_type
+    elif hasattr(typehint, "__origin__"):
         if typehint.__origin__ in [list, tuple, set, frozenset]:
-            return typehint([cast_to_typehint(v, typehint.__args__[0]) for v in value])
-        return cast_to_typehint(value, typehint.__origin__)
-    return value
+            item_caster = compile_caster(typehint.__args__[0])
+            final = lambda value: typehint([item_caster(v) for v in value])
+        else:
+            final = compile_caster(typehint.__origin__)
+    else:
+        final = None
+
+    def cast(value: str):
+        for step in steps:
+            v = step(value)
+            if v is not _NOT_CAST:
+                return v
+        return final(value) if final else value
+    return cast
+
+
+def compile_caster(typehint=inspect._empty):
+    """Resolves, once, which conversions apply to a typehint and returns a function casting a str value to it."""
+    try:
+        return _compile_caster(typehint)
+    except TypeError:
+        # unhashable typehint, can't be cached
+        return _compile_caster.__wrapped__(typehint)
+
+
+def cast_to_typehint(value: str, typehint = inspect._empty):
+    return compile_caster(typehint)(value)
 
 
 def cast_to_types(query, signature):
@@ -166,7 +228,24 @@ def cast_to_types(query, signature):
     return query
 
 
+def _cast_all(values: dict, casters: dict) -> dict:
+    for name, value in values.items():
+        caster = casters.get(name)
+        if caster is not None:
+            try:
+                values[name] = caster(value)
+            except:
+                pass
+    return values
+
+
 def preprocess_args(_handler):
+    """Compiles the binding plan of a handler: how each of its parameters is filled from a Request.
+
+    Everything that only depends on the signature (which parameters are autofilled, the converter of each typed
+    parameter, how many positional parameters there are) is resolved here, once, so the returned parser only
+    has to execute the plan for each request.
+    """
     import inspect
     sig = inspect.signature(_handler)
 
@@ -215,46 +294,57 @@ def preprocess_args(_handler):
         else:
             args_before_collector += 1
 
-
-    get_autofill_kwargs = autofill.autofill(special_params)
+    # the binding plan
+    has_params = bool(sig.parameters)
+    return_annotation = sig.return_annotation
+    casters = {name: compile_caster(param.annotation) for name, param in sig.parameters.items()}
+    positional_casters = list(casters.values())[:args_before_collector]
+    autofill_getters = [(getattr(autofill, k), names) for k, names in special_params.items() if names]
+    autofilled = {name for names in special_params.values() for name in names}
+    positional_names = [name for name, p in sig.parameters.items()
+                        if p.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    required = [name for name, p in sig.parameters.items() if p.default is inspect.Parameter.empty
+                and name not in autofilled
+                and p.kind not in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)]
+    # handlers reading the body as a stream don't want it read into memory to look for json arguments
+    parses_body = not special_params.get("stream")
 
     def parser(request: Request, route_params: dict = None) -> tuple[tuple, dict, type]:
-        print("parsing args", sig.parameters, route_params)
-        route_params = cast_to_types(route_params, sig.parameters) if route_params else {}
-        if not sig.parameters:
-            return (), {}, sig.return_annotation
+        route_params = _cast_all(route_params, casters) if route_params else {}
+        if not has_params:
+            return (), {}, return_annotation
         args = []
-        kwargs = get_autofill_kwargs(request)
-        q = request.path.query_args()
-        if q:
+        kwargs = {}
+        for getter, names in autofill_getters:
+            v = getter(request)
+            for name in names:
+                kwargs[name] = v
+        if request.query:
+            q = Query(request.query)
             int_keys = sorted([int(k) for k in q if k.isdigit()])
-            if set(int_keys) != set(range(len(int_keys))):
-                raise ValueError("Unable to parse args.")
-
-            for k in int_keys:
-                v = q.pop(str(k))
-                if k < args_before_collector:
-                    param_name = list(sig.parameters)[k]
-                    try:
-                        v = cast_to_typehint(v, sig.parameters[param_name].annotation)
-                    except:
-                        pass
-                args.append(v)
-            q = cast_to_types(q, sig.parameters)
-            kwargs.update(q)
-
-        b = request.body
-        if b:
-            try:
-                body = json.loads(b.decode())
-                int_keys = sorted([int(k) for k in body if k.isdigit()])
-                if set(int_keys) != set(range(len(args), len(args) + len(int_keys))):
+            if int_keys:
+                if int_keys[-1] != len(int_keys) - 1:
                     raise ValueError("Unable to parse args.")
                 for k in int_keys:
-                    args.append(body.pop(str(k)))
-                kwargs.update(body)
-            except:
-                pass
+                    v = q.pop(str(k))
+                    if k < args_before_collector:
+                        try:
+                            v = positional_casters[k](v)
+                        except:
+                            pass
+                    args.append(v)
+            kwargs.update(_cast_all(q, casters))
+
+        if parses_body:
+            body = request.json
+            if isinstance(body, dict):
+                int_keys = sorted([int(k) for k in body if k.isdigit()])
+                # bodies whose positional args don't follow the query's are ignored
+                if set(int_keys) == set(range(len(args), len(args) + len(int_keys))):
+                    body = dict(body)
+                    for k in int_keys:
+                        args.append(body.pop(str(k)))
+                    kwargs.update(body)
 
         kwargs.update(route_params)
 
@@ -262,9 +352,15 @@ def preprocess_args(_handler):
             args = tuple(kwargs.pop("args"))
         else:
             args = tuple(args)
-        return args, kwargs, sig.return_annotation
-
-    tag(parser, autofill=special_params, sig=sig)
+        if required:
+            given = positional_names[:len(args)]
+            missing = [name for name in required if name not in kwargs and name not in given]
+            if missing:
+                raise MissingParameter(f"Missing required parameter{'s' if len(missing) > 1 else ''}: "
+                                       f"{', '.join(missing)}")
+        return args, kwargs, return_annotation
+
+    tag(parser, autofill=special_params, sig=sig, is_async=inspect.iscoroutinefunction(_handler))
     return parser
 
 @tag(accepts_route_params=True)
@@ -278,43 +374,74 @@ def wrap_handler(_handler, error_mode: str = None):
     # make a stub function that takes the same parameters as the handler but doesn't do anything
     # use inspect.signature to get the parameters
 
-    @wraps(_handler)
-    def wrapper(request: Request, route_params: dict = None) -> Response:
+    def _to_response(r, request: Request, return_annotation) -> Response:
+        if isinstance(r, Response):
+            return r
+        elif isinstance(r, HTTPStatusCode):
+            return Response(r.phrase(), status_code=r, version=request.version)
         try:
-            if parser is None:
-                r = _handler()
-                response = Response(r, version=request.version)
-            else:
+            if (not isinstance(return_annotation, str)) and issubclass(return_annotation, Response):
+                return return_annotation(r)
+        except:
+            pass
+        return Response(r, version=request.version)
+
+    def to_response(r, request: Request, return_annotation) -> Response:
+        response = _to_response(r, request, return_annotation)
+        if isinstance(response, FileResponse):
+            response = response.apply_conditional(request).apply_range(request)
+        elif constant and isinstance(response.body, bytes):
+            # the handler's response never changes: keep it, encoded, and stop calling the handler
+            nonlocal encoded
+            encoded = EncodedResponse.from_response(response)
+            return encoded
+        return response
+
+    def to_error_response(e: Exception, request: Request) -> Response:
+        logger.exception(e)
+        status_code = getattr(e, "status_code", 500)
+        _error_mode = error_mode if error_mode is not None else ErrorModes.DEFAULT
+        if _error_mode == ErrorModes.HIDE:
+            msg = b'Internal Server Error' if status_code == 500 else HTTPStatusCode(status_code).phrase().title().encode()
+        elif _error_mode == ErrorModes.TYPE:
+            msg = str(type(e)).encode()
+        elif _error_mode == ErrorModes.SHORT:
+            msg = str(e).encode()
+        elif _error_mode == ErrorModes.LONG:
+            msg = traceback.format_exc().encode()
+        return ErrorResponse(msg, status_code=status_code, version=request.version)
+
+    constant = gettag(_handler, "constant", False)
+    encoded = None
+
+    is_async = getattr(parser, "is_async", False)
+    if is_async:
+        # async handlers are awaited by the serving loop instead of occupying a thread while they wait
+        @wraps(_handler)
+        async def wrapper(request: Request, route_params: dict = None) -> Response:
+            if encoded is not None:
+                return encoded
+            try:
+                a, kw, return_annotation = parser(request, route_params=route_params)
+                r = await _handler(*a, **kw)
+                return to_response(r, request, return_annotation)
+            except Exception as e:
+                return to_error_response(e, request)
+    else:
+        @wraps(_handler)
+        def wrapper(request: Request, route_params: dict = None) -> Response:
+            if encoded is not None:
+                return encoded
+            try:
                 a, kw, return_annotation = parser(request, route_params=route_params)
                 r = _handler(*a, **kw)
-                if isinstance(r, Response):
-                    response = r
-                elif isinstance(r, HTTPStatusCode):
-                    response = Response(r.phrase(), status_code=r, version=request.version)
-                else:
-                    try:
-                        if (not isinstance(return_annotation, str)) and issubclass(return_annotation, Response):
-                            response = return_annotation(r)
-                        else:
-                            response = Response(r, version=request.version)
-                    except:
-                        response = Response(r, version=request.version)
-        except Exception as e:
-            logger.exception(e)
-            _error_mode = error_mode if error_mode is not None else ErrorModes.DEFAULT
-            if _error_mode == ErrorModes.HIDE:
-                msg = b'Internal Server Error'
-            elif _error_mode == ErrorModes.TYPE:
-                msg = str(type(e)).encode()
-            elif _error_mode == ErrorModes.SHORT:
-                msg = str(e).encode()
-            elif _error_mode == ErrorModes.LONG:
-                msg = traceback.format_exc().encode()
-            response = ErrorResponse(msg, version=request.version)
-        return response
+                return to_response(r, request, return_annotation)
+            except Exception as e:
+                return to_error_response(e, request)
 
     tag(wrapper,
         is_wrapped=True,
+        is_async=is_async,
         sig=getattr(parser, "sig", inspect.signature(_handler)),
         autofill=getattr(parser, "autofill", {}), **_handler.__dict__)
 
@@ -332,42 +459,52 @@ class MatchableHandlerABC:
 
 
 class StaticFileHandler(MatchableHandlerABC):
+    """Serves the files below path, keeping small files (and the headers of all files) in an in-memory FileCache.
+
+    Pass cache=False to read every file from disk, or a FileCache to bound its size or share it between handlers.
+    """
     is_wrapped = True
     allowed_methods = ["GET", "HEAD"]
 
-    def __init__(self, path: Path | str, route: str = None):
-        self.path = path
-        self.route = route or "/" + path.name
+    def __init__(self, path: Path | str, route: str = None, cache: FileCache | bool = True):
+        self.path = Path(path)
+        self.route = route or "/" + self.path.name
         self.allowed_methods = ["GET", "HEAD"]
+        self.cache = FileCache() if cache is True else None if cache is False else cache
 
-    def match(self, route: str) -> bool:
+    def local_path(self, route: str) -> Path | None:
         if not route.startswith(self.route):
-            return False
+            return None
         added = route[len(self.route):]
-        p = (self.path / added.strip("/")) if added else self.path
-        if not p.exists():
-            print("path doesn't exist", p, route, added)
-            return False
-        return True
+        return (self.path / added.strip("/")) if added else self.path
 
-    def __call__(self, request: Request) -> Response:
-        route = request.path.route()
-        if not route.startswith(self.route):
-            return Response(b"Not Found", status_code=404, version=request.version)
-        added = route[len(self.route):]
-        p = (self.path / added.strip("/")) if added else self.path
+    def match(self, route: str) -> bool:
+        p = self.local_path(route)
+        return p is not None and os.path.exists(p)
 
-        if p.is_dir() and (p / "index.html").exists():
-            p = p / "index.html"
-        if not p.exists():
-            return Response(b"Not Found", status_code=404, version=request.version)
-        elif p.is_dir():
+    def __call__(self, request: Request) -> Response:
+        p = self.local_path(request.route)
+        try:
+            st = os.stat(p) if p is not None else None
+            if st is not None and stat.S_ISDIR(st.st_mode):
+                with suppress(FileNotFoundError):
+                    st = os.stat(p / "index.html")
+                    p = p / "index.html"
+        except OSError:
+            st = None
+        if st is None:
+            return EncodedResponse.canned(HTTPStatusCode.NOT_FOUND)
+        elif stat.S_ISDIR(st.st_mode):
             folder_contents = list(p.iterdir())
-            contents = "<!DOCTYPE html><html><body><ul>" + "\n".join([f"<li><a href='{route}/{f.name}'>{f.name}</a></li>" for f in folder_contents]) + "</ul></body></html>"
+            contents = "<!DOCTYPE html><html><body><ul>" + "\n".join([f"<li><a href='{request.route}/{f.name}'>{f.name}</a></li>" for f in folder_contents]) + "</ul></body></html>"
             return Response(contents.encode(), version=request.version)
-        r = FileResponse(p, version=request.version)
-        print("content type", r.headers.get("Content-Type"))
-        return r
+
+        if self.cache is not None:
+            entry = self.cache.get(p, st, FileResponse.get_content_type(p.suffix[1:]))
+            r = FileResponse.from_cache(entry, version=request.version)
+        else:
+            r = FileResponse(p, version=request.version)
+        return r.apply_conditional(request).apply_range(request)
 
 
 def matches_variadic_route(route: str, variadic_route: str) -> dict:
@@ -453,28 +590,7 @@ def matches_variadic_route(route: str, variadic_route: str) -> dict:
         return False
 
 def sort_variadic_routes(patterns):
-    q = []
-    for pattern in patterns:
-        parts = pattern.split("/")
-        part_count = len(parts)
-        variadic_part_count = len([p for p in parts if "{" in p and "}" in p])
-        nonvariadic_part_count = part_count - variadic_part_count
-        total_variadic_pattern_count = sum([1 * (c=='{') for c in pattern])
-        total_nonvariadic_chars = 0
-        in_variadic = False
-        for c in pattern:
-            if c == "{":
-                in_variadic = True
-            elif c == "}":
-                in_variadic = False
-            elif not in_variadic:
-                total_nonvariadic_chars += 1
-        q.append((part_count,
-                  nonvariadic_part_count,
-                  total_nonvariadic_chars,
-                  total_variadic_pattern_count,
-                  len(pattern),
-                  pattern))
+    q = [variadic_route_priority(pattern) for pattern in patterns]
     sorted_patterns = [_v[-1] for _v in reversed(sorted(q))]
     return sorted_patterns
 
@@ -497,8 +613,10 @@ class RouteHandler:
         self.favicon_path = favicon
 
         self.routes = {}
+        self.bulkheads = {}
         self.matchable_routes = {}
         self.variadic_routes = {}
+        self.variadic_route_trie = RouteTrie()
         if routes:
             if isinstance(routes, dict):
                 for k, v in routes.items():
@@ -507,8 +625,9 @@ class RouteHandler:
                 self.parse_routes_from_object(routes)
         self.fallback_handler = wrap_handler(fallback_handler) if fallback_handler else None
 
-        op = wrap_handler(self.openapi, error_mode=error_mode)
-        sw = wrap_handler(self.swagger, error_mode=error_mode)
+        # the docs stay reachable under load, like health checks
+        op = tag(wrap_handler(self.openapi, error_mode=error_mode), priority=Priority.HIGH)
+        sw = tag(wrap_handler(self.swagger, error_mode=error_mode), priority=Priority.HIGH)
 
         self.default_routes = {
             "/api-docs": op,
@@ -538,7 +657,7 @@ class RouteHandler:
         try:
             r = FileResponse(self.favicon_path, version=request.version)
         except Exception as e:
-            r = Response(b"Not Found", status_code=404, version=request.version)
+            r = EncodedResponse.canned(HTTPStatusCode.NOT_FOUND)
         return r
 
     @get
@@ -572,7 +691,32 @@ class RouteHandler:
                             self[route] = v
 
     def __call__(self, request: Request) -> Response:
-        route = request.path.route()
+        resolved = self.resolve(request)
+        if isinstance(resolved, Response):
+            return resolved
+        handler, route_params = resolved
+        if route_params:
+            r = handler(request, route_params)
+        else:
+            r = handler(request)
+        return r
+
+    def resolve(self, request: Request) -> tuple[callable, dict] | Response:
+        """Finds the handler and route params for the request, or the error Response (404, 405) to send instead.
+
+        Serving loops that need to know how a handler runs (e.g. whether it is async) before calling it use this
+        instead of __call__. The result is kept on the request, so resolving it again (e.g. to find its priority
+        before dispatching it, then to handle it) costs nothing.
+        """
+        resolved = request._resolved
+        if resolved is not None and resolved[0] is self:
+            return resolved[1]
+        resolved = self._resolve(request)
+        request._resolved = (self, resolved)
+        return resolved
+
+    def _resolve(self, request: Request) -> tuple[callable, dict] | Response:
+        route = request.route
         handler = self.routes.get(route, None)
         route_params = {}
         if handler is None:
@@ -586,44 +730,57 @@ class RouteHandler:
                 elif "{" in (x:= url_decode(route)) and x in self.variadic_routes:
                     raise ValueError(f"Route {route} is variadic , {{}} patterns should be filled in")
                 else:
-                    # check all variadic routes in the correct order, first by number of parts, then number of variadic parts, then length of nonvariadic parts
-                    variadic_patterns = sort_variadic_routes(list(self.variadic_routes.keys()))
-
-                    for k in variadic_patterns:
-                        # these are in format /a/{b}/c/{d}/e, convert to regexp groups
-                        route_params = matches_variadic_route(route, k)
-                        if route_params:
-                            handler = self.variadic_routes[k]
-                            break
+                    # the trie applies the same precedence as sort_variadic_routes
+                    match = self.variadic_route_trie.match(route)
+                    if match:
+                        _, handler, route_params = match
                     else:
                         handler = self.fallback_handler
 
         if handler is None:
-            # send a response with 404
-            return Response(b'Not Found',
-                            status_code=404,
-                            headers={"Content-Type": "text/plain"},
-                            version=request.version)
+            return EncodedResponse.canned(HTTPStatusCode.NOT_FOUND)
         allowed_methods = gettag(handler, "allowed_methods", None)
         # if allowed_methods is None:
         #     print(handler, handler.__dict__)
         if request.method == "HEAD" and "GET" in allowed_methods:
             allowed_methods = list(allowed_methods) + ["HEAD"]
         if allowed_methods is None or request.method not in allowed_methods:
-            print("Method Not Allowed", route, request.method, allowed_methods, handler)
-            return Response(b'Method Not Allowed',
-                            status_code=405,
-                            headers={"Content-Type": "text/plain"},
-                            version=request.version)
-        if route_params:
-            r = handler(request, route_params)
-        else:
-            r = handler(request)
-        return r
+            return EncodedResponse.canned(HTTPStatusCode.METHOD_NOT_ALLOWED)
+        return handler, route_params
+
+    def can_resolve_on_loop(self, request: Request) -> bool:
+        """Whether resolving the request does no I/O, so a serving loop can do it itself: it is resolved already, its
+        route is exact, or there are no matchable handlers (like static folders, which check the filesystem) to ask."""
+        resolved = request._resolved
+        return (not self.matchable_routes or request.route in self.routes
+                or (resolved is not None and resolved[0] is self))
+
+    def priority_of(self, request: Request) -> int:
+        """The `priority` tag of the handler of the request, or Priority.NORMAL.
+
+        This runs on the serving loop, so matchable handlers (like static folders, which check the filesystem) are
+        never asked: with any of them, routes that aren't exact are looked up in the default and variadic routes
+        only. Otherwise the request is resolved, once for both its priority and its handling.
+        """
+        route = request.route
+        handler = self.routes.get(route)
+        if handler is None and not self.matchable_routes:
+            try:
+                resolved = self.resolve(request)
+            except ValueError:
+                return Priority.NORMAL
+            if isinstance(resolved, Response):
+                return Priority.NORMAL
+            handler = resolved[0]
+        elif handler is None:
+            handler = self.default_routes.get(route)
+            if handler is None and (match := self.variadic_route_trie.match(route)):
+                handler = match[1]
+        return gettag(handler, "priority", Priority.NORMAL)
 
     def route(self, handler, route: str | None = None, allowed_methods: tuple[str] | None = None):
         if isinstance(handler, Path):
-            handler = StaticFileHandler(Path, route)
+            handler = StaticFileHandler(handler, route)
 
         if isinstance(handler, str):
             return lambda handler: self.route(handler, route, allowed_methods)
@@ -635,9 +792,23 @@ class RouteHandler:
         em = getattr(handler, "error_mode", self.error_mode)
         h = wrap_handler(handler, error_mode=em)
         h.__dict__["allowed_methods"] = allowed_methods
+        if gettag(h, "constant", False) and gettag(h, "priority") is None:
+            # constant handlers are typically health checks, which must not time out when the server is saturated
+            tag(h, priority=Priority.HIGH)
         if self.base_path == "/" and route.startswith("/"):
             route = route[1:]
+        max_concurrency = gettag(h, "max_concurrency")
+        if max_concurrency is not None and gettag(h, "bulkhead") is None:
+            # each route gets its own bulkhead, even when one handler serves several routes
+            h = Bulkhead(max_concurrency, gettag(h, "queue", Bulkhead.default_queue),
+                         gettag(h, "queue_timeout", Bulkhead.default_timeout)).guard(h)
+            self.bulkheads[self.base_path + route] = h.bulkhead
+        rate_limit = gettag(h, "rate_limit")
+        if isinstance(rate_limit, RateLimiter) and not gettag(h, "rate_limited", False):
+            # outside the bulkhead, so rate limited requests never take one of its slots
+            h = rate_limit.guard(h)
         if "{" in route and "}" in route:
+            self.variadic_route_trie.add(self.base_path + route, h)
             self.variadic_routes[self.base_path + route] = h
         elif hasattr(h, "match") and callable(h.match):
             self.matchable_routes[self.base_path + route] = h
@@ -664,7 +835,9 @@ class RouteHandler:
 
         def wrapper(request: Request) -> Response:
             response = handler(request)
-            response.body = b""
+            if not isinstance(response, EncodedResponse):
+                # encoded responses are shared, and already leave the body out of responses to HEAD requests
+                response.body = b""
             return response
 
         return self.route(wrapper, route, allowed_methods=("HEAD",))
@@ -0,0 +1,329 @@
+"""Limits on how much work the server takes on at once, rejecting the excess early with a 503 or 429."""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+
+from socketpulse.dispatch import Overloaded
+from socketpulse.tags import tag, gettag
+from socketpulse.types import Request, EncodedResponse, ClientAddr
+
+
+class RateLimited(Overloaded):
+    """Raised when a client is over its rate limit. Connections answer it with 429 Too Many Requests and a Retry-After
+    header."""
+    status_code = 429
+
+
+class AdaptiveLimiter:
+    """Limits how many requests are handled at once, adapting the limit to the latency of the handlers (AIMD).
+
+    The baseline is the lowest recent handler latency. It drifts up slowly, so that it follows a change in the mix
+    of requests. While latencies stay within tolerance times the baseline and the limit is actually in use, the limit
+    grows by about one per limit's worth of requests (additive increase). A latency past that shrinks the limit by
+    the backoff factor (multiplicative decrease), at most once per that latency, so one slow burst only counts once.
+    Requests over the limit are rejected before their handler runs.
+    """
+    default_initial_limit = 20
+    default_min_limit = 1
+    default_max_limit = 1000
+    default_tolerance = 2.0
+    default_backoff = 0.9
+    baseline_drift = 0.01
+
+    def __init__(self,
+                 initial_limit: int = default_initial_limit,
+                 min_limit: int = default_min_limit,
+                 max_limit: int = default_max_limit,
+                 tolerance: float = default_tolerance,
+                 backoff: float = default_backoff,
+                 retry_after: float = 1.0):
+        if min_limit < 1:
+            raise ValueError(f"min_limit must be at least 1, not {min_limit}")
+        if max_limit < min_limit:
+            raise ValueError(f"max_limit ({max_limit}) must be at least min_limit ({min_limit})")
+        if not tolerance > 1:
+            raise ValueError(f"tolerance must be greater than 1, not {tolerance}")
+        if not 0 < backoff < 1:
+            raise ValueError(f"backoff must be between 0 and 1, not {backoff}")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.retry_after = retry_after
+        self.baseline: float | None = None
+        self.in_flight = 0
+        self.rejected = 0
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """The number of requests currently allowed to be handled at once."""
+        return int(self._limit)
+
+    def acquire(self) -> bool:
+        """Takes a slot for a request, or returns False (counting a rejection) if the limit is reached."""
+        with self._lock:
+            if self.in_flight >= int(self._limit):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: float) -> None:
+        """Gives back the slot of a request its handler took latency seconds for, and adapts the limit."""
+        with self._lock:
+            in_use = self.in_flight
+            self.in_flight -= 1
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * self.baseline_drift
+            if latency > self.baseline * self.tolerance:
+                now = time.monotonic()
+                if now - self._last_decrease >= latency:
+                    self._last_decrease = now
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+            elif in_use >= self._limit / 2:
+                # only grow a limit that is in use, or it grows without bound while the server is idle
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def overloaded(self) -> Overloaded:
+        return Overloaded(f"Service Unavailable (over the concurrency limit of {self.limit})",
+                          retry_after=self.retry_after)
+
+    def __repr__(self):
+        return (f"AdaptiveLimiter(limit={self.limit}, in_flight={self.in_flight}, baseline={self.baseline}, "
+                f"rejected={self.rejected})")
+
+
+class Bulkhead:
+    """Caps how many requests for one route are handled at once, so a slow route can't take every thread.
+
+    Up to max_concurrency requests run at once and up to queue more wait (first come, first served) for a slot, for
+    at most timeout seconds (None to wait until one frees up). Requests past both, or that time out, get a 503.
+    Waiting sync requests hold their thread, so a route ties up at most max_concurrency + queue threads.
+    """
+    default_queue = 0
+    default_timeout = None
+
+    def __init__(self, max_concurrency: int, queue: int = default_queue, timeout: float | None = default_timeout,
+                 retry_after: float = 1.0):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, not {max_concurrency}")
+        if queue < 0:
+            raise ValueError(f"queue must not be negative, not {queue}")
+        self.max_concurrency = max_concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        # threading.Events of waiting threads and (loop, future) of waiting coroutines
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter) -> bool | None:
+        """Takes a free slot (True), queues the waiter (None), or counts a rejection (False)."""
+        with self._lock:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                return True
+            if len(self._waiters) >= self.queue:
+                self.rejected += 1
+                return False
+            self._waiters.append(waiter)
+            return None
+
+    def _give_up(self, waiter) -> bool:
+        """Removes a waiter that timed out. Returns True if a slot was handed to it in the meantime."""
+        with self._lock:
+            if waiter not in self._waiters:
+                return True
+            self._waiters.remove(waiter)
+            self.rejected += 1
+            return False
+
+    def acquire(self) -> bool:
+        """Takes a slot, waiting in the queue if there is room in it. Returns False if the request is rejected."""
+        waiter = threading.Event()
+        acquired = self._try_acquire(waiter)
+        if acquired is not None:
+            return acquired
+        return waiter.wait(self.timeout) or self._give_up(waiter)
+
+    async def acquire_async(self) -> bool:
+        """acquire for coroutines: waits on the event loop instead of blocking it."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        acquired = self._try_acquire(waiter)
+        if acquired is not None:
+            return acquired
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Gives back a slot, handing it straight to the longest waiting request if there is one."""
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+    def rejected_response(self) -> EncodedResponse:
+        return EncodedResponse.canned(Overloaded.status_code, self.retry_after)
+
+    def guard(self, handler):
+        """Wraps a (wrap_handler wrapped) handler so every call holds a slot of this bulkhead."""
+        if gettag(handler, "is_async", False):
+            @wraps(handler)
+            async def guarded(request, route_params: dict = None):
+                if not await self.acquire_async():
+                    return self.rejected_response()
+                try:
+                    return await handler(request, route_params)
+                finally:
+                    self.release()
+        else:
+            @wraps(handler)
+            def guarded(request, route_params: dict = None):
+                if not self.acquire():
+                    return self.rejected_response()
+                try:
+                    return handler(request, route_params)
+                finally:
+                    self.release()
+        tag(guarded, bulkhead=self)
+        return guarded
+
+    def __repr__(self):
+        return (f"Bulkhead(max_concurrency={self.max_concurrency}, queue={self.queue}, active={self.active}, "
+                f"waiting={len(self._waiters)}, rejected={self.rejected})")
+
+
+class RateLimiter:
+    """Limits the rate of requests of each client with a token bucket per client.
+
+    A client's bucket holds up to burst tokens and refills at rate tokens per second. Each request takes a token,
+    and requests that find the bucket empty are rejected with a 429 whose Retry-After is the time until the next
+    token. Clients are told apart by the value of the given header (e.g. an API key), or by their address (without
+    the port) if there is no header or a request lacks it. At most max_clients buckets are kept. A bucket that has
+    refilled is dropped, since a new one would be the same, and past max_clients the least recently used go first.
+    """
+    default_max_clients = 10000
+
+    def __init__(self, rate: float, burst: float | None = None, header: str | None = None,
+                 max_clients: int = default_max_clients):
+        if burst is None:
+            burst = max(1.0, rate)
+        if not rate > 0:
+            raise ValueError(f"rate must be positive, not {rate}")
+        if not burst >= 1:
+            raise ValueError(f"burst must be at least 1, not {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.header = header
+        self.max_clients = max_clients
+        self.rejected = 0
+        # key -> (tokens, time of the last update), least recently used first
+        self._buckets: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, request: Request) -> tuple[str, str]:
+        """Identifies the client of the request. Header and address keys never collide, so a client can't spend
+        another client's tokens by sending its address as the header."""
+        if self.header is not None and (value := request.headers.get(self.header)):
+            return self.header, value
+        return "", request.client_addr.host
+
+    @staticmethod
+    def address_key(client_address) -> tuple[str, str]:
+        """The key of a client that is identified by its address, before its request is read."""
+        return "", ClientAddr(client_address).host
+
+    def _tokens(self, key: tuple[str, str], now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, last = bucket
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def wait_time(self, key: tuple[str, str]) -> float:
+        """The number of seconds until the client has a token (0 if it has one now), without taking it. A client
+        that has none counts as rejected."""
+        with self._lock:
+            tokens = self._tokens(key, time.monotonic())
+            if tokens >= 1:
+                return 0.0
+            self.rejected += 1
+        return (1 - tokens) / self.rate
+
+    def acquire(self, key: tuple[str, str]) -> float:
+        """Takes a token from the client's bucket. Returns 0, or the number of seconds until the client will have a
+        token if it has none (counting a rejection)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # buckets that refilled are the same as no bucket at all
+            full_after = self.burst / self.rate
+            while self._buckets:
+                oldest, (_, last) = next(iter(self._buckets.items()))
+                if len(self._buckets) <= self.max_clients and now - last < full_after:
+                    break
+                del self._buckets[oldest]
+        return wait
+
+    def rate_limited(self, wait: float) -> RateLimited:
+        return RateLimited(f"Too Many Requests (retry in {wait:.3f}s)", retry_after=wait)
+
+    def rejected_response(self, wait: float) -> EncodedResponse:
+        return EncodedResponse.canned(RateLimited.status_code, wait)
+
+    def guard(self, handler):
+        """Wraps a (wrap_handler wrapped) handler so every call takes a token of its client first."""
+        if gettag(handler, "is_async", False):
+            @wraps(handler)
+            async def guarded(request, route_params: dict = None):
+                if wait := self.acquire(self.key(request)):
+                    return self.rejected_response(wait)
+                return await handler(request, route_params)
+        else:
+            @wraps(handler)
+            def guarded(request, route_params: dict = None):
+                if wait := self.acquire(self.key(request)):
+                    return self.rejected_response(wait)
+                return handler(request, route_params)
+        tag(guarded, rate_limited=True)
+        return guarded
+
+    @property
+    def num_clients(self) -> int:
+        """The number of buckets kept."""
+        return len(self._buckets)
+
+    def __repr__(self):
+        return (f"RateLimiter(rate={self.rate}, burst={self.burst}, header={self.header!r}, "
+                f"clients={self.num_clients}, rejected={self.rejected})")
@@ -0,0 +1,174 @@
+"""Compiled lookup of variadic routes like /a/{b}/c/{d}_x."""
+import threading
+from collections import OrderedDict
+
+
+def variadic_route_priority(pattern: str) -> tuple:
+    """The sort key deciding which variadic route wins when several match the same path (higher wins):
+    first by number of parts, then number of non-variadic parts, then number of non-variadic characters,
+    then number of variadic sections, then length."""
+    parts = pattern.split("/")
+    part_count = len(parts)
+    variadic_part_count = len([p for p in parts if "{" in p and "}" in p])
+    nonvariadic_part_count = part_count - variadic_part_count
+    total_variadic_pattern_count = sum([1 * (c == '{') for c in pattern])
+    total_nonvariadic_chars = 0
+    in_variadic = False
+    for c in pattern:
+        if c == "{":
+            in_variadic = True
+        elif c == "}":
+            in_variadic = False
+        elif not in_variadic:
+            total_nonvariadic_chars += 1
+    return (part_count,
+            nonvariadic_part_count,
+            total_nonvariadic_chars,
+            total_variadic_pattern_count,
+            len(pattern),
+            pattern)
+
+
+def compile_segment(segment: str):
+    """Compiles one path segment pattern (e.g. "{b}_is{e}") into a function that returns the captured
+    variables of a matching path segment, or None if it doesn't match."""
+    sections = []
+    current = None
+    for c in segment:
+        if c == "{":
+            if current is not None and current[0]:
+                raise ValueError(f"Nested '{{' in route segment {segment}")
+            sections.append(current)
+            current = [True, ""]
+        elif c == "}":
+            if current is None or not current[0]:
+                raise ValueError(f"Unmatched '}}' in route segment {segment}")
+            sections.append(current)
+            current = [False, ""]
+        else:
+            if current is None:
+                current = [False, ""]
+            current[1] += c
+    sections.append(current)
+    sections = [(is_variadic, value) for is_variadic, value in (s for s in sections if s) if value]
+    if not sections or not any(is_variadic for is_variadic, _ in sections):
+        raise ValueError(f"Invalid variadic route segment {segment}")
+    if not all(sections[i][0] != sections[i + 1][0] for i in range(len(sections) - 1)):
+        raise ValueError("Variadic sections must alternate")
+    names = [value for is_variadic, value in sections if is_variadic]
+    if len(set(names)) != len(names):
+        raise ValueError("Variadic sections must be unique")
+    ends_variadic = sections[-1][0]
+
+    def match(part: str) -> dict | None:
+        if part == segment:
+            return {}
+        found = {}
+        end = 0
+        name = None
+        for is_variadic, value in sections:
+            if is_variadic:
+                name = value
+                continue
+            i = part.find(value, end)
+            if i == -1:
+                return None
+            if name:
+                found[name] = part[end:i]
+            end = i + len(value)
+        if ends_variadic:
+            found[name] = part[end:]
+        elif end < len(part):
+            return None
+        return found
+
+    match.names = names
+    return match
+
+
+class _Node:
+    __slots__ = ("static", "variadic", "route")
+
+    def __init__(self):
+        self.static = {}
+        self.variadic = {}
+        self.route = None
+
+
+class RouteTrie:
+    """A segment trie of variadic routes, compiled as routes are added.
+
+    Static segments are dict lookups, `{param}` and mixed segments are precompiled matchers. Every route matching
+    the path is found in one walk of the trie, and the one with the highest `variadic_route_priority` wins,
+    which is the same precedence as checking the routes one by one in `sort_variadic_routes` order.
+    Recently resolved paths are kept in a bounded LRU cache.
+    """
+    default_cache_size = 1024
+
+    def __init__(self, cache_size: int = default_cache_size):
+        self.root = _Node()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, pattern: str, value) -> None:
+        node = self.root
+        names = []
+        for part in pattern.split("/"):
+            if "{" in part and "}" in part:
+                if part not in node.variadic:
+                    node.variadic[part] = (compile_segment(part), _Node())
+                matcher, node = node.variadic[part]
+                names += matcher.names
+            else:
+                node = node.static.setdefault(part, _Node())
+        if len(set(names)) != len(names):
+            raise ValueError("Variadic sections must be unique")
+        node.route = (variadic_route_priority(pattern), pattern, value)
+        with self._lock:
+            self._cache.clear()
+
+    def match(self, route: str) -> tuple[str, object, dict] | None:
+        """Returns (pattern, value, route_params) of the best matching route, or None."""
+        with self._lock:
+            if route in self._cache:
+                self._cache.move_to_end(route)
+                found = self._cache[route]
+                return found and (found[0], found[1], dict(found[2]))
+
+        parts = route.split("/")
+        n = len(parts)
+        best = None
+        stack = [(self.root, 0, {})]
+        while stack:
+            node, i, params = stack.pop()
+            if i == n:
+                # a path spelling out the pattern itself ({} params) is not a match
+                if node.route is not None and params and (best is None or node.route[0] > best[0][0]):
+                    best = (node.route, params)
+                continue
+            part = parts[i]
+            child = node.static.get(part)
+            if child is not None:
+                stack.append((child, i + 1, params))
+            for matcher, child in node.variadic.values():
+                found = matcher(part)
+                if found is not None:
+                    stack.append((child, i + 1, {**params, **found}))
+
+        result = None if best is None else (best[0][1], best[0][2], best[1])
+        with self._lock:
+            self._cache[route] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result and (result[0], result[1], dict(result[2]))
+
+    def __len__(self):
+        count = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            count += node.route is not None
+            stack.extend(node.static.values())
+            stack.extend(child for _, child in node.variadic.values())
+        return count
@@ -1,11 +1,23 @@
 """A simple HTTP server built directly on top of socket.socket."""
+import asyncio
+import os
+import signal
 import socket
 import logging
+import threading
 import time
+from concurrent.futures import Future
+from contextlib import suppress
+from functools import partial
 from pathlib import Path
 
-from socketpulse.connection import Connection
+from socketpulse.buffers import BufferPool
+from socketpulse.compression import Compressor
+from socketpulse.connection import Connection, SelectorConnection, AsyncConnection
+from socketpulse.dispatch import WorkQueue, Overloaded, Priority
+from socketpulse.limits import AdaptiveLimiter, RateLimiter
 from socketpulse.handlers import RouteHandler, wrap_handler
+from socketpulse.types import ErrorResponse, Response
 
 logger = logging.getLogger("socketpulse")
 
@@ -17,10 +29,34 @@ class Server(socket.socket):
     default_backlog = 1
     default_chunk_size = Connection.default_chunk_size
     default_num_connection_threads = 1
+    default_min_connection_threads = 1
+    default_thread_idle_timeout = 60.0
+    default_thread_scale_up_wait = 0.0
+    default_classify = None
+    default_priority_aging = 1.0
+    default_rate_limit = None
     default_socket_options = None
     default_pause_sleep = 0.1
     default_accept_sleep = 0
     default_favicon = RouteHandler.default_favicon
+    default_keep_alive_timeout = Connection.default_keep_alive_timeout
+    default_max_keep_alive_requests = Connection.default_max_keep_alive_requests
+    default_mode = "blocking"
+    modes = ("blocking", "selector", "asyncio")
+    default_workers = 1
+    default_reuse_port = False
+    default_cpu_affinity = False
+    default_compression = True
+    default_max_body_size = Connection.default_max_body_size
+    default_spool_threshold = Connection.default_spool_threshold
+    default_max_header_size = Connection.default_max_header_size
+    default_max_headers = Connection.default_max_headers
+    default_max_queue = 1024
+    default_queue_timeout = None
+    default_queue_overflow = "reject"
+    default_retry_after = 1.0
+    default_adaptive_concurrency = False
+    min_worker_uptime = 1.0
 
     def __init__(self,
                  routes: dict | None = None,
@@ -34,7 +70,29 @@ class Server(socket.socket):
                  accept_sleep: float = default_accept_sleep,
                  fallback_handler=None,
                  serve: bool = True,
-                 favicon: str | Path = default_favicon
+                 favicon: str | Path = default_favicon,
+                 keep_alive_timeout: float | None = default_keep_alive_timeout,
+                 max_keep_alive_requests: int | None = default_max_keep_alive_requests,
+                 mode: str = default_mode,
+                 workers: int = default_workers,
+                 reuse_port: bool = default_reuse_port,
+                 cpu_affinity: bool | list[int] = default_cpu_affinity,
+                 compression: bool | Compressor = default_compression,
+                 max_body_size: int | None = default_max_body_size,
+                 spool_threshold: int = default_spool_threshold,
+                 max_header_size: int = default_max_header_size,
+                 max_headers: int = default_max_headers,
+                 max_queue: int | None = default_max_queue,
+                 queue_timeout: float | None = default_queue_timeout,
+                 queue_overflow: str = default_queue_overflow,
+                 retry_after: float = default_retry_after,
+                 adaptive_concurrency: bool | AdaptiveLimiter = default_adaptive_concurrency,
+                 min_connection_threads: int = default_min_connection_threads,
+                 thread_idle_timeout: float | None = default_thread_idle_timeout,
+                 thread_scale_up_wait: float = default_thread_scale_up_wait,
+                 classify=default_classify,
+                 priority_aging: float | None = default_priority_aging,
+                 rate_limit: RateLimiter | None = default_rate_limit
                  ):
         """A simple HTTP server built directly on top of socket.socket.
 
@@ -45,6 +103,8 @@ class Server(socket.socket):
             backlog (int, optional): The maximum number of queued connections. Defaults to 1.
             chunk_size (int, optional): The default chunk size to use when receiving data. Defaults to 1024.
             num_connection_threads (int, optional): The number of threads to use for handling connections. Defaults to 1.
+                With more than one, the thread pool is elastic: threads are started as work queues up, up to this
+                number, and retire when idle. `server.thread_pool_executor.num_threads` is the current pool size.
             socket_options (dict[int, dict[int, int]] | None, optional): A dictionary of socket options to set on the server socket.
                 The keys are the levels, and the values are dictionaries of options and values. Defaults to None.
                 e.g. {socket.SOL_SOCKET: {socket.SO_REUSEADDR: 1}}
@@ -54,7 +114,83 @@ class Server(socket.socket):
                 Could affect latency. Defaults to 0.1.
             fallback_handler (RequestHandler, optional): The function to use to handle requests that don't match any routes.
             serve (bool, optional): Whether to start serving immediately. Defaults to True.
+            keep_alive_timeout (float | None, optional): The number of seconds an idle persistent (keep-alive) connection
+                is kept open waiting for its next request. 0 or None disables keep-alive. Keep-alive is only used when
+                connections are handled by a thread pool, since an idle client would otherwise block every other client.
+                Defaults to 5.
+            max_keep_alive_requests (int | None, optional): The maximum number of requests served on one connection
+                before it is closed. 0 or None means unlimited. Defaults to 100.
+            mode (str, optional): How connections are served. Defaults to "blocking".
+                "blocking": accept() one connection at a time, then handle it inline or on the thread pool.
+                "selector": multiplex every connection on one thread with a selectors event loop (epoll on Linux),
+                    using non-blocking sockets. Only complete requests are dispatched to the handler
+                    (on the thread pool if num_connection_threads > 1, otherwise inline on the event loop thread).
+                "asyncio": serve connections with asyncio streams. `async def` handlers are awaited on the event loop,
+                    sync handlers run in the thread pool (or the loop's default executor) so they never block it.
+            workers (int, optional): The number of processes to fork. Each worker serves connections with the
+                configured mode and thread pool; the parent only supervises them. Routes and handlers are built
+                before forking, so workers share them copy-on-write. Defaults to 1 (no forking).
+            reuse_port (bool, optional): When forking workers, give each worker its own SO_REUSEPORT listening socket
+                (the kernel load-balances new connections between them) instead of sharing the parent's socket.
+                Defaults to False.
+            cpu_affinity (bool | list[int], optional): When forking workers, pin each worker to one CPU with
+                os.sched_setaffinity. True cycles through the CPUs available to the process, a list selects the CPUs
+                to cycle through. Defaults to False.
+            compression (bool | Compressor, optional): Compress response bodies (gzip or deflate) for clients that
+                send Accept-Encoding. Pass a Compressor to change the size threshold, level, compressible content
+                types or cache size. Defaults to True.
+            max_body_size (int | None, optional): The largest request body accepted, in bytes. Larger requests get a
+                413 Payload Too Large response. Defaults to None (no limit).
+            spool_threshold (int, optional): Request bodies larger than this (or chunked ones) are received into a
+                temporary file that is kept in memory up to this size and spooled to disk beyond it, and handlers read
+                them through a `stream` parameter (a file-like RequestStream). In "blocking" mode, large bodies are
+                instead read from the socket as the handler reads the stream. Defaults to 1 MiB.
+            max_header_size (int, optional): The longest request head (request line and headers) accepted, in bytes.
+                Defaults to 16 KiB.
+            max_headers (int, optional): The most header fields a request may have. Requests over either limit get a
+                431 Request Header Fields Too Large response. Defaults to 100.
+            max_queue (int | None, optional): The most connections (in "blocking" mode) or requests (in the other
+                modes) waiting for a thread of the pool. Past it, work is shed with a 503 Service Unavailable response.
+                None for no limit. Defaults to 1024.
+            queue_timeout (float | None, optional): Work that waited longer than this many seconds for a thread is
+                shed with a 503 instead of being served late. Defaults to None (no deadline).
+            queue_overflow (str, optional): What to shed when the queue is full. Defaults to "reject".
+                "reject": the new work.
+                "drop_oldest": the work that has waited longest, to make room for the new work.
+            retry_after (float, optional): The Retry-After (seconds) of 503 responses to shed work. Defaults to 1.
+            adaptive_concurrency (bool | AdaptiveLimiter, optional): Limit how many requests are handled at once
+                (per worker process) to a limit that adapts to handler latency: it grows while latency stays near
+                its recent minimum and shrinks when latency climbs. Requests over the limit get a 503 without their
+                handler being called. Pass an AdaptiveLimiter to change its bounds and sensitivity; the current limit
+                is `server.limiter.limit`. Defaults to False.
+            min_connection_threads (int, optional): The number of threads the pool keeps however idle it is.
+                Defaults to 1.
+            thread_idle_timeout (float | None, optional): The number of seconds a pool thread waits for work before it
+                retires. None keeps every thread started. Defaults to 60.
+            thread_scale_up_wait (float, optional): When no thread is idle, another one is started once queued work
+                has waited this many seconds (or once more work is queued than there are threads). 0 starts one as
+                soon as work has to wait. Defaults to 0.
+            classify (Callable[[Request], int | None] | None, optional): Assigns requests a priority class (e.g.
+                Priority.HIGH for requests with a certain header). Requests it returns None for, or all requests
+                without it, get the `priority` tag of their handler, or Priority.NORMAL. Constant handlers (health
+                checks) and the API docs default to Priority.HIGH. When requests wait for the thread pool, higher
+                classes are served first. Only the "selector" and "asyncio" modes dispatch requests; "blocking" mode
+                dispatches connections before their request is read, so they all share one class. Defaults to None.
+            priority_aging (float | None, optional): Work that waited longer than this many seconds for a thread is
+                served before higher classes, so they can't starve it. None for strict priorities. Defaults to 1.
+            rate_limit (RateLimiter | None, optional): Limits the request rate of each client (per worker process),
+                answering requests over it with 429 Too Many Requests and Retry-After. When it tells clients apart
+                by address, requests are rejected before they are parsed, and in "blocking" mode connections are
+                turned away before they are dispatched. When it uses a header (e.g. an API key), they are rejected
+                before their body is received. Routes can have their own limit with `@tag(rate_limit=RateLimiter(...))`.
+                Defaults to None (no limit).
         """
+        if mode not in self.modes:
+            raise ValueError(f"Invalid mode: {mode}. Options are {', '.join(map(repr, self.modes))}.")
+        if queue_overflow not in WorkQueue.overflow_policies:
+            raise ValueError(f"Invalid queue_overflow: {queue_overflow}. Options are "
+                             f"{', '.join(map(repr, WorkQueue.overflow_policies))}.")
+
         if isinstance(routes, type):
             routes = routes()
 
@@ -81,11 +217,48 @@ class Server(socket.socket):
         self.backlog = backlog
         self.chunk_size = chunk_size
         self.num_connection_threads = num_connection_threads
+        self.min_connection_threads = min_connection_threads
+        self.thread_idle_timeout = thread_idle_timeout
+        self.thread_scale_up_wait = thread_scale_up_wait
+        self.classify = classify
+        self.priority_aging = priority_aging
+        self.rate_limit = rate_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.queue_overflow = queue_overflow
+        self.retry_after = retry_after
+        self.adaptive_concurrency = adaptive_concurrency
+        if adaptive_concurrency is True:
+            self.limiter = AdaptiveLimiter(initial_limit=max(num_connection_threads, AdaptiveLimiter.default_initial_limit),
+                                           retry_after=retry_after)
+        else:
+            self.limiter = adaptive_concurrency or None
         if self.num_connection_threads > 1:
-            self.thread_pool_executor = None
+            self.thread_pool_executor = WorkQueue(self.num_connection_threads,
+                                                  max_queue=max_queue,
+                                                  queue_timeout=queue_timeout,
+                                                  overflow=queue_overflow,
+                                                  retry_after=retry_after,
+                                                  min_workers=min_connection_threads,
+                                                  idle_timeout=thread_idle_timeout,
+                                                  scale_up_wait=thread_scale_up_wait,
+                                                  priority_aging=priority_aging)
         else:
-            from concurrent.futures import ThreadPoolExecutor
-            self.thread_pool_executor = ThreadPoolExecutor(max_workers=self.num_connection_threads)
+            self.thread_pool_executor = None
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.mode = mode
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.cpu_affinity = cpu_affinity
+        self.compression = compression
+        self.compressor = Compressor() if compression is True else None if compression is False else compression
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.buffer_pool = None
+        self.worker_pids = []
         self.pause_sleep = pause_sleep
         self.accept_sleep = accept_sleep
         self.init_socket_options = socket_options
@@ -140,13 +313,33 @@ class Server(socket.socket):
             self.server_thread = t
             return t, self.cleanup_event, self.pause_event
 
-        self.bind((self.host, self.port))
-        self.listen(self.backlog)
+        if self.workers > 1 and self.reuse_port:
+            # every worker binds its own listener
+            pass
+        else:
+            self.bind((self.host, self.port))
+            self.listen(self.backlog)
         logger.info("Serving HTTP on port " + str(self.port) + "...")
         logger.info(f"Press Ctrl+C to stop the server.")
         logger.info(f"Go to http://{self.host or 'localhost'}:{self.port}/swagger to see documentation.")
         logger.info(f"Go to http://{self.host or 'localhost'}:{self.port}/api for an api playground.")
 
+        if self.workers > 1:
+            return self.serve_workers(cleanup_event, pause_event)
+        return self.serve_connections(cleanup_event, pause_event)
+
+    def serve_connections(self, cleanup_event=None, pause_event=None) -> None:
+        """Serves connections on the listening socket with the configured mode."""
+        # every worker process gets its own pool of receive buffers, sized to the listener's receive buffer
+        self.buffer_pool = BufferPool.for_socket(self)
+        if self.mode == "selector":
+            return self.serve_selector(cleanup_event, pause_event)
+        if self.mode == "asyncio":
+            return asyncio.run(self.serve_asyncio(cleanup_event, pause_event))
+        return self.serve_blocking(cleanup_event, pause_event)
+
+    def serve_blocking(self, cleanup_event=None, pause_event=None) -> None:
+        """Accepts one connection at a time and handles it inline or on the thread pool."""
         while cleanup_event is None or (not cleanup_event.is_set()):
             if self.pause_sleep and pause_event is not None:
                 while pause_event.is_set() and (cleanup_event is None or (not cleanup_event.is_set())):
@@ -155,25 +348,344 @@ class Server(socket.socket):
                 time.sleep(self.accept_sleep)
             connection = self.accept_connection()
 
+            if (e := connection.over_rate_limit()) is not None:
+                connection.shed(e)
+                continue
             # handle connection
             if self.thread_pool_executor:
-                self.thread_pool_executor.submit(connection.handle)
+                try:
+                    future = self.thread_pool_executor.submit(connection.handle)
+                except Overloaded as e:
+                    connection.shed(e)
+                else:
+                    future.add_done_callback(partial(self.shed_if_overloaded, connection))
             else:
                 connection.handle()
 
+    @staticmethod
+    def shed_if_overloaded(connection: Connection, future) -> None:
+        """Answers a connection that was shed from the dispatch queue (dropped or expired) with a 503."""
+        if not future.cancelled() and isinstance(future.exception(), Overloaded):
+            connection.shed(future.exception())
+
+    def serve_workers(self, cleanup_event=None, pause_event=None) -> None:
+        """Forks the worker processes and supervises them, replacing any worker that dies, until cleanup.
+
+        Run from the main thread, SIGINT (Ctrl+C) and SIGTERM count as cleanup: the workers are terminated and
+        joined, and serve returns instead of raising KeyboardInterrupt.
+        """
+        workers = {}
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            if cleanup_event is None:
+                cleanup_event = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous_handlers[signum] = signal.signal(signum, lambda signum, frame: cleanup_event.set())
+
+        def spawn(i: int):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    self.init_worker(i)
+                    self.serve_connections(None, pause_event)
+                except KeyboardInterrupt:
+                    pass
+                except Exception as e:
+                    logger.exception(e)
+                    code = 1
+                finally:
+                    os._exit(code)
+            workers[pid] = i, time.monotonic()
+            logger.info(f"Started worker {i} (pid {pid})")
+
+        for i in range(self.workers):
+            spawn(i)
+        self.worker_pids = list(workers)
+        try:
+            while cleanup_event is None or (not cleanup_event.is_set()):
+                pid, status = os.waitpid(-1, os.WNOHANG) if cleanup_event is not None else os.waitpid(-1, 0)
+                if pid == 0:
+                    time.sleep(self.pause_sleep or 0.1)
+                    continue
+                if pid not in workers:
+                    continue
+                i, started = workers.pop(pid)
+                if cleanup_event is not None and cleanup_event.is_set():
+                    # it exited on the same Ctrl+C that stops the server
+                    break
+                if time.monotonic() - started < self.min_worker_uptime:
+                    raise RuntimeError(f"Worker {i} (pid {pid}) exited with status {status} right after starting")
+                logger.warning(f"Worker {i} (pid {pid}) exited with status {status}, restarting it")
+                spawn(i)
+                self.worker_pids = list(workers)
+        finally:
+            for pid in workers:
+                with suppress(ProcessLookupError):
+                    os.kill(pid, signal.SIGTERM)
+            for pid in workers:
+                with suppress(ChildProcessError):
+                    os.waitpid(pid, 0)
+            self.worker_pids = []
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            logger.info("Stopped all workers")
+
+    def init_worker(self, i: int) -> None:
+        """Sets up worker process number i: its own SO_REUSEPORT listener and CPU pinning, if configured."""
+        if self.reuse_port:
+            listener = socket.socket(self.family, self.type)
+            for level, options in (self.init_socket_options or {}).items():
+                for option, value in options.items():
+                    listener.setsockopt(level, option, value)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            listener.bind((self.host, self.port))
+            listener.listen(self.backlog)
+            # point this process's copy of the server socket at the new listener
+            os.dup2(listener.fileno(), self.fileno())
+            listener.close()
+        if self.cpu_affinity and hasattr(os, "sched_setaffinity"):
+            cpus = self.cpu_affinity if isinstance(self.cpu_affinity, (list, tuple)) else sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(0, {cpus[i % len(cpus)]})
+
     def accept_connection(self) -> Connection:
         """Accepts a connection and returns a Connection object."""
         client_connection, client_address = self.accept()
         connection = Connection(self.handler, client_connection, client_address,
                                 cleanup_event=self.cleanup_event,
-                                chunk_size=self.chunk_size)
+                                chunk_size=self.chunk_size,
+                                keep_alive_timeout=self.keep_alive_timeout if self.thread_pool_executor else None,
+                                max_keep_alive_requests=self.max_keep_alive_requests,
+                                compressor=self.compressor,
+                                max_body_size=self.max_body_size,
+                                spool_threshold=self.spool_threshold,
+                                max_header_size=self.max_header_size,
+                                max_headers=self.max_headers,
+                                buffer_pool=self.buffer_pool,
+                                limiter=self.limiter,
+                                classify=self.classify,
+                                rate_limiter=self.rate_limit)
         return connection
 
+    def serve_selector(self, cleanup_event=None, pause_event=None) -> None:
+        """Serves every connection from one selectors event loop.
+
+        The listening socket and all client sockets are non-blocking and registered with a selector. Connections
+        only occupy memory while idle or slow; a request is dispatched to the handler once it is completely received.
+        """
+        import queue
+        import selectors
+
+        selector = selectors.DefaultSelector()
+        self.setblocking(False)
+        selector.register(self, selectors.EVENT_READ)
+
+        # handler threads hand finished responses (and streamed chunks) back to the event loop as calls to make on it,
+        # and wake it through a socket pair
+        completed = queue.SimpleQueue()
+        wake_r, wake_w = socket.socketpair()
+        wake_r.setblocking(False)
+        selector.register(wake_r, selectors.EVENT_READ)
+
+        connections: set[SelectorConnection] = set()
+        timeout = min(1.0, self.keep_alive_timeout or 1.0)
+        next_sweep = time.monotonic() + timeout
+
+        def handle(connection: SelectorConnection, request):
+            try:
+                return connection.handle_request(request)
+            except Exception as e:
+                logger.exception(e)
+                return ErrorResponse(version=request.version)
+
+        def call_soon(fn, *args):
+            """Makes the event loop call fn(*args). Thread-safe."""
+            completed.put(partial(fn, *args))
+            wake_w.send(b'\0')
+
+        def run_handler(connection: SelectorConnection, request):
+            call_soon(respond, connection, handle(connection, request))
+
+        def shed(connection: SelectorConnection, request, future):
+            # dropped from the queue or expired in it: answer 503 from the event loop
+            if not future.cancelled() and isinstance(future.exception(), Overloaded):
+                call_soon(respond, connection, connection.error_response(future.exception(), request))
+
+        def produce(connection: SelectorConnection, chunks):
+            # streamed bodies are produced by the pool, one chunk at a time, as a generator may be slow
+            try:
+                future = self.thread_pool_executor.submit_with_priority(Priority.HIGH, next, chunks, b'')
+            except Overloaded:
+                call_soon(chunk_ready, connection, chunks, produce_here(chunks))
+            else:
+                future.add_done_callback(partial(call_soon, chunk_ready, connection, chunks))
+
+        def produce_here(chunks) -> Future:
+            # the response is already under way, so rather than cutting it short when the pool sheds the work of
+            # producing a chunk, the loop produces it
+            future = Future()
+            try:
+                future.set_result(next(chunks, b''))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        def chunk_ready(connection: SelectorConnection, chunks, future):
+            if future.cancelled():
+                connection.close()
+            elif isinstance(future.exception(), Overloaded):
+                connection.produced(produce_here(chunks))
+            else:
+                connection.produced(future)
+            if connection.state == connection.CLOSED:
+                connections.discard(connection)
+            else:
+                flush(connection)
+
+        def dispatch(connection: SelectorConnection, request):
+            if isinstance(request, Response):
+                # rejected before its body was received
+                respond(connection, request)
+            elif self.thread_pool_executor:
+                try:
+                    future = self.thread_pool_executor.submit_with_priority(connection.priority(request),
+                                                                            run_handler, connection, request)
+                except Overloaded as e:
+                    respond(connection, connection.error_response(e, request))
+                else:
+                    future.add_done_callback(partial(shed, connection, request))
+            else:
+                respond(connection, handle(connection, request))
+
+        def respond(connection: SelectorConnection, response):
+            if connection.state == connection.CLOSED:
+                return
+            connection.set_response(response)
+            flush(connection)
+
+        def flush(connection: SelectorConnection):
+            """Writes what it can of the response, then waits for the socket to take more, or for the next chunk."""
+            if connection.write():
+                written(connection)
+            elif not connection.producing and connection.state != connection.CLOSED:
+                selector.register(connection.socket, selectors.EVENT_WRITE, connection)
+
+        def written(connection: SelectorConnection):
+            if connection.state == connection.CLOSED:
+                connections.discard(connection)
+                return
+            # a pipelined request may already be buffered
+            request = connection.next_request()
+            if request is not None:
+                dispatch(connection, request)
+            elif connection.state == connection.CLOSED:
+                connections.discard(connection)
+            else:
+                selector.register(connection.socket, selectors.EVENT_READ, connection)
+
+        try:
+            while cleanup_event is None or (not cleanup_event.is_set()):
+                if self.pause_sleep and pause_event is not None and pause_event.is_set():
+                    time.sleep(self.pause_sleep)
+                    continue
+                for key, events in selector.select(timeout):
+                    if key.fileobj is self:
+                        while True:
+                            try:
+                                client_connection, client_address = self.accept()
+                            except (BlockingIOError, InterruptedError):
+                                break
+                            connection = SelectorConnection(self.handler, client_connection, client_address,
+                                                            cleanup_event=cleanup_event,
+                                                            chunk_size=self.chunk_size,
+                                                            keep_alive_timeout=self.keep_alive_timeout,
+                                                            max_keep_alive_requests=self.max_keep_alive_requests,
+                                                            compressor=self.compressor,
+                                                            max_body_size=self.max_body_size,
+                                                            spool_threshold=self.spool_threshold,
+                                                            max_header_size=self.max_header_size,
+                                                            max_headers=self.max_headers,
+                                                            buffer_pool=self.buffer_pool,
+                                                            limiter=self.limiter,
+                                                            classify=self.classify,
+                                                            rate_limiter=self.rate_limit,
+                                                            produce=produce if self.thread_pool_executor else None)
+                            connections.add(connection)
+                            selector.register(client_connection, selectors.EVENT_READ, connection)
+                    elif key.fileobj is wake_r:
+                        with suppress(BlockingIOError):
+                            wake_r.recv(4096)
+                        while not completed.empty():
+                            completed.get()()
+                    else:
+                        connection = key.data
+                        if events & selectors.EVENT_READ:
+                            request = connection.read()
+                            if connection.state == connection.CLOSED:
+                                selector.unregister(key.fileobj)
+                                connections.discard(connection)
+                            elif request is not None:
+                                selector.unregister(key.fileobj)
+                                dispatch(connection, request)
+                        elif events & selectors.EVENT_WRITE:
+                            if connection.write():
+                                selector.unregister(key.fileobj)
+                                written(connection)
+                            elif connection.producing:
+                                selector.unregister(key.fileobj)
+
+                now = time.monotonic()
+                if now >= next_sweep:
+                    next_sweep = now + timeout
+                    for connection in [c for c in connections if c.is_idle(now)]:
+                        selector.unregister(connection.socket)
+                        connection.close()
+                        connections.discard(connection)
+        finally:
+            for connection in connections:
+                connection.close()
+            selector.close()
+            wake_r.close()
+            wake_w.close()
+
+    async def serve_asyncio(self, cleanup_event=None, pause_event=None) -> None:
+        """Serves connections on the already bound server socket with asyncio streams."""
+        async def client_connected(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            while pause_event is not None and pause_event.is_set():
+                await asyncio.sleep(self.pause_sleep or 0.1)
+            connection = AsyncConnection(self.handler, reader, writer,
+                                         cleanup_event=cleanup_event,
+                                         executor=self.thread_pool_executor,
+                                         keep_alive_timeout=self.keep_alive_timeout,
+                                         max_keep_alive_requests=self.max_keep_alive_requests,
+                                         compressor=self.compressor,
+                                         max_body_size=self.max_body_size,
+                                         spool_threshold=self.spool_threshold,
+                                         max_header_size=self.max_header_size,
+                                         max_headers=self.max_headers,
+                                         buffer_pool=self.buffer_pool,
+                                         limiter=self.limiter,
+                                         classify=self.classify,
+                                         rate_limiter=self.rate_limit)
+            await connection.handle()
+
+        self.setblocking(False)
+        # readuntil gives up on a request head once more than max_header_size is buffered without its end
+        limit = self.max_header_size + len(Connection.end_of_header)
+        server = await asyncio.start_server(client_connected, sock=self, limit=limit)
+        async with server:
+            while cleanup_event is None or (not cleanup_event.is_set()):
+                await asyncio.sleep(self.pause_sleep or 0.1)
+
     def close(self) -> None:
         """Closes the server socket."""
         if self.server_thread:
             self.cleanup_event.set()
-            self.server_thread.join()
+            # asyncio closes the socket it served from the server thread itself when it stops
+            if self.server_thread is not threading.current_thread():
+                self.server_thread.join()
         super().close()
 
     def __repr__(self) -> str:
@@ -189,12 +701,56 @@ class Server(socket.socket):
                 r += f"{self.chunk_size=}, "
             if self.num_connection_threads != self.default_num_connection_threads:
                 r += f"{self.num_connection_threads=}, "
+            if self.min_connection_threads != self.default_min_connection_threads:
+                r += f"{self.min_connection_threads=}, "
+            if self.thread_idle_timeout != self.default_thread_idle_timeout:
+                r += f"{self.thread_idle_timeout=}, "
+            if self.thread_scale_up_wait != self.default_thread_scale_up_wait:
+                r += f"{self.thread_scale_up_wait=}, "
             if self.init_socket_options != self.default_socket_options:
                 r += f"{self.init_socket_options=}, "
             if self.pause_sleep != self.default_pause_sleep:
                 r += f"{self.pause_sleep=}, "
             if self.accept_sleep != self.default_accept_sleep:
                 r += f"{self.accept_sleep=}, "
+            if self.keep_alive_timeout != self.default_keep_alive_timeout:
+                r += f"{self.keep_alive_timeout=}, "
+            if self.max_keep_alive_requests != self.default_max_keep_alive_requests:
+                r += f"{self.max_keep_alive_requests=}, "
+            if self.mode != self.default_mode:
+                r += f"{self.mode=}, "
+            if self.workers != self.default_workers:
+                r += f"{self.workers=}, "
+            if self.reuse_port != self.default_reuse_port:
+                r += f"{self.reuse_port=}, "
+            if self.cpu_affinity != self.default_cpu_affinity:
+                r += f"{self.cpu_affinity=}, "
+            if self.compression is not self.default_compression:
+                r += f"{self.compression=}, "
+            if self.max_body_size != self.default_max_body_size:
+                r += f"{self.max_body_size=}, "
+            if self.spool_threshold != self.default_spool_threshold:
+                r += f"{self.spool_threshold=}, "
+            if self.max_header_size != self.default_max_header_size:
+                r += f"{self.max_header_size=}, "
+            if self.max_headers != self.default_max_headers:
+                r += f"{self.max_headers=}, "
+            if self.max_queue != self.default_max_queue:
+                r += f"{self.max_queue=}, "
+            if self.queue_timeout != self.default_queue_timeout:
+                r += f"{self.queue_timeout=}, "
+            if self.queue_overflow != self.default_queue_overflow:
+                r += f"{self.queue_overflow=}, "
+            if self.retry_after != self.default_retry_after:
+                r += f"{self.retry_after=}, "
+            if self.adaptive_concurrency is not self.default_adaptive_concurrency:
+                r += f"{self.adaptive_concurrency=}, "
+            if self.classify is not self.default_classify:
+                r += f"{self.classify=}, "
+            if self.priority_aging != self.default_priority_aging:
+                r += f"{self.priority_aging=}, "
+            if self.rate_limit is not self.default_rate_limit:
+                r += f"{self.rate_limit=}, "
             r = r.rstrip(", ")
             r += ")>"
             self._rep = r
@@ -25,6 +25,13 @@ def private(handler):
     return handler
 
 
+def constant(handler):
+    """Marks a handler whose response never changes (e.g. a health check): it is called once, and its response is
+    encoded once and sent as the same bytes to every later request."""
+    tag(handler, constant=True)
+    return handler
+
+
 def allowed_methods(*methods: str):
     def decorator(handler, route: str = None, error_mode: str = None, openapi: dict = None):
         if isinstance(handler, str) and route is None:
@@ -1,21 +1,41 @@
+import asyncio
+import contextlib
 import dataclasses
-import datetime
+import io
+import itertools
 import json
+import math
+import os
+import secrets
 import socket
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from collections.abc import AsyncIterator, Iterator
 from pathlib import Path
 
 
 class HTTPVersion(str):
-    """Represents an HTTP version string."""
+    """Represents an HTTP version string. The known versions are interned, so HTTPVersion("HTTP/1.1") returns
+    HTTPVersion.HTTP_1_1 instead of a new object."""
+    __slots__ = ()
+    _interned: dict[str, "HTTPVersion"] = {}
     HTTP_0_9 = "HTTP/0.9"
     HTTP_1_0 = "HTTP/1.0"
     HTTP_1_1 = "HTTP/1.1"
     HTTP_2_0 = "HTTP/2.0"
     HTTP_3_0 = "HTTP/3.0"
 
+    def __new__(cls, value: str = ""):
+        interned = cls._interned.get(value)
+        if interned is not None:
+            return interned
+        return super().__new__(cls, value)
+
 
 class HTTPMethod(str):
-    """Represents an HTTP method string."""
+    """Represents an HTTP method string. The standard methods are interned like HTTPVersions."""
+    __slots__ = ()
+    _interned: dict[str, "HTTPMethod"] = {}
     GET = "GET"
     HEAD = "HEAD"
     POST = "POST"
@@ -26,21 +46,190 @@ class HTTPMethod(str):
     TRACE = "TRACE"
     PATCH = "PATCH"
 
+    def __new__(cls, value: str = ""):
+        interned = cls._interned.get(value)
+        if interned is not None:
+            return interned
+        return super().__new__(cls, value)
+
+
+for cls in (HTTPVersion, HTTPMethod):
+    for k, v in list(vars(cls).items()):
+        if k.isupper():
+            cls._interned[v] = str.__new__(cls, v)
+            setattr(cls, k, cls._interned[v])
+
+
 class Body(bytes):
+    __slots__ = ()
     EMPTY = b""
 
 class RequestBody(Body):
-    pass
+    __slots__ = ()
+
+
+class HeadersTooLarge(ValueError):
+    """Raised when a request head is longer, or has more header fields, than the server allows."""
+    status_code = 431
 
 
 class Headers(dict):
+    """HTTP header fields, looked up case-insensitively.
+
+    Keys keep the casing they were first set with (the canonical casing for common fields). A field that is repeated,
+    like Set-Cookie, keeps every value: get_all returns them all, to_string writes each on its own line, and the
+    plain dict value is them combined (with "; " for Cookie, ", " otherwise).
+    """
+    __slots__ = ("_keys", "_multi")
     EMPTY = {}
+    common_names = (
+        "Accept", "Accept-Encoding", "Accept-Language", "Accept-Ranges", "Authorization", "Cache-Control",
+        "Connection", "Content-Disposition", "Content-Encoding", "Content-Length", "Content-Range", "Content-Type",
+        "Cookie", "Date", "ETag", "Expect", "Host", "If-Match", "If-Modified-Since", "If-None-Match", "If-Range",
+        "Keep-Alive", "Last-Modified", "Location", "Origin", "Range", "Referer", "Sec-Fetch-Dest", "Sec-Fetch-Mode",
+        "Sec-Fetch-Site", "Set-Cookie", "Transfer-Encoding", "Upgrade", "User-Agent", "Vary", "X-Forwarded-For",
+        "X-Forwarded-Proto", "X-Requested-With",
+    )
+    separators = {"cookie": "; "}
+    max_cached_names = 512
+    # raw field name -> (interned key, lowercase key), so common names are neither decoded nor lowercased per request
+    _names: dict[bytes, tuple[str, str]] = {}
+
+    def __init__(self, fields=(), **kwargs):
+        super().__init__()
+        self._keys: dict[str, str] = {}
+        self._multi: dict[str, list[str]] = {}
+        if isinstance(fields, Headers):
+            for key, value in fields.items():
+                self.set(key, value)
+            self._multi = {k: list(v) for k, v in fields._multi.items()}
+        elif fields:
+            self.update(fields)
+        if kwargs:
+            self.update(kwargs)
+
+    @classmethod
+    def parse(cls, data: bytes, max_count: int | None = None) -> "Headers":
+        """Parses header lines (without the request line) in one pass. Raises ValueError for a malformed line and
+        HeadersTooLarge past max_count fields."""
+        headers = cls()
+        names = cls._names
+        count = 0
+        for line in data.split(b"\n"):
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            if not line:
+                continue
+            count += 1
+            if max_count is not None and count > max_count:
+                raise HeadersTooLarge(f"Request has more than {max_count} header fields")
+            name, sep, value = line.partition(b":")
+            if not sep:
+                # checked before the cache, which would otherwise take a bare known name (e.g. "Host") for a field
+                raise ValueError(f"Malformed header line {line[:64]!r}")
+            interned = names.get(name)
+            if interned is None:
+                # no whitespace is allowed in field names, which also rules out (obsolete) continuation lines
+                if not name or b" " in name or b"\t" in name:
+                    raise ValueError(f"Malformed header line {line[:64]!r}")
+                key = name.decode()
+                interned = key, key.lower()
+                if len(names) < cls.max_cached_names:
+                    names[bytes(name)] = interned
+            headers.add(interned[0], value.strip().decode(), interned[1])
+        return headers
+
+    def add(self, key: str, value: str, lower: str | None = None) -> None:
+        """Adds a value for the field, keeping the ones it already has."""
+        if lower is None:
+            lower = key.lower()
+        existing = self._keys.get(lower)
+        if existing is None:
+            self._keys[lower] = key
+            dict.__setitem__(self, key, value)
+            return
+        values = self._multi.setdefault(lower, [dict.__getitem__(self, existing)])
+        values.append(value)
+        dict.__setitem__(self, existing, self.separators.get(lower, ", ").join(values))
+
+    def get_all(self, key: str) -> list[str]:
+        """Every value of the field, in the order they were added."""
+        lower = key.lower()
+        if lower in self._multi:
+            return list(self._multi[lower])
+        existing = self._keys.get(lower)
+        return [] if existing is None else [dict.__getitem__(self, existing)]
+
+    def set(self, key: str, value: str) -> None:
+        lower = key.lower()
+        existing = self._keys.get(lower)
+        if existing is not None and existing != key:
+            dict.__delitem__(self, existing)
+        self._keys[lower] = key
+        self._multi.pop(lower, None)
+        dict.__setitem__(self, key, value)
+
+    __setitem__ = set
+
+    def __getitem__(self, key: str) -> str:
+        existing = self._keys.get(key.lower()) if isinstance(key, str) else None
+        if existing is None:
+            raise KeyError(key)
+        return dict.__getitem__(self, existing)
+
+    def __delitem__(self, key: str) -> None:
+        existing = self._keys.pop(key.lower(), None) if isinstance(key, str) else None
+        if existing is None:
+            raise KeyError(key)
+        self._multi.pop(key.lower(), None)
+        dict.__delitem__(self, existing)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and key.lower() in self._keys
+
+    def get(self, key: str, default=None):
+        existing = self._keys.get(key.lower()) if isinstance(key, str) else None
+        return default if existing is None else dict.__getitem__(self, existing)
+
+    def pop(self, key: str, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def setdefault(self, key: str, default: str = None):
+        if key not in self:
+            self.set(key, default)
+        return self[key]
+
+    def update(self, fields=(), **kwargs) -> None:
+        items = fields.items() if hasattr(fields, "items") else fields
+        for key, value in itertools.chain(items, kwargs.items()):
+            self.set(key, value)
+
+    def clear(self) -> None:
+        super().clear()
+        self._keys.clear()
+        self._multi.clear()
+
+    def copy(self) -> "Headers":
+        return Headers(self)
+
+    def fields(self):
+        """(key, value) of every field line, with repeated fields once per value."""
+        for key, value in self.items():
+            values = self._multi.get(key.lower())
+            if values is None:
+                yield key, value
+            else:
+                for v in values:
+                    yield key, v
 
     def to_string(self) -> str:
-        s = ""
-        for k, v in self.items():
-            s += f"{k}: {v}\n"
-        return s
+        return "".join([f"{k}: {v}\r\n" for k, v in self.fields()])
 
     def __str__(self):
         return self.to_string()
@@ -49,7 +238,12 @@ class Headers(dict):
         return self.to_string().encode()
 
 
+Headers._names.update({n.lower().encode(): (n, n.lower()) for n in Headers.common_names})
+Headers._names.update({n.encode(): (n, n.lower()) for n in Headers.common_names})
+
+
 class HeaderBytes(bytes):
+    __slots__ = ()
     EMPTY = b""
 
     def __new__(cls, s: bytes | Headers | dict[str, str]):
@@ -63,16 +257,14 @@ class HeaderBytes(bytes):
         return self.decode()
 
     def to_dict(self) -> dict:
-        lines = self.decode().splitlines()
-        items = [v.split(":", 1) for v in lines]
-        d = {k.strip(): v.strip() for k, v in items}
-        return Headers(d)
+        return Headers.parse(self)
 
     def __iter__(self):
         return iter(self.to_dict())
 
 
 class RequestPath(str):
+    __slots__ = ()
     EMPTY = ""
     BASE = "/"
 
@@ -89,17 +281,17 @@ class RequestPath(str):
         return p
 
     def query_args(self) -> dict[str, str]:
-        """Extracts the query string from the path and parses into a dictionary."""
+        """Extracts the query string from the path and parses into a dictionary (a Query)."""
         q = self.query()
         if not q:
             return {}
-        items = [v.split("=", 1) for v in q.split("&")]
-        d = {url_decode(k): url_decode(v) for k, v in items}
-        return d
+        return Query.parse(q)
 
 
 class ClientAddr(str):
     def __new__(cls, host_port: str | tuple[str, int]):
+        if isinstance(host_port, ClientAddr):
+            return host_port
         if isinstance(host_port, tuple):
             host = host_port[0]
             port = host_port[1]
@@ -112,15 +304,110 @@ class ClientAddr(str):
         return self
 
 
+class PayloadTooLarge(ValueError):
+    """Raised when a request body is larger than the server's max_body_size."""
+    status_code = 413
+
+
+class MissingParameter(ValueError):
+    """Raised when a request gives no value for a parameter of its handler that has no default."""
+    status_code = 400
+
+
+class RequestStream(io.RawIOBase):
+    """A file-like, read-only view of a request body that is read on demand.
+
+    Depending on the serving mode, the chunks come straight from the socket (so an upload is only received as fast
+    as the handler reads it) or from the temporary file the server spooled the body to.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, chunks=(), length: int | None = None):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+        self.length = length
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RequestStream":
+        return cls((data,) if data else (), len(data))
+
+    @classmethod
+    def from_file(cls, f, length: int | None = None) -> "RequestStream":
+        """A stream of the rest of the (already seeked) file-like object, which is closed at the end."""
+        def chunks():
+            try:
+                while chunk := f.read(cls.chunk_size):
+                    yield chunk
+            finally:
+                f.close()
+        return cls(chunks(), length)
+
+    def readable(self) -> bool:
+        return True
+
+    def next_chunk(self) -> bool:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._pending = memoryview(chunk)
+        return True
+
+    def readinto(self, b) -> int:
+        if not self.next_chunk():
+            return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def readall(self) -> bytes:
+        parts = [bytes(self._pending)] if self._pending else []
+        self._pending = memoryview(b"")
+        parts.extend(self._chunks)
+        return b"".join(parts)
+
+    def __iter__(self):
+        """Iterates over the body in chunks as they arrive (rather than line by line)."""
+        while self.next_chunk():
+            chunk, self._pending = bytes(self._pending), memoryview(b"")
+            yield chunk
+
+    def drain(self, limit: int | None = None) -> bool:
+        """Reads and discards the rest of the body. Returns False if more than limit bytes were left."""
+        drained = len(self._pending)
+        self._pending = memoryview(b"")
+        for chunk in self._chunks:
+            drained += len(chunk)
+            if limit is not None and drained > limit:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}(length={self.length})>"
+
+
+_UNPARSED = object()
+
+
 class Request:
+    __slots__ = ("method", "version", "connection_socket", "_path", "_route", "_query", "_header_bytes", "_headers",
+                 "_body", "_stream", "_json", "_form", "_client_addr", "_resolved")
+    loose_json_content_types = ("", "application/x-www-form-urlencoded", "text/plain")
+
     @classmethod
-    def from_components(cls, pre_body_bytes: bytes, body: bytes, client_addr: str | tuple[str, int], connection_socket: socket.socket = None) -> "Request":
-        """Create a Request object from a header string and a body bytes object."""
-        i = pre_body_bytes.index(b"\r\n")
-        first_line = pre_body_bytes[:i].decode()
-        method, path, version = first_line.split(" ")
-        header_bytes = pre_body_bytes[i + 2:]
-        return cls(method, path, version, header_bytes, body, client_addr, connection_socket)
+    def from_components(cls, pre_body_bytes: bytes, body: bytes, client_addr: str | tuple[str, int], connection_socket: socket.socket = None,
+                        stream: RequestStream | None = None) -> "Request":
+        """Create a Request object from a header string and a body bytes object (or a stream of the body).
+        Only the request line is parsed here; the headers are parsed on first access."""
+        i = pre_body_bytes.find(b"\n")
+        first_line = pre_body_bytes if i == -1 else pre_body_bytes[:i]
+        method, path, version = first_line.rstrip(b"\r").decode().split(" ")
+        if not method or not path or not version.startswith("HTTP/"):
+            raise ValueError(f"Malformed request line {first_line[:64]!r}")
+        header_bytes = b"" if i == -1 else pre_body_bytes[i + 1:]
+        return cls(method, path, version, header_bytes, body, client_addr, connection_socket, stream)
 
     def __init__(self,
                  method: str | HTTPMethod = HTTPMethod.GET,
@@ -129,23 +416,142 @@ class Request:
                  header: bytes | HeaderBytes | Headers | dict[str, str] = HeaderBytes.EMPTY,
                  body: bytes | RequestBody = RequestBody.EMPTY,
                  client_addr: str | tuple[str, int] | None = None,
-                 connection_socket: socket.socket | None = None
+                 connection_socket: socket.socket | None = None,
+                 stream: RequestStream | None = None
                  ):
         self.method = HTTPMethod(method)
-        self.path = RequestPath(path)
+        self.path = path
         self.version = HTTPVersion(version)
-        self.header_bytes = HeaderBytes(header)
-        self._headers = None
-        self.body = RequestBody(body)
-        self.client_addr = ClientAddr(client_addr) if client_addr else None
+        # the raw header bytes are kept as they are, and only parsed (or wrapped in a HeaderBytes) on first access
+        if isinstance(header, dict):
+            self._header_bytes = None
+            self._headers = Headers(header)
+        else:
+            self._header_bytes = header
+            self._headers = None
+        self._body = (body if isinstance(body, bytes) else bytes(body)) if stream is None else None
+        self._stream = stream
+        self._json = self._form = _UNPARSED
+        self._client_addr = client_addr or None
         self.connection_socket = connection_socket
 
+    @property
+    def path(self) -> RequestPath:
+        return self._path
+
+    @path.setter
+    def path(self, path: str):
+        self._path = RequestPath(path)
+        self._route = None
+        self._query = None
+        # (route handler, what it resolved the request to), see RouteHandler.resolve
+        self._resolved = None
+
+    @property
+    def route(self) -> str:
+        """The path without the query string."""
+        if self._route is None:
+            self._route = self._path.route()
+        return self._route
+
+    @property
+    def query(self) -> "Query":
+        """The parsed query string. It is shared by everything that handles the request, so copy it to modify it."""
+        if self._query is None:
+            q = self._path.query()
+            self._query = Query.parse(q) if q else Query()
+        return self._query
+
+    @property
+    def content_type(self) -> str:
+        """The media type of the body, lowercase and without parameters ("" if there is no Content-Type)."""
+        return self.headers.get("Content-Type", "").partition(";")[0].strip().lower()
+
+    @property
+    def json(self):
+        """The body parsed as JSON, or None if it isn't JSON. Bodies with a JSON Content-Type are parsed, and so are
+        bodies that look like a JSON object with no, a form (what `curl -d` sends) or a text/plain Content-Type.
+        Parsed at most once, on first access."""
+        if self._json is _UNPARSED:
+            self._json = None
+            content_type = self.content_type
+            if content_type == "application/json" or content_type.endswith("+json") or (
+                    content_type in self.loose_json_content_types and self.body.lstrip()[:1] == b"{"):
+                try:
+                    self._json = json.loads(self.body)
+                except ValueError:
+                    pass
+        return self._json
+
+    @property
+    def form(self) -> "Query | None":
+        """The fields of an application/x-www-form-urlencoded body, or None for other bodies.
+        Parsed at most once, on first access."""
+        if self._form is _UNPARSED:
+            self._form = None
+            if self.content_type == "application/x-www-form-urlencoded" and self.json is None:
+                self._form = Query.parse(self.body.decode(errors="replace"))
+        return self._form
+
+    @property
+    def body(self) -> RequestBody:
+        """The whole body. For a streamed body, whatever the stream hasn't been read of yet is read into memory.
+        The received bytes are only wrapped in a RequestBody on first access."""
+        if self._body is None:
+            self._body = self._stream.read()
+        if not isinstance(self._body, RequestBody):
+            self._body = RequestBody(self._body)
+        return self._body
+
+    @body.setter
+    def body(self, body: bytes):
+        self._body = body if isinstance(body, RequestBody) else RequestBody(body)
+        self._stream = None
+        self._json = self._form = _UNPARSED
+
+    @property
+    def stream(self) -> RequestStream:
+        """The body as a file-like object, read on demand."""
+        if self._stream is None:
+            self._stream = RequestStream.from_bytes(self._body)
+        return self._stream
+
+    @stream.setter
+    def stream(self, stream: RequestStream):
+        self._stream = stream
+        self._body = None
+        self._json = self._form = _UNPARSED
+
     @property
     def headers(self) -> Headers:
         if self._headers is None:
-            self._headers = Headers(self.header_bytes.to_dict())
+            self._headers = Headers.parse(self._header_bytes)
+        return self._headers
+
+    @headers.setter
+    def headers(self, headers: Headers):
+        self._headers = headers
+        self._header_bytes = None
+
+    def parse_headers(self, max_count: int | None = None) -> Headers:
+        """Parses the header bytes now (instead of on first access), raising HeadersTooLarge past max_count fields."""
+        self._headers = Headers.parse(self._header_bytes or b"", max_count)
         return self._headers
 
+    @property
+    def header_bytes(self) -> HeaderBytes:
+        """The raw header bytes, or the headers serialized if the request was built from a dict. Wrapped (or
+        serialized) once, on first access."""
+        if not isinstance(self._header_bytes, HeaderBytes):
+            self._header_bytes = HeaderBytes(self._headers if self._header_bytes is None else self._header_bytes)
+        return self._header_bytes
+
+    @property
+    def client_addr(self) -> ClientAddr | None:
+        if self._client_addr is not None and not isinstance(self._client_addr, ClientAddr):
+            self._client_addr = ClientAddr(self._client_addr)
+        return self._client_addr
+
     def to_string(self) -> str:
         return f'{self.method} {self.path} {self.version}\r\n{self.headers}\r\n\r\n{self.body}'
 
@@ -164,7 +570,205 @@ class Request:
 
 
 class ResponseBody(Body):
-    pass
+    __slots__ = ()
+
+
+class FileBody:
+    """A response body backed by (a region of) a file on disk.
+
+    The file is only opened when the response is sent, so it is never held in memory as a whole:
+    it is sent with sendfile where possible, or read in chunks otherwise.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str | Path, offset: int = 0, length: int | None = None):
+        self.path = Path(path)
+        self.offset = offset
+        self.length = self.path.stat().st_size - offset if length is None else length
+
+    def open(self):
+        return self.path.open("rb")
+
+    def chunks(self, chunk_size: int | None = None):
+        """Yields the file region in chunks of at most chunk_size bytes."""
+        chunk_size = chunk_size or self.chunk_size
+        remaining = self.length
+        with self.open() as f:
+            f.seek(self.offset)
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def send(self, connection_socket: socket.socket) -> int:
+        """Sends the file region on a blocking socket, with os.sendfile where the platform supports it."""
+        if not self.length:
+            # a count of 0 would make socket.sendfile send the rest of the file
+            return 0
+        with self.open() as f:
+            return connection_socket.sendfile(f, self.offset, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def __bytes__(self):
+        return b"".join(self.chunks())
+
+    def __getitem__(self, item):
+        return bytes(self)[item]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}({self.path}, offset={self.offset}, length={self.length})>"
+
+
+class MultipartBody:
+    """A response body made of several parts (bytes or FileBody regions) sent one after the other."""
+
+    def __init__(self, parts: list[bytes | FileBody]):
+        self.parts = list(parts)
+
+    def __len__(self):
+        return sum(len(p) for p in self.parts)
+
+    def __bytes__(self):
+        return b"".join(bytes(p) for p in self.parts)
+
+    def __getitem__(self, item):
+        return bytes(self)[item]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}({len(self.parts)} parts, length={len(self)})>"
+
+
+class StreamBody:
+    """A response body produced incrementally by an iterator, async iterator or file-like object.
+
+    Chunks are sent as soon as they are produced, so the whole body is never held in memory: with Content-Length when
+    the length is known up front, otherwise with chunked transfer encoding (or by closing the connection for
+    HTTP/1.0 clients). str chunks are utf-8 encoded, empty chunks are skipped.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, source, length: int | None = None):
+        if hasattr(source, "read"):
+            source = self.read_chunks(source)
+        self.source = source
+        self.length = length
+        self.chunked = False
+
+    @classmethod
+    def read_chunks(cls, f):
+        """Yields the contents of a file-like object in chunks, closing it at the end."""
+        try:
+            while chunk := f.read(cls.chunk_size):
+                yield chunk
+        finally:
+            if hasattr(f, "close"):
+                f.close()
+
+    @staticmethod
+    def coalesce(pieces, size: int = chunk_size):
+        """Joins the (many, small) str or bytes pieces into bytes chunks of about size bytes."""
+        buffer, buffered = [], 0
+        for piece in pieces:
+            if isinstance(piece, str):
+                piece = piece.encode()
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= size:
+                yield b"".join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield b"".join(buffer)
+
+    @staticmethod
+    def encode(chunk) -> bytes:
+        if isinstance(chunk, str):
+            return chunk.encode()
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            return bytes(chunk)
+        raise TypeError(f"Streamed response chunks must be str or bytes, not {type(chunk).__name__}")
+
+    def is_async(self) -> bool:
+        return hasattr(self.source, "__aiter__")
+
+    def chunks(self):
+        """Yields the body's chunks as bytes. Async sources are driven by a private event loop."""
+        source = self.source
+        if self.is_async():
+            source = iterate_async(source)
+        for chunk in source:
+            chunk = self.encode(chunk)
+            if chunk:
+                yield chunk
+
+    def frame(self, chunk: bytes) -> bytes:
+        """The bytes to send for one chunk of the body."""
+        if self.chunked:
+            return b"%x\r\n%b\r\n" % (len(chunk), chunk)
+        return chunk
+
+    def framed(self):
+        """Yields the bytes to send, in chunked transfer encoding if chunked is set."""
+        for chunk in self.chunks():
+            yield self.frame(chunk)
+        if self.chunked:
+            yield b"0\r\n\r\n"
+
+    def close(self) -> None:
+        """Closes the source (e.g. when the body of a HEAD response is dropped)."""
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            close()
+        elif hasattr(self.source, "aclose"):
+            with contextlib.suppress(RuntimeError):
+                asyncio.run(self.source.aclose())
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError("The length of this StreamBody isn't known")
+        return self.length
+
+    def __bytes__(self):
+        return b"".join(self.chunks())
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}({self.source!r}, length={self.length})>"
+
+
+def iterate_async(aiterator):
+    """Iterates an async iterator from synchronous code on a private event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(aiterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        if hasattr(aiterator, "aclose"):
+            loop.run_until_complete(aiterator.aclose())
+        loop.close()
+
+
+def is_stream(body) -> bool:
+    """Whether a response body should be streamed: iterators, async iterators and file-like objects."""
+    return isinstance(body, (Iterator, AsyncIterator)) or (hasattr(body, "read") and not isinstance(body, (bytes, str)))
+
+
+_date: tuple[int, str] = (0, "")
+
+
+def http_date() -> str:
+    """The current time as an HTTP-date for the Date header (e.g. "Sat, 17 Oct 2026 03:50:44 GMT"), formatted at most
+    once a second."""
+    global _date
+    now = int(time.time())
+    if _date[0] != now:
+        _date = (now, formatdate(now, usegmt=True))
+    return _date[1]
 
 
 class HTTPStatusCode(int):
@@ -240,20 +844,36 @@ class HTTPStatusCode(int):
     NOT_EXTENDED = 510
     NETWORK_AUTHENTICATION_REQUIRED = 511
 
+    # reason phrases that aren't just the title-cased name
+    reasons = {200: "OK", 203: "Non-Authoritative Information", 207: "Multi-Status", 226: "IM Used",
+               418: "I'm a Teapot"}
+    # code -> the shared instance of every code above, filled in below
+    known: dict[int, "HTTPStatusCode"] = {}
+    # (version, code) -> encoded status line, for the codes above in HTTP/1.0 and HTTP/1.1
+    status_lines: dict[tuple[str, int], bytes] = {}
+
     def __new__(cls, status_code: int, phrase: str | None = None):
+        if phrase is None:
+            known = cls.known.get(status_code)
+            if known is not None:
+                return known
         self = super().__new__(cls, status_code)
         self._phrase = phrase
         return self
 
     def phrase(self) -> str:
-        if self._phrase is None:
-            for k, v in self.__class__.__dict__.items():
-                if v == self:
-                    self._phrase = k.replace("_", " ")
-                    break
-            else:
-                self._phrase = "Unknown"
-        return self._phrase
+        return self._phrase or "Unknown"
+
+    def reason(self) -> str:
+        """The reason phrase sent in the status line (e.g. "Not Found")."""
+        return self.reasons.get(self) or self.phrase().title()
+
+    def status_line(self, version: str = HTTPVersion.HTTP_1_1) -> bytes:
+        """The encoded status line, with its CRLF."""
+        line = self.status_lines.get((version, self))
+        if line is None:
+            line = f"{version} {int(self)} {self.reason()}\r\n".encode()
+        return line
 
     def is_informational(self) -> bool:
         return 100 <= self <= 199
@@ -274,9 +894,13 @@ class HTTPStatusCode(int):
         return f'{int(self)} {self.phrase()}'
 
 
-for k, v in HTTPStatusCode.__dict__.items():
+for k, v in list(HTTPStatusCode.__dict__.items()):
     if isinstance(v, int):
-        setattr(HTTPStatusCode, k, HTTPStatusCode(v, k.replace("_", " ")))
+        HTTPStatusCode.known[v] = HTTPStatusCode(v, k.replace("_", " "))
+        setattr(HTTPStatusCode, k, HTTPStatusCode.known[v])
+for v in HTTPStatusCode.known.values():
+    for version in (HTTPVersion.HTTP_1_0, HTTPVersion.HTTP_1_1):
+        HTTPStatusCode.status_lines[(version, v)] = v.status_line(version)
 
 
 class ResponseTypehint:
@@ -287,12 +911,16 @@ class ResponseTypehint:
 class ResponseType(type):
     def __getitem__(self, item):
         class TypedResponse(Response):
+            __slots__ = ()
             default_content_type = item
         return TypedResponse
 
 
 class Response(metaclass=ResponseType):
+    __slots__ = ("status_code", "version", "headers", "body")
     default_content_type = None
+    # body type -> the Response subclass that Response(body) creates, filled in on first use of each type
+    _body_classes: dict[type, type] = {}
 
     def __new__(cls, body: bytes | ResponseBody = ResponseBody.EMPTY,
                 status_code: int | HTTPStatusCode = HTTPStatusCode.OK,
@@ -305,19 +933,29 @@ class Response(metaclass=ResponseType):
 
         # Create an instance of the appropriate subclass based on the body type
         if cls is Response:
-            if isinstance(body, (bytes, memoryview)):
-                return super(Response, cls).__new__(cls)
-            elif isinstance(body, str):
-                return super(Response, HTMLResponse).__new__(HTMLResponse)
-            elif isinstance(body, Path):
-                return super(Response, FileResponse).__new__(FileResponse)
-            elif isinstance(body, Exception):
-                return super(Response, ErrorResponse).__new__(ErrorResponse)
-            else:
-                return super(Response, JSONResponse).__new__(JSONResponse)
+            response_class = Response._body_classes.get(type(body))
+            if response_class is None:
+                response_class = Response._body_classes[type(body)] = Response.class_for(type(body))
+            return super(Response, response_class).__new__(response_class)
         else:
             return super(Response, cls).__new__(cls)
 
+    @staticmethod
+    def class_for(body_type: type) -> type:
+        """The Response subclass that Response(body) creates for a body of this type."""
+        if issubclass(body_type, (bytes, memoryview)):
+            return Response
+        elif issubclass(body_type, str):
+            return HTMLResponse
+        elif issubclass(body_type, Path):
+            return FileResponse
+        elif issubclass(body_type, Exception):
+            return ErrorResponse
+        elif issubclass(body_type, (Iterator, AsyncIterator)) or hasattr(body_type, "read"):
+            return Response
+        else:
+            return JSONResponse
+
     def __init__(self,
                  body: bytes | ResponseBody = ResponseBody.EMPTY,
                  status_code: int | HTTPStatusCode = HTTPStatusCode.OK,
@@ -327,29 +965,107 @@ class Response(metaclass=ResponseType):
                  ):
         self.status_code = HTTPStatusCode(status_code)
         self.version = HTTPVersion(version)
-        self.header_bytes = HeaderBytes(headers)
-        self.headers = Headers(self.header_bytes.to_dict())
+        self.headers = Headers.parse(headers) if isinstance(headers, bytes) else Headers(headers)
         for k, v in headers_kwargs.items():
             t = k.replace("_", " ").title().replace(" ", "-")
             if not isinstance(v, str):
                 v = json.dumps(v)
             self.headers[t] = v
-        self.body = ResponseBody(body)
+        if isinstance(body, (bytes, FileBody, MultipartBody, StreamBody)):
+            self.body = body
+        elif is_stream(body):
+            self.body = StreamBody(body, length=int(self.headers["Content-Length"]) if "Content-Length" in self.headers else None)
+        else:
+            self.body = bytes(body)
+
+    @property
+    def header_bytes(self) -> HeaderBytes:
+        return HeaderBytes(self.headers)
 
     def pre_body_bytes(self) -> bytes:
-        return f'{self.version} {self.status_code}\r\n{self.headers}\r\n'.encode()
+        return self.status_code.status_line(self.version) + self.headers.to_bytes() + b"\r\n"
 
     def __repr__(self):
-        return f"<Response {self.status_code} {self.body[:10]}>"
+        return f"<Response {self.status_code} {self.body[:10] if isinstance(self.body, bytes) else self.body}>"
 
     def __bytes__(self):
-        return self.pre_body_bytes() + self.body
+        return self.pre_body_bytes() + bytes(self.body)
 
     def __buffer__(self, flags):
         return memoryview(bytes(self))
 
 
+class EncodedResponse(Response):
+    """A response that is the same for every request, serialized once per framing (HTTP version, keep-alive, HEAD)
+    and then sent as a single bytes object.
+
+    Connections send it as is, without adding headers to it or compressing it, so one instance can be shared by all
+    requests and threads. Its body must be bytes.
+    """
+    __slots__ = ("_encoded",)
+    # (status code, Retry-After) -> the canned plain text error response
+    _canned: dict[tuple[int, int | None], "EncodedResponse"] = {}
+
+    def __init__(self,
+                 body: bytes | ResponseBody = ResponseBody.EMPTY,
+                 status_code: int | HTTPStatusCode = HTTPStatusCode.OK,
+                 headers: bytes | HeaderBytes | Headers | dict = HeaderBytes.EMPTY,
+                 version: str | HTTPVersion = HTTPVersion.HTTP_1_1,
+                 **headers_kwargs
+                 ):
+        super().__init__(body, status_code, headers, version, **headers_kwargs)
+        if not isinstance(self.body, bytes):
+            raise TypeError(f"EncodedResponse needs a bytes body, not {type(self.body).__name__}")
+        # (HTTP version, keep-alive, HEAD) -> (the Date it was serialized with, the serialized response)
+        self._encoded: dict[tuple[str, bool, bool], tuple[str, bytes]] = {}
+
+    @classmethod
+    def from_response(cls, response: Response) -> "EncodedResponse":
+        return cls(response.body, response.status_code, response.headers, response.version)
+
+    @classmethod
+    def canned(cls, status_code: int, retry_after: float | None = None) -> "EncodedResponse":
+        """The shared plain text response for a status code, with its reason phrase as the body (e.g. 404 Not Found),
+        and a Retry-After header (in whole seconds, at least 1) if retry_after is given."""
+        if retry_after is not None:
+            retry_after = max(1, math.ceil(retry_after))
+        response = cls._canned.get((status_code, retry_after))
+        if response is None:
+            status_code = HTTPStatusCode(status_code)
+            headers = {"Content-Type": "text/plain"}
+            if retry_after is not None:
+                headers["Retry-After"] = str(retry_after)
+            response = cls(status_code.reason().encode(), status_code, headers)
+            cls._canned[(status_code, retry_after)] = response
+        return response
+
+    def encoded(self, request: Request | None = None, keep_alive: bool = False) -> bytes:
+        """The whole response to send for the request, with the Content-Length, Connection and Date headers filled
+        in. The Date changes every second, so each framing is serialized again at most once a second."""
+        # answer HTTP/1.0 clients in kind, like responses built from request.version
+        version = HTTPVersion.HTTP_1_0 if request is not None and request.version == HTTPVersion.HTTP_1_0 else self.version
+        head_only = request is not None and request.method == HTTPMethod.HEAD
+        key = (version, keep_alive, head_only)
+        date = http_date()
+        encoded = self._encoded.get(key)
+        if encoded is None or encoded[0] != date:
+            headers = Headers(self.headers)
+            if not (self.status_code.is_informational() or self.status_code in (204, 304)):
+                headers.setdefault("Content-Length", str(len(self.body)))
+            headers["Connection"] = "keep-alive" if keep_alive else "close"
+            headers.setdefault("Date", date)
+            data = self.status_code.status_line(version) + headers.to_bytes() + b"\r\n"
+            if not head_only:
+                data += self.body
+            encoded = self._encoded[key] = (date, data)
+        return encoded[1]
+
+    def __repr__(self):
+        return f"<EncodedResponse {self.status_code} {self.body[:10]}>"
+
+
 class FileResponse(Response):
+    __slots__ = ()
     content_types = {
         "html": "text/html",
         "css": "text/css",
@@ -423,6 +1139,7 @@ class FileResponse(Response):
     }
 
     default_content_type = None
+    max_ranges = 16
 
     def __new__(cls, *args, **kwargs):
         return super().__new__(cls)
@@ -492,16 +1209,25 @@ class FileResponse(Response):
         if headers is None:
             headers = {}
 
+        if "Accept-Ranges" not in headers:
+            headers["Accept-Ranges"] = "bytes"
+
         if download and "Content-Disposition" not in headers:
             headers["Content-Disposition"] = f'attachment; filename="{filename}"'
 
         # add headers related to file stats
+        stat = path.stat() if path and not {"Content-Length", "Last-Modified", "ETag"} <= headers.keys() else None
         if "Content-Length" not in headers:
-            headers["Content-Length"] = str(path.stat().st_size) if path else str(len(body))
+            headers["Content-Length"] = str(stat.st_size) if path else str(len(body))
         if "Last-Modified" not in headers:
-            headers["Last-Modified"] = datetime.datetime.fromtimestamp(path.stat().st_mtime).isoformat() if path else datetime.datetime.now().isoformat()
+            headers["Last-Modified"] = formatdate(stat.st_mtime if path else None, usegmt=True)
+        if "ETag" not in headers and path:
+            headers["ETag"] = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
 
         if path and path.is_dir():
+            # the zip archive is neither the size nor the representation the directory's stat describes
+            headers.pop("Content-Length")
+            headers.pop("ETag", None)
             from tempfile import TemporaryFile
             from zipfile import ZipFile
             # zip the directory to a TemporaryFile
@@ -519,11 +1245,10 @@ class FileResponse(Response):
             if content_type is None:
                 content_type = self.get_content_type(path.suffix[1:])
 
-            if not path.exists():
+            if stat is None and not path.exists():
                 raise FileNotFoundError(f"No such file or directory: '{path}'")
-            with path.open("rb") as f:
-                f.seek(0)
-                b = f.read()
+            # the file is streamed from disk when the response is sent
+            b = FileBody(path, length=int(headers["Content-Length"]))
 
             super().__init__(b,
                              status_code=status_code,
@@ -537,8 +1262,96 @@ class FileResponse(Response):
                              content_type=content_type,
                              version=version)
 
-    def get_content_type(self, suffix: str):
-        return self.content_types.get(suffix.lower(), self.content_types[self.default_content_type])
+    @classmethod
+    def from_cache(cls, entry, version: str | HTTPVersion = HTTPVersion.HTTP_1_1) -> "FileResponse":
+        """Builds a response for a socketpulse.cache.CachedFile without touching the filesystem (for cached
+        contents) or stat-ing the file again (for files streamed from disk)."""
+        self = super().__new__(cls)
+        body = entry.body if entry.body is not None else FileBody(entry.path, length=entry.size)
+        Response.__init__(self, body, headers=dict(entry.headers), version=version)
+        return self
+
+    def apply_conditional(self, request: Request) -> "FileResponse":
+        """Turns this response into a 304 Not Modified if the client's cached copy is still current, as told by
+        If-None-Match (against the ETag) or, when that is absent, If-Modified-Since (against Last-Modified)."""
+        if self.status_code != HTTPStatusCode.OK or request.method not in (HTTPMethod.GET, HTTPMethod.HEAD):
+            return self
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            etag = self.headers.get("ETag")
+            if not etag:
+                return self
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            not_modified = "*" in tags or etag.removeprefix("W/") in tags
+        else:
+            if_modified_since = request.headers.get("If-Modified-Since")
+            last_modified = self.headers.get("Last-Modified")
+            if not if_modified_since or not last_modified:
+                return self
+            try:
+                not_modified = parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return self
+        if not_modified:
+            self.status_code = HTTPStatusCode.NOT_MODIFIED
+            self.headers.pop("Content-Length", None)
+            self.body = b""
+        return self
+
+    def apply_range(self, request: Request) -> "FileResponse":
+        """Narrows this response to the byte ranges requested by the Range header, if any.
+
+        A satisfiable Range becomes a 206 Partial Content response (multipart/byteranges for several ranges) whose
+        body only covers the requested slices of the file, an unsatisfiable one becomes 416. The Range header is
+        ignored (the full response is kept) when it is malformed, asks for too many ranges, or when If-Range
+        doesn't match the current ETag / Last-Modified.
+        """
+        range_header = request.headers.get("Range")
+        if not range_header or self.status_code != HTTPStatusCode.OK or request.method not in (HTTPMethod.GET, HTTPMethod.HEAD):
+            return self
+        if_range = request.headers.get("If-Range")
+        if if_range and if_range not in (self.headers.get("ETag"), self.headers.get("Last-Modified")):
+            return self
+        size = len(self.body)
+        ranges = parse_byte_ranges(range_header, size)
+        if ranges is None or len(ranges) > self.max_ranges:
+            return self
+
+        if not ranges:
+            self.status_code = HTTPStatusCode.RANGE_NOT_SATISFIABLE
+            self.headers["Content-Range"] = f"bytes */{size}"
+            self.body = b""
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = HTTPStatusCode.PARTIAL_CONTENT
+            self.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self.body = self.body_slice(start, end)
+        else:
+            boundary = secrets.token_hex(16)
+            content_type = self.headers.get("Content-Type", self.content_types[None])
+            parts = []
+            for start, end in ranges:
+                parts.append((b"\r\n" if parts else b"") +
+                             f'--{boundary}\r\n'
+                             f'Content-Type: {content_type}\r\n'
+                             f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'.encode())
+                parts.append(self.body_slice(start, end))
+            parts.append(f"\r\n--{boundary}--\r\n".encode())
+            self.status_code = HTTPStatusCode.PARTIAL_CONTENT
+            self.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+            self.body = MultipartBody(parts)
+        self.headers["Content-Length"] = str(len(self.body))
+        return self
+
+    def body_slice(self, start: int, end: int) -> FileBody | bytes:
+        """The bytes start through end (inclusive) of the body, without reading anything else from disk."""
+        if isinstance(self.body, FileBody):
+            return FileBody(self.body.path, self.body.offset + start, end - start + 1)
+        return self.body[start:end + 1]
+
+    @classmethod
+    def get_content_type(cls, suffix: str):
+        return cls.content_types.get(suffix.lower(), cls.content_types[cls.default_content_type])
 
     def get_extension(self, content_type: str):
         for k, v in self.content_types.items():
@@ -547,6 +1360,45 @@ class FileResponse(Response):
         return ""
 
 
+def parse_byte_ranges(range_header: str, size: int) -> list[tuple[int, int]] | None:
+    """Parses a Range header (e.g. "bytes=0-99,200-,-50") against a resource of the given size.
+
+    Returns the satisfiable (start, end) ranges, end inclusive, an empty list if none is satisfiable,
+    or None if the header is malformed or not in bytes.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        start, end = start.strip(), end.strip()
+        if not sep:
+            return None
+        if not start:
+            # suffix range: the last N bytes
+            if not end.isdigit():
+                return None
+            n = int(end)
+            if n == 0 or size == 0:
+                continue
+            ranges.append((max(0, size - n), size - 1))
+            continue
+        if not start.isdigit() or (end and not end.isdigit()):
+            return None
+        start = int(start)
+        if end and int(end) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(end), size - 1) if end else size - 1
+        ranges.append((start, end))
+    return ranges
+
+
 # define a class such that FileTypeResponse[content_type] is a subclass of FileResponse
 
 
@@ -561,6 +1413,7 @@ class FileTypeResponseMeta(type):
             content_type = FileResponse.content_types[content_type[1:]]
 
         class TypedFileResponse(FileResponse):
+            __slots__ = ()
             default_content_type = content_type
 
             def __init__(self,
@@ -605,6 +1458,7 @@ class FileTypeResponse(metaclass=FileTypeResponseMeta):
 
 
 class HTMLResponse(Response):
+    __slots__ = ()
     def __init__(self, html: str, status_code: int = 200, headers: dict = None, version: str = "HTTP/1.1"):
         if headers is None:
             headers = {}
@@ -614,6 +1468,7 @@ class HTMLResponse(Response):
 
 
 class StandardHTMLResponse(HTMLResponse):
+    __slots__ = ()
     def __init__(self, body: str, title = "", favicon=None,  scripts: list = None, stylesheets = None, status_code: int = 200, headers: dict = None, version: str = "HTTP/1.1"):
         favicon = f'<link rel="icon" href="{favicon}">' if favicon else ""
         scripts = "\n".join([f'<script src="{i}"></script>' for i in scripts]) if scripts else ""
@@ -634,6 +1489,7 @@ class StandardHTMLResponse(HTMLResponse):
 
 
 class HTMLTextResponse(StandardHTMLResponse): # this is easier to implement than escaping the text
+    __slots__ = ()
     def __init__(self, body: str, title="", favicon=None,  scripts: list = None, stylesheets = None, status_code: int = 200, headers: dict = None, version: str = "HTTP/1.1"):
         super().__init__(f"<pre>{body}</pre>",
                             title=title,
@@ -647,6 +1503,7 @@ class HTMLTextResponse(StandardHTMLResponse): # this is easier to implement than
 
 class TBDBResponse(StandardHTMLResponse):
     """Displays tabular json data in a table using https://github.com/modularizer/teebydeeby"""
+    __slots__ = ()
     def __init__(self, data, title="", favicon=None,  scripts: list = None, stylesheets = None, status_code: int = 200, headers: dict = None, version: str = "HTTP/1.1"):
         if not isinstance(data, str):
             data = json.dumps(data, indent=4)
@@ -662,12 +1519,30 @@ class TBDBResponse(StandardHTMLResponse):
 
 
 class JSONResponse(Response):
-    def __init__(self, data: str | dict | list | tuple | int | float, status_code: int = 200, headers: dict = None,
-                 version: str = "HTTP/1.1"):
+    """A JSON response. Iterators, and lists or tuples of more than stream_min_items items, are streamed as a JSON
+    array, encoded one item at a time. Everything else is encoded in one go by json.dumps (the C encoder)."""
+    __slots__ = ()
+    stream_threshold = StreamBody.chunk_size
+    stream_min_items = 1024
+
+    def __init__(self, data: str | dict | list | tuple | int | float | Iterator, status_code: int = 200,
+                 headers: dict = None, version: str = "HTTP/1.1"):
         if headers is None:
             headers = {}
         if "Content-Type" not in headers:
             headers["Content-Type"] = "application/json"
+        if isinstance(data, Iterator):
+            super().__init__(StreamBody(StreamBody.coalesce(self.iterencode_items(data), self.stream_threshold)),
+                             status_code, headers, version)
+            return
+        if (isinstance(data, (list, tuple)) and len(data) > self.stream_min_items
+                and not hasattr(data, "to_json") and not hasattr(data, "to_dict")):
+            try:
+                body = self.encode_incrementally(data)
+            except:
+                body = str(data).encode()
+            super().__init__(body, status_code, headers, version)
+            return
         if not isinstance(data, str):
             if isinstance(data, tuple):
                 data = list(data)
@@ -697,8 +1572,32 @@ class JSONResponse(Response):
                     data = str(data)
         super().__init__(data.encode(), status_code, headers, version)
 
+    def encode_incrementally(self, data) -> bytes | StreamBody:
+        """Encodes data as bytes if it is small, otherwise as a StreamBody that encodes the rest while it is sent.
+
+        Errors in the first stream_threshold bytes are raised here, later ones abort the response mid-stream."""
+        chunks = StreamBody.coalesce(self.iterencode_items(data), self.stream_threshold)
+        first = next(chunks, b"")
+        second = next(chunks, None)
+        if second is None:
+            return first
+        return StreamBody(itertools.chain((first, second), chunks))
+
+    @staticmethod
+    def iterencode_items(items, batch_size: int = 256):
+        # json.dumps of a batch at a time keeps the C encoder, which JSONEncoder.iterencode gives up for pure Python
+        items = iter(items)
+        yield "["
+        separator = ""
+        while batch := list(itertools.islice(items, batch_size)):
+            yield separator
+            yield json.dumps(batch)[1:-1]
+            separator = ","
+        yield "]"
+
 
 class ErrorResponse(Response):
+    __slots__ = ()
     def __init__(self,
                  error: str | bytes | Exception = b'Internal Server Error',
                  status_code: int = 500,
@@ -718,6 +1617,7 @@ class ErrorResponse(Response):
 
 
 class RedirectResponse(Response):
+    __slots__ = ()
     def __init__(self, location: str, status_code: int = 307, headers: dict = None, version: str = "HTTP/1.1"):
         if headers is None:
             headers = {}
@@ -727,256 +1627,77 @@ class RedirectResponse(Response):
 
 
 class TemporaryRedirect(RedirectResponse):
+    __slots__ = ()
     def __init__(self, location: str, status_code: int = 307, headers: dict = None, version: str = "HTTP/1.1"):
         super().__init__(location, status_code, headers, version)
 
 
 class PermanentRedirect(RedirectResponse):
+    __slots__ = ()
     def __init__(self, location: str, status_code: int = 308, headers: dict = None, version: str = "HTTP/1.1"):
         super().__init__(location, status_code, headers, version)
 
 
-url_encodings = {
-    " ": "%20",
-    "!": "%21",
-    '"': "%22",
-    "#": "%23",
-    "$": "%24",
-    "%": "%25",
-    "&": "%26",
-    "'": "%27",
-    "(": "%28",
-    ")": "%29",
-    "*": "%2A",
-    "+": "%2B",
-    ",": "%2C",
-    "-": "%2D",
-    ".": "%2E",
-    "/": "%2F",
-    "0": "%30",
-    "1": "%31",
-    "2": "%32",
-    "3": "%33",
-    "4": "%34",
-    "5": "%35",
-    "6": "%36",
-    "7": "%37",
-    "8": "%38",
-    "9": "%39",
-    ":": "%3A",
-    ";": "%3B",
-    "<": "%3C",
-    "=": "%3D",
-    ">": "%3E",
-    "?": "%3F",
-    "@": "%40",
-    "A": "%41",
-    "B": "%42",
-    "C": "%43",
-    "D": "%44",
-    "E": "%45",
-    "F": "%46",
-    "G": "%47",
-    "H": "%48",
-    "I": "%49",
-    "J": "%4A",
-    "K": "%4B",
-    "L": "%4C",
-    "M": "%4D",
-    "N": "%4E",
-    "O": "%4F",
-    "P": "%50",
-    "Q": "%51",
-    "R": "%52",
-    "S": "%53",
-    "T": "%54",
-    "U": "%55",
-    "V": "%56",
-    "W": "%57",
-    "X": "%58",
-    "Y": "%59",
-    "Z": "%5A",
-    "[": "%5B",
-    "\\": "%5C",
-    "]": "%5D",
-    "^": "%5E",
-    "_": "%5F",
-    "`": "%60",
-    "a": "%61",
-    "b": "%62",
-    "c": "%63",
-    "d": "%64",
-    "e": "%65",
-    "f": "%66",
-    "g": "%67",
-    "h": "%68",
-    "i": "%69",
-    "j": "%6A",
-    "k": "%6B",
-    "l": "%6C",
-    "m": "%6D",
-    "n": "%6E",
-    "o": "%6F",
-    "p": "%70",
-    "q": "%71",
-    "r": "%72",
-    "s": "%73",
-    "t": "%74",
-    "u": "%75",
-    "v": "%76",
-    "w": "%77",
-    "x": "%78",
-    "y": "%79",
-    "z": "%7A",
-    "{": "%7B",
-    "|": "%7C",
-    "}": "%7D",
-    "~": "%7E",
-    "\x7F": "%7F",
-    "€": "%E2%82%AC",
-    "\x81": "%81",
-    "‚": "%E2%80%9A",
-    "ƒ": "%C6%92",
-    "„": "%E2%80%9E",
-    "…": "%E2%80%A6",
-    "†": "%E2%80%A0",
-    "‡": "%E2%80%A1",
-    "ˆ": "%CB%86",
-    "‰": "%E2%80%B0",
-    "Š": "%C5%A0",
-    "‹": "%E2%80%B9",
-    "Œ": "%C5%92",
-    "\x8D": "%C5%8D",
-    "Ž": "%C5%BD",
-    "\x8F": "%8F",
-    "\x90": "%C2%90",
-    "‘": "%E2%80%98",
-    "’": "%E2%80%99",
-    "“": "%E2%80%9C",
-    "”": "%E2%80%9D",
-    "•": "%E2%80%A2",
-    "–": "%E2%80%93",
-    "—": "%E2%80%94",
-    "˜": "%CB%9C",
-    "™": "%E2%84%A2",
-    "š": "%C5%A1",
-    "›": "%E2%80%BA",
-    "œ": "%C5%93",
-    "\x9D": "%9D",
-    "ž": "%C5%BE",
-    "Ÿ": "%C5%B8",
-    "\xA0": "%C2%A0",
-    "¡": "%C2%A1",
-    "¢": "%C2%A2",
-    "£": "%C2%A3",
-    "¤": "%C2%A4",
-    "¥": "%C2%A5",
-    "¦": "%C2%A6",
-    "§": "%C2%A7",
-    "¨": "%C2%A8",
-    "©": "%C2%A9",
-    "ª": "%C2%AA",
-    "«": "%C2%AB",
-    "¬": "%C2%AC",
-    "\xAD": "%C2%AD",
-    "®": "%C2%AE",
-    "¯": "%C2%AF",
-    "°": "%C2%B0",
-    "±": "%C2%B1",
-    "²": "%C2%B2",
-    "³": "%C2%B3",
-    "´": "%C2%B4",
-    "µ": "%C2%B5",
-    "¶": "%C2%B6",
-    "·": "%C2%B7",
-    "¸": "%C2%B8",
-    "¹": "%C2%B9",
-    "º": "%C2%BA",
-    "»": "%C2%BB",
-    "¼": "%C2%BC",
-    "½": "%C2%BD",
-    "¾": "%C2%BE",
-    "¿": "%C2%BF",
-    "À": "%C3%80",
-    "Á": "%C3%81",
-    "Â": "%C3%82",
-    "Ã": "%C3%83",
-    "Ä": "%C3%84",
-    "Å": "%C3%85",
-    "Æ": "%C3%86",
-    "Ç": "%C3%87",
-    "È": "%C3%88",
-    "É": "%C3%89",
-    "Ê": "%C3%8A",
-    "Ë": "%C3%8B",
-    "Ì": "%C3%8C",
-    "Í": "%C3%8D",
-    "Î": "%C3%8E",
-    "Ï": "%C3%8F",
-    "Ð": "%C3%90",
-    "Ñ": "%C3%91",
-    "Ò": "%C3%92",
-    "Ó": "%C3%93",
-    "Ô": "%C3%94",
-    "Õ": "%C3%95",
-    "Ö": "%C3%96",
-    "×": "%C3%97",
-    "Ø": "%C3%98",
-    "Ù": "%C3%99",
-    "Ú": "%C3%9A",
-    "Û": "%C3%9B",
-    "Ü": "%C3%9C",
-    "Ý": "%C3%9D",
-    "Þ": "%C3%9E",
-    "ß": "%C3%9F",
-    "à": "%C3%A0",
-    "á": "%C3%A1",
-    "â": "%C3%A2",
-    "ã": "%C3%A3",
-    "ä": "%C3%A4",
-    "å": "%C3%A5",
-    "æ": "%C3%A6",
-    "ç": "%C3%A7",
-    "è": "%C3%A8",
-    "é": "%C3%A9",
-    "ê": "%C3%AA",
-    "ë": "%C3%AB",
-    "ì": "%C3%AC",
-    "í": "%C3%AD",
-    "î": "%C3%AE",
-    "ï": "%C3%AF",
-    "ð": "%C3%B0",
-    "ñ": "%C3%B1",
-    "ò": "%C3%B2",
-    "ó": "%C3%B3",
-    "ô": "%C3%B4",
-    "õ": "%C3%B5",
-    "ö": "%C3%B6",
-    "÷": "%C3%B7",
-    "ø": "%C3%B8",
-    "ù": "%C3%B9",
-    "ú": "%C3%BA",
-    "û": "%C3%BB",
-    "ü": "%C3%BC",
-    "ý": "%C3%BD",
-    "þ": "%C3%BE",
-    "ÿ": "%C3%BF"
-}
+# characters that never need percent-encoding (RFC 3986 unreserved)
+url_safe = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~"
+# byte -> its encoded form, and two hex digits (either case) -> the byte they encode
+url_encode_table = [chr(b) if chr(b) in url_safe else f"%{b:02X}" for b in range(256)]
+url_decode_table = {f"{a}{b}": bytes([int(a + b, 16)])
+                    for a in "0123456789ABCDEFabcdef" for b in "0123456789ABCDEFabcdef"}
 
 
 def url_encode(s: str) -> str:
-    for k, e in url_encodings.items():
-        s = s.replace(k, e)
-    return s
+    """Percent-encodes the UTF-8 bytes of everything but unreserved characters."""
+    if not s.strip(url_safe):
+        return s
+    return "".join([url_encode_table[b] for b in s.encode()])
 
 
-def url_decode(s: str) -> str:
-    for e, k in url_encodings.items():
-        s = s.replace(k, e)
-    return s
+def url_decode(s: str, plus: bool = False) -> str:
+    """Decodes %XX escapes (as UTF-8) in one pass; malformed escapes are kept as they are.
+    With plus=True (for query strings) "+" decodes to a space."""
+    if plus and "+" in s:
+        s = s.replace("+", " ")
+    if "%" not in s:
+        return s
+    first, *rest = s.split("%")
+    out = bytearray(first.encode())
+    for part in rest:
+        b = url_decode_table.get(part[:2])
+        if b is None:
+            out += b"%"
+            out += part.encode()
+        else:
+            out += b
+            out += part[2:].encode()
+    return out.decode(errors="replace")
 
 
 class Query(dict):
+    """Query string (or form) parameters. A repeated key maps to its last value; get_all returns all of them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lists = {k: list(v) for k, v in args[0]._lists.items()} if args and isinstance(args[0], Query) else {}
+
+    @classmethod
+    def parse(cls, s: str) -> "Query":
+        """Parses "a=1&b=x+y&a=2" ("+" decodes to a space). Keys without "=" get an empty value."""
+        query = cls()
+        for item in s.split("&"):
+            if item:
+                k, _, v = item.partition("=")
+                k, v = url_decode(k, plus=True), url_decode(v, plus=True)
+                if k in query:
+                    query._lists.setdefault(k, [query[k]]).append(v)
+                query[k] = v
+        return query
+
+    def get_all(self, key: str) -> list[str]:
+        if key in self._lists:
+            return list(self._lists[key])
+        return [self[key]] if key in self else []
+
     def __str__(self):
         return "?" + "&".join([f"{url_encode(k)}={url_encode(v)}" for k, v in self.items()])
 
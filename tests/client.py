@@ -0,0 +1,78 @@
+"""A minimal HTTP/1.1 client for talking to test servers over real sockets."""
+import socket
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def connect(port: int, timeout: float = 5) -> socket.socket:
+    sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+    return sock
+
+
+def read_response(sock: socket.socket, buffer: bytearray, head_only: bool = False) -> tuple[int, dict, bytes]:
+    """Reads one response (status, lowercased headers, decoded body) from the socket, keeping what follows it in
+    buffer."""
+    while b"\r\n\r\n" not in buffer:
+        data = sock.recv(65536)
+        if not data:
+            raise ConnectionError(f"connection closed in a response head: {bytes(buffer)!r}")
+        buffer += data
+    head, _, rest = bytes(buffer).partition(b"\r\n\r\n")
+    buffer[:] = rest
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        k, _, v = line.partition(":")
+        headers[k.strip().lower()] = v.strip()
+
+    def fill(n: int):
+        while len(buffer) < n:
+            data = sock.recv(65536)
+            if not data:
+                raise ConnectionError("connection closed in a response body")
+            buffer.extend(data)
+
+    if head_only or status in (204, 304) or 100 <= status < 200:
+        return status, headers, b""
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            while b"\r\n" not in buffer:
+                fill(len(buffer) + 1)
+            size_line, _, _ = bytes(buffer).partition(b"\r\n")
+            size = int(size_line.split(b";")[0], 16)
+            del buffer[:len(size_line) + 2]
+            fill(size + 2)
+            body += bytes(buffer[:size])
+            del buffer[:size + 2]
+            if size == 0:
+                return status, headers, body
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        fill(length)
+        body = bytes(buffer[:length])
+        del buffer[:length]
+        return status, headers, body
+    # delimited by the end of the connection
+    while data := sock.recv(65536):
+        buffer += data
+    body = bytes(buffer)
+    buffer.clear()
+    return status, headers, body
+
+
+def request(port: int, path: str = "/", method: str = "GET", headers: dict | None = None, body: bytes = b"",
+            version: str = "HTTP/1.1") -> tuple[int, dict, bytes]:
+    """Sends one request on a new connection and returns its response."""
+    headers = {"Host": "test", "Connection": "close", **(headers or {})}
+    if body and "Content-Length" not in headers and "Transfer-Encoding" not in headers:
+        headers["Content-Length"] = str(len(body))
+    head = f"{method} {path} {version}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+    with connect(port) as sock:
+        sock.sendall(head.encode() + body)
+        return read_response(sock, bytearray(), head_only=method == "HEAD")
@@ -0,0 +1,52 @@
+import socket
+import time
+from contextlib import suppress
+
+import pytest
+
+from client import connect, free_port
+from socketpulse import Server
+
+MODES = ("blocking", "selector", "asyncio")
+
+
+@pytest.fixture(params=MODES)
+def mode(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def serve():
+    """Starts servers in a background thread: serve(routes, mode=..., **server_kwargs) returns the Server, whose
+    port is server.port. They are stopped at the end of the test."""
+    servers = []
+
+    def start(routes, **kwargs) -> Server:
+        kwargs.setdefault("backlog", 64)
+        kwargs.setdefault("socket_options", {socket.SOL_SOCKET: {socket.SO_REUSEADDR: 1}})
+        server = Server(routes, port=free_port(), host="127.0.0.1", serve=False, **kwargs)
+        server.serve(thread=True)
+        servers.append(server)
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                connect(server.port, timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.cleanup_event.set()
+        # wake a serving loop that is blocked in accept()
+        with suppress(OSError):
+            connect(server.port, timeout=1).close()
+        server.server_thread.join(2)
+        if server.thread_pool_executor is not None:
+            server.thread_pool_executor.shutdown(wait=False, cancel_futures=True)
+        server.close()
+
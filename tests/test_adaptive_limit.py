@@ -0,0 +1,134 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from client import connect, read_response, request
+from socketpulse import AdaptiveLimiter
+from socketpulse import limits
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake time.monotonic for the limiter, advanced by setting clock.now."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(limits, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def busy(limiter: AdaptiveLimiter, latency: float, times: int = 1) -> None:
+    """Handles requests while all the limiter's other slots are taken, so its limit is fully in use."""
+    for _ in range(times):
+        held = limiter.limit - 1
+        for _ in range(held):
+            assert limiter.acquire()
+        assert limiter.acquire()
+        limiter.release(latency)
+        for _ in range(held):
+            limiter.in_flight -= 1
+
+
+def test_limit_grows_by_about_one_per_limit_worth_of_requests(clock):
+    limiter = AdaptiveLimiter(initial_limit=10)
+    busy(limiter, 0.01, times=10)
+    assert limiter.limit == 10
+    busy(limiter, 0.01)
+    assert limiter.limit == 11
+    busy(limiter, 0.01, times=11)
+    assert limiter.limit == 12
+
+
+def test_unused_limit_does_not_grow(clock):
+    limiter = AdaptiveLimiter(initial_limit=10)
+    for _ in range(100):
+        assert limiter.acquire()
+        limiter.release(0.01)
+    assert limiter.limit == 10
+
+
+def test_slow_latency_shrinks_the_limit_once_per_latency(clock):
+    limiter = AdaptiveLimiter(initial_limit=20, tolerance=2.0, backoff=0.5)
+    busy(limiter, 0.01)
+    assert limiter.baseline == 0.01
+
+    # within tolerance of the baseline: not a decrease
+    busy(limiter, 0.019)
+    assert limiter.limit == 20
+
+    busy(limiter, 0.1)
+    assert limiter.limit == 10
+    # the rest of the same slow burst only counts once
+    clock.now += 0.05
+    busy(limiter, 0.1)
+    assert limiter.limit == 10
+    clock.now += 0.06
+    busy(limiter, 0.1)
+    assert limiter.limit == 5
+
+
+def test_limit_stays_within_bounds(clock):
+    assert AdaptiveLimiter(initial_limit=50, max_limit=10).limit == 10
+    assert AdaptiveLimiter(initial_limit=0, min_limit=2).limit == 2
+
+    limiter = AdaptiveLimiter(initial_limit=4, min_limit=3, backoff=0.5)
+    busy(limiter, 0.01)
+    for _ in range(5):
+        clock.now += 1
+        busy(limiter, 0.5)
+    assert limiter.limit == 3
+
+    limiter = AdaptiveLimiter(initial_limit=9, max_limit=10)
+    busy(limiter, 0.01, times=100)
+    assert limiter.limit == 10
+
+
+def test_requests_over_the_limit_are_rejected():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire()
+    assert (limiter.in_flight, limiter.rejected) == (2, 1)
+    limiter.release(0.01)
+    assert limiter.acquire()
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"min_limit": 0},
+    {"min_limit": 5, "max_limit": 4},
+    {"tolerance": 1.0},
+    {"tolerance": 0.5},
+    {"tolerance": float("nan")},
+    {"backoff": 0},
+    {"backoff": 1},
+    {"backoff": 1.5},
+    {"backoff": -0.5},
+])
+def test_invalid_arguments(kwargs):
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(**kwargs)
+
+
+def test_server_rejects_over_the_limit_with_503(serve, mode):
+    started, release = threading.Event(), threading.Event()
+
+    class Routes:
+        def slow(self) -> str:
+            started.set()
+            release.wait(5)
+            return "slow"
+
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+    server = serve(Routes, mode=mode, num_connection_threads=4, adaptive_concurrency=limiter)
+    try:
+        with connect(server.port) as slow:
+            slow.sendall(b"GET /slow HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+            assert started.wait(5)
+            status, headers, _ = request(server.port, "/slow")
+            assert status == 503
+            assert headers["retry-after"] == "1"
+            release.set()
+            assert read_response(slow, bytearray())[::2] == (200, b"slow")
+    finally:
+        release.set()
+    assert limiter.rejected == 1
+    assert limiter.in_flight == 0
+    assert request(server.port, "/slow")[::2] == (200, b"slow")
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from client import request
+from socketpulse.handlers import compile_caster
+
+
+@pytest.mark.parametrize("typehint, value, expected", [
+    (int, "5", 5),
+    (int, "-3", -3),
+    (int, "2.5", "2.5"),
+    (float, "2.5", 2.5),
+    (float, "-2.5", -2.5),
+    (float, "3", 3.0),
+    (float, "1.2.3", "1.2.3"),
+    (float, "-", "-"),
+    (bool, "true", True),
+    (bool, "n", False),
+    # bool is an int, so digits are cast as ints first (which are just as truthy)
+    (bool, "1", 1),
+    (bool, "0", 0),
+    (str, "5", "5"),
+    (str, "true", "true"),
+    (list, "[1, 2]", [1, 2]),
+    (tuple, "(1, 2)", (1, 2)),
+    (dict, '{"a": 1}', {"a": 1}),
+    (bytes, "abc", b"abc"),
+])
+def test_casts(typehint, value, expected):
+    cast = compile_caster(typehint)
+    assert cast(value) == expected
+    assert type(cast(value)) is type(expected)
+    # casters are compiled once per typehint
+    assert compile_caster(typehint) is cast
+
+
+@pytest.mark.parametrize("value, expected", [("3", 3), ("2.5", 2.5), ("-0.5", -0.5), ("yes", True), ("[1]", [1]),
+                                             ("abc", "abc")])
+def test_untyped_values_are_guessed(value, expected):
+    assert compile_caster()(value) == expected
+
+
+class Routes:
+    def calc(self, a: int, b: float = 1.5, flag: bool = False, name: str = "x") -> dict:
+        return {"a": a, "b": b, "flag": flag, "name": name}
+
+    def pair(self, x, y: str = "default"):
+        return json.dumps([x, y])
+
+
+def test_parameters_are_cast_and_defaulted(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, _, body = request(server.port, "/calc?a=2")
+    assert (status, json.loads(body)) == (200, {"a": 2, "b": 1.5, "flag": False, "name": "x"})
+    status, _, body = request(server.port, "/calc?a=-2&b=2.25&flag=true&name=7")
+    assert (status, json.loads(body)) == (200, {"a": -2, "b": 2.25, "flag": True, "name": "7"})
+    # positional query args fill the parameters in order
+    status, _, body = request(server.port, "/pair?0=1.5&1=2")
+    assert (status, json.loads(body)) == (200, [1.5, "2"])
+
+
+def test_missing_required_parameter_is_400(serve, mode):
+    server = serve(Routes, mode=mode)
+    assert request(server.port, "/calc")[0] == 400
+    assert request(server.port, "/calc?b=2")[0] == 400
+    assert request(server.port, "/pair?y=1")[0] == 400
+    assert request(server.port, "/pair?0=1")[0] == 200
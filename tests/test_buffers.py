@@ -0,0 +1,105 @@
+import socket
+
+import pytest
+
+from socketpulse.buffers import BufferPool, RecvBuffer
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    with a, b:
+        yield a, b
+
+
+def capacity(buffer: RecvBuffer) -> int:
+    return len(buffer._buffer) if buffer._buffer is not None else 0
+
+
+def test_buffers_start_small(pair):
+    client, server = pair
+    pool = BufferPool(buffer_size=64 * 1024, initial_size=4096)
+    buffer = RecvBuffer(pool)
+    client.sendall(b"GET / HTTP/1.1\r\nHost: te")
+    assert buffer.fill(server) == 24
+    assert capacity(buffer) == 4096
+    assert buffer.find(b"\r\n\r\n") == -1
+    client.sendall(b"st\r\n\r\nrest")
+    buffer.fill(server)
+    assert buffer.find(b"\r\n\r\n") == 26
+    assert buffer.take(26) == b"GET / HTTP/1.1\r\nHost: test"
+    buffer.skip(4)
+    assert buffer.take() == b"rest"
+    # emptied buffers go back to the pool and are reused
+    assert capacity(buffer) == 0 and len(pool._small) == 1
+    reused = pool._small[0]
+    client.sendall(b"next")
+    buffer.fill(server)
+    assert buffer._buffer is reused
+
+
+def test_buffer_grows_for_a_fast_client_and_shrinks_back(pair):
+    client, server = pair
+    pool = BufferPool(buffer_size=64 * 1024, initial_size=4096)
+    buffer = RecvBuffer(pool)
+    data = bytes(range(256)) * 100
+    client.sendall(data)
+    received = bytearray()
+    while len(received) < len(data):
+        buffer.fill(server)
+        # a receive that filled the small buffer moved it to a large one
+        received += buffer.take()
+    assert received == data
+    assert len(pool._large) == 1
+    assert buffer._large
+
+    client.sendall(b"x" * 10)
+    buffer.fill(server)
+    # large buffers are used until a receive returns little
+    assert capacity(buffer) == 64 * 1024
+    buffer.take()
+    client.sendall(b"x" * 10)
+    buffer.fill(server)
+    assert capacity(buffer) == 4096
+
+
+def test_reserve_keeps_buffered_bytes(pair):
+    client, server = pair
+    pool = BufferPool(buffer_size=16 * 1024, initial_size=4096)
+    buffer = RecvBuffer(pool)
+    client.sendall(b"abcdef")
+    buffer.fill(server)
+    buffer.skip(2)
+    buffer.reserve(10 * 1024)
+    assert capacity(buffer) == 16 * 1024
+    assert buffer.peek() == b"cdef"
+    # past buffer_size, buffers aren't pooled
+    buffer.reserve(32 * 1024)
+    assert capacity(buffer) >= 32 * 1024 + 4
+    assert buffer.take() == b"cdef"
+    assert (len(pool._small), len(pool._large)) == (1, 1)
+
+
+def test_unread_puts_bytes_back_in_front(pair):
+    client, server = pair
+    buffer = RecvBuffer(BufferPool(buffer_size=16 * 1024, initial_size=4096))
+    client.sendall(b"bodyGET /next")
+    buffer.fill(server)
+    assert buffer.take(4) == b"body"
+    rest = buffer.take()
+    buffer.unread(b"GET" + rest[3:])
+    assert buffer.take() == b"GET /next"
+    buffer.unread(b"x" * 5000)
+    assert len(buffer) == 5000 and capacity(buffer) == 16 * 1024
+
+
+def test_pool_sizes():
+    pool = BufferPool(buffer_size=16 * 1024, max_buffers=1, initial_size=4096)
+    assert len(pool.acquire()) == 4096
+    assert len(pool.acquire(5000)) == 16 * 1024
+    assert len(pool.acquire(20000)) == 20000
+    pool.release(bytearray(4096))
+    pool.release(bytearray(4096))
+    pool.release(bytearray(20000))
+    # at most max_buffers of each size are kept
+    assert (len(pool._small), len(pool._large)) == (1, 0)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+from client import connect, read_response, request
+from socketpulse import tag
+
+
+def bulkhead_routes(**bulkhead):
+    started, release = threading.Semaphore(0), threading.Event()
+
+    class Routes:
+        @tag(max_concurrency=1, **bulkhead)
+        def slow(self) -> str:
+            started.release()
+            release.wait(5)
+            return "slow"
+
+        @tag(max_concurrency=1, **bulkhead)
+        async def slow_async(self) -> str:
+            started.release()
+            for _ in range(500):
+                if release.is_set():
+                    break
+                await asyncio.sleep(0.01)
+            return "slow"
+
+        def fast(self) -> str:
+            return "fast"
+
+    return Routes, started, release
+
+
+def send_get(port: int, path: str):
+    sock = connect(port)
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n".encode())
+    return sock
+
+
+def check_full_bulkhead_rejects(serve, mode, path):
+    Routes, started, release = bulkhead_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    try:
+        with send_get(server.port, path) as slow:
+            assert started.acquire(timeout=5)
+            status, headers, _ = request(server.port, path)
+            assert status == 503
+            assert headers["retry-after"] == "1"
+            # other routes still have threads to run on
+            assert request(server.port, "/fast")[::2] == (200, b"fast")
+            release.set()
+            assert read_response(slow, bytearray())[::2] == (200, b"slow")
+    finally:
+        release.set()
+    assert server.handler.bulkheads[path].rejected == 1
+    assert request(server.port, path)[::2] == (200, b"slow")
+
+
+def test_full_bulkhead_rejects_with_503(serve, mode):
+    check_full_bulkhead_rejects(serve, mode, "/slow")
+
+
+def test_full_async_bulkhead_rejects_with_503(serve, mode):
+    check_full_bulkhead_rejects(serve, mode, "/slow_async")
+
+
+def test_bulkhead_queue(serve, mode):
+    Routes, started, release = bulkhead_routes(queue=1)
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    try:
+        with send_get(server.port, "/slow") as first:
+            assert started.acquire(timeout=5)
+            with send_get(server.port, "/slow") as queued:
+                bulkhead = server.handler.bulkheads["/slow"]
+                for _ in range(500):
+                    if bulkhead._waiters:
+                        break
+                    time.sleep(0.01)
+                # the queue is full too
+                assert request(server.port, "/slow")[0] == 503
+                release.set()
+                assert read_response(first, bytearray())[::2] == (200, b"slow")
+                assert read_response(queued, bytearray())[::2] == (200, b"slow")
+    finally:
+        release.set()
+    assert bulkhead.rejected == 1
+
+
+def test_bulkhead_queue_timeout(serve, mode):
+    Routes, started, release = bulkhead_routes(queue=1, queue_timeout=0.1)
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    try:
+        with send_get(server.port, "/slow_async") as first:
+            assert started.acquire(timeout=5)
+            assert request(server.port, "/slow_async")[0] == 503
+            release.set()
+            assert read_response(first, bytearray())[::2] == (200, b"slow")
+    finally:
+        release.set()
+    assert server.handler.bulkheads["/slow_async"].rejected == 1
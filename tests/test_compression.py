@@ -0,0 +1,263 @@
+import gzip
+import os
+import zlib
+
+import pytest
+
+from client import connect, read_response, request
+from socketpulse import Response, StaticFileHandler
+from socketpulse.compression import Compressor, parse_accept_encoding
+from socketpulse.types import FileBody, Request, StreamBody
+
+TEXT = "compressible text " * 200
+
+
+def make_request(accept_encoding: str | None, method: str = "GET") -> Request:
+    head = f"{method} / HTTP/1.1\r\nHost: test\r\n"
+    if accept_encoding is not None:
+        head += f"Accept-Encoding: {accept_encoding}\r\n"
+    return Request.from_components(head.encode() + b"\r\n", b"", ("127.0.0.1", 1))
+
+
+def text_response(body: bytes | FileBody | StreamBody = TEXT.encode(), **headers) -> Response:
+    response = Response(b"", headers={"Content-Type": "text/plain; charset=utf-8", **headers})
+    response.body = body
+    return response
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip;q=0.8, br, identity; q=0") == {"gzip": 0.8, "br": 1.0, "identity": 0.0}
+    assert parse_accept_encoding("GZIP;q=oops, ,deflate") == {"gzip": 0.0, "deflate": 1.0}
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("deflate", "deflate"),
+    ("gzip, deflate", "gzip"),
+    ("deflate, gzip", "gzip"),
+    ("gzip;q=0.5, deflate", "deflate"),
+    ("gzip;q=0, deflate;q=0", None),
+    ("br", None),
+    ("*", "gzip"),
+    ("*;q=0.5, gzip;q=0", "deflate"),
+    ("gzip;q=0.5, identity", None),
+    ("gzip, identity;q=0", "gzip"),
+    ("br, identity;q=0", None),
+])
+def test_negotiate(accept_encoding, expected):
+    assert Compressor().negotiate(accept_encoding) == expected
+
+
+def test_is_compressible():
+    compressor = Compressor()
+    assert compressor.is_compressible("text/html; charset=utf-8")
+    assert compressor.is_compressible("Application/JSON")
+    assert compressor.is_compressible("image/svg+xml")
+    assert not compressor.is_compressible("image/png")
+    assert not compressor.is_compressible("application/jsonx")
+    assert not compressor.is_compressible(None)
+
+
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("deflate", zlib.decompress)])
+def test_compresses_with_the_negotiated_encoding(encoding, decompress):
+    response = Compressor().compress(text_response(), make_request(encoding))
+    assert response.headers["Content-Encoding"] == encoding
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Content-Length"] == str(len(response.body))
+    assert decompress(response.body) == TEXT.encode()
+
+
+def test_vary_is_set_even_when_not_compressing():
+    response = Compressor().compress(text_response(), make_request(None))
+    assert response.body == TEXT.encode()
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    response = Compressor().compress(text_response(Vary="Cookie"), make_request("gzip"))
+    assert response.headers["Vary"] == "Cookie, Accept-Encoding"
+    response = Compressor().compress(text_response(Vary="accept-encoding"), make_request("gzip"))
+    assert response.headers["Vary"] == "accept-encoding"
+    response = Compressor().compress(text_response(Vary="*"), make_request("gzip"))
+    assert response.headers["Vary"] == "*"
+
+
+def test_small_bodies_are_not_compressed():
+    compressor = Compressor(min_size=1024)
+    response = compressor.compress(text_response(b"x" * 1023), make_request("gzip"))
+    assert response.body == b"x" * 1023
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+    response = compressor.compress(text_response(b"x" * 1024), make_request("gzip"))
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_incompressible_content_types_are_not_compressed():
+    body = os.urandom(4096)
+    for content_type in ("image/png", "application/octet-stream", None):
+        headers = {"Content-Type": content_type} if content_type else {}
+        response = Compressor().compress(Response(body, headers=headers), make_request("gzip"))
+        assert response.body == body
+        assert "Content-Encoding" not in response.headers
+
+
+def test_already_encoded_bodies_are_left_alone():
+    response = Compressor().compress(text_response(**{"Content-Encoding": "br"}), make_request("gzip"))
+    assert response.body == TEXT.encode()
+    assert response.headers["Content-Encoding"] == "br"
+
+
+def test_compressed_etags_are_weak_and_cached():
+    compressor = Compressor()
+    response = compressor.compress(text_response(ETag='"v1"'), make_request("gzip"))
+    assert response.headers["ETag"] == 'W/"v1"'
+    # the identity representation keeps the strong ETag
+    response = compressor.compress(text_response(ETag='"v1"'), make_request(None))
+    assert response.headers["ETag"] == '"v1"'
+
+    # the second response with the same ETag is served from the cache, not compressed again
+    response = compressor.compress(text_response(b"different body " * 100, ETag='"v1"'), make_request("gzip"))
+    assert gzip.decompress(response.body) == TEXT.encode()
+    response = compressor.compress(text_response(ETag='W/"v2"'), make_request("gzip"))
+    assert response.headers["ETag"] == 'W/"v2"'
+
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk():
+    chunks = [TEXT[:1000], TEXT[1000:]]
+    response = text_response(StreamBody(iter(chunks)), ETag='"s"')
+    response = Compressor().compress(response, make_request("gzip"))
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == 'W/"s"'
+    assert gzip.decompress(b"".join(response.body.chunks())) == TEXT.encode()
+
+
+def test_precompressed_sibling_is_served(tmp_path):
+    path = tmp_path / "app.js"
+    path.write_text(TEXT)
+    # distinct from what compressing app.js would give, so the test can tell where the body came from
+    (tmp_path / "app.js.gz").write_bytes(gzip.compress(b"precompressed"))
+    compressor = Compressor()
+
+    response = compressor.compress(text_response(FileBody(path), **{"Content-Type": "application/javascript"}),
+                                   make_request("gzip"))
+    assert isinstance(response.body, FileBody) and response.body.path.name == "app.js.gz"
+    assert response.headers["Content-Length"] == str(response.body.length)
+
+    # deflate has no precompressed sibling, so the file itself is compressed
+    response = compressor.compress(text_response(FileBody(path)), make_request("deflate"))
+    assert zlib.decompress(response.body) == TEXT.encode()
+
+    # a sibling older than the file is stale
+    stat = path.stat()
+    os.utime(tmp_path / "app.js.gz", ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+    response = compressor.compress(text_response(FileBody(path)), make_request("gzip"))
+    assert gzip.decompress(response.body) == TEXT.encode()
+
+
+def test_files_over_max_size_are_sent_as_they_are(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text(TEXT)
+    response = Compressor(max_size=1024).compress(text_response(FileBody(path)), make_request("gzip"))
+    assert isinstance(response.body, FileBody) and response.body.path == path
+    assert "Content-Encoding" not in response.headers
+
+
+class CountingCompressor(Compressor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compressed = 0
+
+        def count(data, level, compress=self.encodings["gzip"]):
+            self.compressed += 1
+            return compress(data, level)
+
+        self.encodings = {**self.encodings, "gzip": count}
+
+
+def test_head_sets_the_headers_without_compressing(tmp_path):
+    compressor = CountingCompressor()
+    response = compressor.compress(text_response(ETag='"h"'), make_request("gzip", method="HEAD"))
+    assert compressor.compressed == 0
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == 'W/"h"'
+    # the compressed length isn't known without compressing
+    assert "Content-Length" not in response.headers
+
+    # once a GET has cached the compressed body, its length is
+    get = compressor.compress(text_response(ETag='"h"'), make_request("gzip"))
+    response = compressor.compress(text_response(ETag='"h"'), make_request("gzip", method="HEAD"))
+    assert compressor.compressed == 1
+    assert response.headers["Content-Length"] == get.headers["Content-Length"]
+
+    path = tmp_path / "app.js"
+    path.write_text(TEXT)
+    (tmp_path / "app.js.gz").write_bytes(gzip.compress(TEXT.encode()))
+    response = compressor.compress(text_response(FileBody(path)), make_request("gzip", method="HEAD"))
+    assert response.headers["Content-Length"] == str((tmp_path / "app.js.gz").stat().st_size)
+
+
+def test_compression_over_the_wire(serve, mode):
+    compressor = CountingCompressor()
+    server = serve({"/text": lambda: text_response(), "/stream": lambda: text_response(StreamBody(iter([TEXT])))},
+                   mode=mode, compression=compressor)
+
+    status, headers, body = request(server.port, "/text", headers={"Accept-Encoding": "gzip"})
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == TEXT.encode()
+
+    status, headers, body = request(server.port, "/text", headers={"Accept-Encoding": "gzip;q=0.1, deflate"})
+    assert headers["content-encoding"] == "deflate"
+    assert zlib.decompress(body) == TEXT.encode()
+
+    status, headers, body = request(server.port, "/text")
+    assert "content-encoding" not in headers
+    assert body == TEXT.encode()
+
+    status, headers, body = request(server.port, "/stream", headers={"Accept-Encoding": "gzip"})
+    assert headers["transfer-encoding"] == "chunked"
+    assert gzip.decompress(body) == TEXT.encode()
+
+
+def test_head_over_the_wire_keeps_the_connection_usable(serve, mode):
+    compressor = CountingCompressor()
+    server = serve({"/text": lambda: text_response(), "/stream": lambda: text_response(StreamBody(iter([TEXT])))},
+                   mode=mode, compression=compressor, num_connection_threads=4)
+
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        for path in ("/text", "/stream"):
+            sock.sendall(f"HEAD {path} HTTP/1.1\r\nHost: test\r\nAccept-Encoding: gzip\r\n\r\n".encode())
+            status, headers, _ = read_response(sock, buffer, head_only=True)
+            assert status == 200
+            assert headers["content-encoding"] == "gzip"
+            assert "content-length" not in headers and "transfer-encoding" not in headers
+        # nothing was sent after the HEAD responses' heads, so the next response follows them directly
+        sock.sendall(b"GET /text HTTP/1.1\r\nHost: test\r\nAccept-Encoding: gzip\r\nConnection: close\r\n\r\n")
+        status, headers, body = read_response(sock, buffer)
+        assert status == 200
+        assert gzip.decompress(body) == TEXT.encode()
+    assert compressor.compressed == 1
+
+
+def test_static_files_over_the_wire(serve, mode, tmp_path):
+    (tmp_path / "app.js").write_text(TEXT)
+    (tmp_path / "app.js.gz").write_bytes(gzip.compress(TEXT.encode()))
+    (tmp_path / "page.html").write_text(TEXT)
+    # small files are served from the in-memory cache, so only uncached files get the precompressed sibling
+    server = serve({"/static": StaticFileHandler(tmp_path, "/static", cache=False)}, mode=mode)
+
+    status, headers, body = request(server.port, "/static/app.js", headers={"Accept-Encoding": "gzip"})
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert body == (tmp_path / "app.js.gz").read_bytes()
+
+    status, identity, _ = request(server.port, "/static/page.html")
+    status, headers, body = request(server.port, "/static/page.html", headers={"Accept-Encoding": "gzip"})
+    assert gzip.decompress(body) == TEXT.encode()
+    assert not identity["etag"].startswith("W/")
+    assert headers["etag"] == "W/" + identity["etag"]
@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import pytest
+
+from client import connect, read_response, request
+from socketpulse import EncodedResponse, constant, methods
+from socketpulse import types
+from socketpulse.types import Request
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake time.time for the Date header, advanced by setting clock.now."""
+    clock = SimpleNamespace(now=1_800_000_000.0)
+    monkeypatch.setattr(types, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def make_request(method: str = "GET", version: str = "HTTP/1.1") -> Request:
+    return Request.from_components(f"{method} / {version}\r\nHost: test\r\n\r\n".encode(), b"", ("127.0.0.1", 1))
+
+
+def test_canned_response_bytes(clock):
+    response = EncodedResponse.canned(404)
+    assert EncodedResponse.canned(404) is response
+    assert response.encoded(make_request()) == (b"HTTP/1.1 404 Not Found\r\n"
+                                                b"Content-Type: text/plain\r\n"
+                                                b"Content-Length: 9\r\n"
+                                                b"Connection: close\r\n"
+                                                b"Date: Fri, 15 Jan 2027 08:00:00 GMT\r\n"
+                                                b"\r\n"
+                                                b"Not Found")
+    assert response.encoded(make_request(), keep_alive=True) == (b"HTTP/1.1 404 Not Found\r\n"
+                                                                 b"Content-Type: text/plain\r\n"
+                                                                 b"Content-Length: 9\r\n"
+                                                                 b"Connection: keep-alive\r\n"
+                                                                 b"Date: Fri, 15 Jan 2027 08:00:00 GMT\r\n"
+                                                                 b"\r\n"
+                                                                 b"Not Found")
+
+
+def test_canned_response_framings(clock):
+    response = EncodedResponse.canned(503, retry_after=0.2)
+    assert EncodedResponse.canned(503, retry_after=1) is response
+    assert b"\r\nRetry-After: 1\r\n" in response.encoded()
+    assert b"\r\nRetry-After: 3\r\n" in EncodedResponse.canned(503, retry_after=2.5).encoded()
+
+    # HEAD keeps the Content-Length of the body it leaves out
+    head = EncodedResponse.canned(404).encoded(make_request("HEAD"))
+    assert head.endswith(b"Content-Length: 9\r\nConnection: close\r\nDate: Fri, 15 Jan 2027 08:00:00 GMT\r\n\r\n")
+    # HTTP/1.0 clients are answered in kind
+    assert EncodedResponse.canned(404).encoded(make_request(version="HTTP/1.0")).startswith(b"HTTP/1.0 404 Not Found\r\n")
+
+
+def test_date_is_current_for_every_request(clock):
+    response = EncodedResponse(b"ok", headers={"Content-Type": "text/plain"})
+    first = response.encoded(make_request())
+    assert response.encoded(make_request()) is first
+    clock.now += 0.5
+    assert response.encoded(make_request()) is first
+    clock.now += 0.5
+    second = response.encoded(make_request())
+    assert second == first.replace(b"08:00:00", b"08:00:01")
+    # a Date the response was built with is kept
+    fixed = EncodedResponse(b"ok", headers={"Date": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert b"\r\nDate: Thu, 01 Jan 1970 00:00:00 GMT\r\n" in fixed.encoded(make_request())
+
+
+def test_encoded_response_needs_a_bytes_body():
+    with pytest.raises(TypeError):
+        EncodedResponse(iter([b"a"]))
+
+
+def constant_routes():
+    calls = []
+
+    class Routes:
+        @constant
+        @methods("GET", "HEAD")
+        def health(self) -> bytes:
+            calls.append(1)
+            return b"ok " * 1000
+
+    return Routes, calls
+
+
+def test_constant_handler_over_the_wire(serve, mode, clock):
+    Routes, calls = constant_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        for _ in range(3):
+            sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\nAccept-Encoding: gzip\r\n\r\n")
+            status, headers, body = read_response(sock, buffer)
+            assert (status, body) == (200, b"ok " * 1000)
+            assert headers["connection"] == "keep-alive"
+            assert headers["content-length"] == "3000"
+            # sent as encoded, never compressed
+            assert "content-encoding" not in headers
+            assert headers["date"] == types.http_date()
+            clock.now += 1
+
+        sock.sendall(b"HEAD /health HTTP/1.1\r\nHost: test\r\n\r\n")
+        status, headers, body = read_response(sock, buffer, head_only=True)
+        assert (status, headers["content-length"], headers["connection"]) == (200, "3000", "keep-alive")
+
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        status, headers, body = read_response(sock, buffer)
+        assert (status, body) == (200, b"ok " * 1000)
+        assert headers["connection"] == "close"
+        # the HEAD response had no body, or it would have been read as this response
+        assert buffer == b""
+        assert sock.recv(1) == b""
+    assert len(calls) == 1
+
+
+def test_canned_responses_over_the_wire(serve, mode, clock):
+    Routes, _ = constant_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        for _ in range(2):
+            sock.sendall(b"GET /nope HTTP/1.1\r\nHost: test\r\n\r\n")
+            status, headers, body = read_response(sock, buffer)
+            assert (status, body) == (404, b"Not Found")
+            assert headers["connection"] == "keep-alive"
+            assert headers["date"] == types.http_date()
+            clock.now += 1
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        assert read_response(sock, buffer)[0] == 200
+
+    status, headers, _ = request(server.port, "/nope", version="HTTP/1.0")
+    assert (status, headers["connection"]) == (404, "close")
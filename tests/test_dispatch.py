@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from socketpulse import Overloaded, WorkQueue
+
+
+def hold(queue: WorkQueue, release: threading.Event) -> None:
+    """Keeps a thread of the queue busy until release is set."""
+    started = threading.Event()
+    queue.submit(lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+
+
+def test_many_expired_items_are_shed_without_recursion():
+    queue = WorkQueue(1, max_queue=None, queue_timeout=0.01)
+    release = threading.Event()
+    try:
+        hold(queue, release)
+        futures = [queue.submit(lambda: "late") for _ in range(3000)]
+        time.sleep(0.05)
+        release.set()
+        for future in futures:
+            with pytest.raises(Overloaded):
+                future.result(5)
+        assert queue.stats.expired == 3000
+        # the thread that shed them is still serving
+        assert queue.submit(lambda: "on time").result(5) == "on time"
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_pool_grows_with_the_backlog_up_to_max_workers():
+    queue = WorkQueue(3)
+    release = threading.Event()
+    try:
+        assert queue.num_threads == 0
+        for expected in (1, 2, 3):
+            hold(queue, release)
+            assert queue.num_threads == expected
+        future = queue.submit(lambda: "queued")
+        assert (queue.num_threads, queue.queue_size) == (3, 1)
+        release.set()
+        assert future.result(5) == "queued"
+        assert queue.stats.threads_started == 3
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_pool_grows_once_queued_work_waited_scale_up_wait():
+    queue = WorkQueue(3, scale_up_wait=0.1)
+    release = threading.Event()
+    try:
+        hold(queue, release)
+        first = queue.submit(lambda: "first")
+        # as many queued items as threads, and none waited long enough yet
+        assert queue.num_threads == 1
+        time.sleep(0.15)
+        second = queue.submit(lambda: "second")
+        assert queue.num_threads == 2
+        assert first.result(5) == "first" and second.result(5) == "second"
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_idle_threads_retire_down_to_min_workers():
+    queue = WorkQueue(4, min_workers=2, idle_timeout=0.05)
+    release = threading.Event()
+    try:
+        for _ in range(4):
+            hold(queue, release)
+        assert queue.num_threads == 4
+        release.set()
+        assert wait_for(lambda: queue.num_threads == 2)
+        time.sleep(0.2)
+        assert queue.num_threads == 2
+        assert queue.stats.threads_retired == 2
+        # the pool grows again when work comes back
+        assert queue.submit(lambda: "again").result(5) == "again"
+    finally:
+        release.set()
+        queue.shutdown()
+
+
+def test_threads_stay_without_idle_timeout():
+    queue = WorkQueue(2)
+    release = threading.Event()
+    try:
+        hold(queue, release)
+        hold(queue, release)
+        release.set()
+        assert wait_for(lambda: queue.idle_threads == 2)
+        time.sleep(0.1)
+        assert queue.num_threads == 2
+        assert queue.stats.threads_retired == 0
+    finally:
+        queue.shutdown()
+
+
+def test_a_thread_that_dies_is_replaced(monkeypatch):
+    queue = WorkQueue(1)
+    crashes = []
+    monkeypatch.setattr(threading, "excepthook", lambda args: crashes.append(args.exc_value))
+    pop = queue._pop
+
+    def pop_once_broken():
+        queue._pop = pop
+        raise RuntimeError("broken pop")
+
+    queue._pop = pop_once_broken
+    try:
+        future = queue.submit(lambda: "survived")
+        assert future.result(5) == "survived"
+        assert [str(e) for e in crashes] == ["broken pop"]
+        assert queue.num_threads == 1
+        assert queue.stats.threads_started == 2
+    finally:
+        queue.shutdown()
@@ -0,0 +1,68 @@
+from client import connect, read_response
+
+
+class Routes:
+    def hello(self, name: str = "world") -> str:
+        return f"hello {name}"
+
+
+def get(path: str, connection: str | None = None, version: str = "HTTP/1.1") -> bytes:
+    head = f"GET {path} {version}\r\nHost: test\r\n"
+    if connection is not None:
+        head += f"Connection: {connection}\r\n"
+    return (head + "\r\n").encode()
+
+
+def test_requests_share_a_connection(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        for name in ("a", "b", "c"):
+            sock.sendall(get(f"/hello?name={name}"))
+            status, headers, body = read_response(sock, buffer)
+            assert (status, body) == (200, f"hello {name}".encode())
+            assert headers["connection"] == "keep-alive"
+
+
+def test_pipelined_requests_are_answered_in_order(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        sock.sendall(b"".join(get(f"/hello?name={i}") for i in range(5)) + get("/hello?name=last", "close"))
+        buffer = bytearray()
+        bodies = [read_response(sock, buffer)[2] for _ in range(6)]
+        assert bodies == [f"hello {i}".encode() for i in range(5)] + [b"hello last"]
+        # the server closes after the request that asked it to
+        assert sock.recv(1) == b""
+
+
+def test_connection_close_is_honored(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        sock.sendall(get("/hello", "close"))
+        buffer = bytearray()
+        status, headers, _ = read_response(sock, buffer)
+        assert (status, headers["connection"]) == (200, "close")
+        assert sock.recv(1) == b""
+
+
+def test_http_1_0_closes_unless_asked_to_keep_alive(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        sock.sendall(get("/hello", "keep-alive", version="HTTP/1.0"))
+        assert read_response(sock, buffer)[0] == 200
+        sock.sendall(get("/hello", version="HTTP/1.0"))
+        status, headers, _ = read_response(sock, buffer)
+        assert (status, headers["connection"]) == (200, "close")
+        assert sock.recv(1) == b""
+
+
+def test_max_keep_alive_requests(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4, max_keep_alive_requests=2)
+    with connect(server.port) as sock:
+        buffer = bytearray()
+        sock.sendall(get("/hello"))
+        assert read_response(sock, buffer)[1]["connection"] == "keep-alive"
+        sock.sendall(get("/hello"))
+        assert read_response(sock, buffer)[1]["connection"] == "close"
+        assert sock.recv(1) == b""
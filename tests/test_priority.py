@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from client import connect, read_response
+from socketpulse import Overloaded, Priority, WorkQueue, tag
+
+
+def wait_for_queue_size(queue: WorkQueue, size: int) -> None:
+    for _ in range(500):
+        if queue.queue_size == size:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"the queue never held {size} items")
+
+
+@pytest.fixture
+def pool():
+    """A WorkQueue factory whose single thread is held busy until release is set, so that work queues up."""
+    queues, release = [], threading.Event()
+
+    def start(**kwargs) -> WorkQueue:
+        queue = WorkQueue(1, **kwargs)
+        queues.append(queue)
+        started = threading.Event()
+        queue.submit(lambda: started.set() or release.wait(5))
+        assert started.wait(5)
+        return queue
+
+    start.release = release
+    yield start
+
+    release.set()
+    for queue in queues:
+        queue.shutdown(cancel_futures=True)
+
+
+def test_higher_classes_run_first(pool):
+    queue = pool(priority_aging=None)
+    order = []
+    futures = [queue.submit_with_priority(priority, order.append, name)
+               for priority, name in ((Priority.LOW, "low"), (Priority.NORMAL, "normal"), (Priority.HIGH, "high"),
+                                      (Priority.LOW, "low 2"), (Priority.HIGH, "high 2"))]
+    pool.release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["high", "high 2", "normal", "low", "low 2"]
+
+
+def test_work_that_waited_past_priority_aging_runs_first(pool):
+    queue = pool(priority_aging=0.05)
+    order = []
+    futures = [queue.submit_with_priority(Priority.LOW, order.append, "low")]
+    time.sleep(0.1)
+    futures += [queue.submit_with_priority(Priority.HIGH, order.append, "high")]
+    pool.release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["low", "high"]
+
+
+def test_full_queue_sheds_lower_classes_first(pool):
+    queue = pool(max_queue=2)
+    low = queue.submit_with_priority(Priority.LOW, lambda: "low")
+    normal = queue.submit_with_priority(Priority.NORMAL, lambda: "normal")
+    high = queue.submit_with_priority(Priority.HIGH, lambda: "high")
+    with pytest.raises(Overloaded):
+        low.result(0)
+    # nothing of a lower class is left to shed
+    with pytest.raises(Overloaded):
+        queue.submit_with_priority(Priority.LOW, lambda: "low 2")
+    pool.release.set()
+    assert (normal.result(5), high.result(5)) == ("normal", "high")
+    assert (queue.stats.dropped, queue.stats.rejected) == (1, 1)
+
+
+def priority_routes():
+    started, release, order = threading.Semaphore(0), threading.Event(), []
+
+    class Routes:
+        def slow(self) -> str:
+            started.release()
+            release.wait(5)
+            return "slow"
+
+        @tag(priority=Priority.LOW)
+        def low(self) -> str:
+            order.append("low")
+            return "low"
+
+        @tag(priority=Priority.HIGH)
+        def high(self) -> str:
+            order.append("high")
+            return "high"
+
+    return Routes, started, release, order
+
+
+def send_get(port: int, path: str):
+    sock = connect(port)
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n".encode())
+    return sock
+
+
+def dispatch_in_order(serve, mode, paths, delay=0.0, **kwargs) -> list:
+    """Queues requests for paths, delay seconds apart, behind slow requests that hold every thread, and returns the
+    order their handlers ran in."""
+    Routes, started, release, order = priority_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=2, min_connection_threads=2, **kwargs)
+    queue = server.thread_pool_executor
+    socks = []
+    try:
+        for _ in range(2):
+            wait_for_queue_size(queue, 0)
+            socks.append(send_get(server.port, "/slow"))
+            assert started.acquire(timeout=5)
+        for i, path in enumerate(paths, 1):
+            socks.append(send_get(server.port, path))
+            wait_for_queue_size(queue, i)
+            time.sleep(delay)
+        release.set()
+        for sock in socks:
+            assert read_response(sock, bytearray())[0] == 200
+    finally:
+        release.set()
+        for sock in socks:
+            sock.close()
+    return order
+
+
+# the blocking mode dispatches connections, not requests, so priorities don't apply to it
+@pytest.mark.parametrize("mode", ["selector", "asyncio"])
+def test_requests_are_dispatched_by_priority(serve, mode):
+    assert dispatch_in_order(serve, mode, ["/low", "/high"], priority_aging=None) == ["high", "low"]
+
+
+@pytest.mark.parametrize("mode", ["selector", "asyncio"])
+def test_requests_age_into_priority(serve, mode):
+    assert dispatch_in_order(serve, mode, ["/low", "/high"], delay=0.1, priority_aging=0.05) == ["low", "high"]
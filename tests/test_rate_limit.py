@@ -0,0 +1,48 @@
+from client import request
+from socketpulse import RateLimiter, tag
+
+
+class Routes:
+    def hello(self) -> str:
+        return "hello"
+
+
+def limited_routes():
+    # a limiter of its own for every server, as its buckets outlive the server
+    class LimitedRoutes(Routes):
+        @tag(rate_limit=RateLimiter(0.5, burst=1))
+        def limited(self) -> str:
+            return "limited"
+
+    return LimitedRoutes
+
+
+def test_client_over_the_rate_limit_gets_429(serve, mode):
+    server = serve(Routes, mode=mode, rate_limit=RateLimiter(0.5, burst=2))
+    assert request(server.port, "/hello")[0] == 200
+    assert request(server.port, "/hello")[0] == 200
+    status, headers, _ = request(server.port, "/hello")
+    assert status == 429
+    assert headers["retry-after"] == "2"
+    assert server.rate_limit.rejected >= 1
+
+
+def test_rate_limit_keyed_on_a_header(serve, mode):
+    server = serve(Routes, mode=mode, rate_limit=RateLimiter(0.5, burst=1, header="X-Api-Key"))
+    assert request(server.port, "/hello", headers={"X-Api-Key": "a"})[0] == 200
+    assert request(server.port, "/hello", headers={"X-Api-Key": "a"})[0] == 429
+    # another key has its own bucket, and so do clients without one
+    assert request(server.port, "/hello", headers={"X-Api-Key": "b"})[0] == 200
+    assert request(server.port, "/hello")[0] == 200
+    assert request(server.port, "/hello")[0] == 429
+
+
+def test_per_route_rate_limit(serve, mode):
+    server = serve(limited_routes(), mode=mode)
+    assert request(server.port, "/limited")[0] == 200
+    status, headers, _ = request(server.port, "/limited")
+    assert status == 429
+    assert headers["retry-after"] == "2"
+    # other routes are not limited
+    for _ in range(3):
+        assert request(server.port, "/hello")[0] == 200
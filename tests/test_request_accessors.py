@@ -0,0 +1,64 @@
+import json
+
+from client import request
+from socketpulse import Request, RequestBody, RequestStream, methods, post
+from socketpulse.types import HeaderBytes
+
+
+class Routes:
+    @post
+    def parsed(self, request: Request, **kwargs) -> dict:
+        return {"route": request.route, "query": request.query.get_all("a"), "json": request.json,
+                "form": dict(request.form) if request.form else None}
+
+    @methods("GET", "POST")
+    def greet(self, name: str = "world") -> str:
+        return f"hello {name}"
+
+
+def test_request_accessors(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, _, body = request(server.port, "/parsed?a=1&a=2", "POST", headers={"Content-Type": "application/json"},
+                              body=b'{"x": [1, 2]}')
+    assert status == 200
+    assert json.loads(body) == {"route": "/parsed", "query": ["1", "2"], "json": {"x": [1, 2]}, "form": None}
+
+    status, _, body = request(server.port, "/parsed", "POST",
+                              headers={"Content-Type": "application/x-www-form-urlencoded"}, body=b"b=1&c=x+y")
+    assert status == 200
+    assert json.loads(body)["form"] == {"b": "1", "c": "x y"}
+
+
+def test_arguments_come_from_the_query_and_json_body(serve, mode):
+    server = serve(Routes, mode=mode)
+    assert request(server.port, "/greet?name=query")[2] == b"hello query"
+    assert request(server.port, "/greet", "POST", headers={"Content-Type": "application/json"},
+                   body=b'{"name": "json"}')[2] == b"hello json"
+    # form bodies are parsed on request.form, not bound to parameters
+    assert request(server.port, "/greet", "POST", headers={"Content-Type": "application/x-www-form-urlencoded"},
+                   body=b"name=form")[2] == b"hello world"
+
+
+def test_body_is_a_request_body():
+    request = Request.from_components(b"POST / HTTP/1.1\r\nContent-Length: 2\r\n", b"hi", ("127.0.0.1", 1))
+    assert type(request.body) is RequestBody and request.body == b"hi"
+    assert request.body is request.body
+
+    request = Request("POST", "/", stream=RequestStream.from_bytes(b"streamed"))
+    assert type(request.body) is RequestBody and request.body == b"streamed"
+
+    request.body = b"set"
+    assert type(request.body) is RequestBody and request.body == b"set"
+
+
+def test_header_bytes_are_built_once():
+    request = Request.from_components(b"GET / HTTP/1.1\r\nHost: test\r\n", b"", ("127.0.0.1", 1))
+    assert type(request.header_bytes) is HeaderBytes and request.header_bytes == b"Host: test\r\n"
+    assert request.header_bytes is request.header_bytes
+
+    request = Request("GET", "/", header={"Host": "test"})
+    assert request.header_bytes is request.header_bytes
+    assert request.header_bytes.to_dict() == {"Host": "test"}
+    # new headers replace the serialized ones
+    request.headers = {"Host": "other"}
+    assert request.header_bytes.to_dict() == {"Host": "other"}
@@ -0,0 +1,81 @@
+import hashlib
+
+from client import connect, read_response, request
+from socketpulse import Body, RequestStream, post
+
+
+class Routes:
+    @post
+    def echo(self, body: Body) -> bytes:
+        return bytes(body)
+
+    @post
+    def digest(self, stream: RequestStream) -> str:
+        h = hashlib.sha256()
+        size = 0
+        for chunk in stream:
+            h.update(chunk)
+            size += len(chunk)
+        return f"{size} {h.hexdigest()}"
+
+
+def chunked(*chunks: bytes) -> bytes:
+    return b"".join(b"%x\r\n%s\r\n" % (len(c), c) for c in chunks) + b"0\r\n\r\n"
+
+
+def test_body_with_content_length(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, _, body = request(server.port, "/echo", "POST", body=b"hello body")
+    assert (status, body) == (200, b"hello body")
+
+
+def test_chunked_request_body(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, _, body = request(server.port, "/echo", "POST", headers={"Transfer-Encoding": "chunked"},
+                              body=chunked(b"hello ", b"chunked ", b"body"))
+    assert (status, body) == (200, b"hello chunked body")
+
+
+def test_large_body_is_streamed(serve, mode):
+    data = bytes(range(256)) * 20000
+    server = serve(Routes, mode=mode, spool_threshold=64 * 1024)
+    status, _, body = request(server.port, "/digest", "POST", body=data)
+    assert (status, body) == (200, f"{len(data)} {hashlib.sha256(data).hexdigest()}".encode())
+
+    status, _, body = request(server.port, "/digest", "POST", headers={"Transfer-Encoding": "chunked"},
+                              body=chunked(*(data[i:i + 100000] for i in range(0, len(data), 100000))))
+    assert (status, body) == (200, f"{len(data)} {hashlib.sha256(data).hexdigest()}".encode())
+
+
+def test_expect_100_continue(serve, mode):
+    server = serve(Routes, mode=mode)
+    with connect(server.port) as sock:
+        sock.sendall(b"POST /echo HTTP/1.1\r\nHost: test\r\nContent-Length: 5\r\nExpect: 100-continue\r\n"
+                     b"Connection: close\r\n\r\n")
+        buffer = bytearray()
+        assert read_response(sock, buffer)[0] == 100
+        sock.sendall(b"hello")
+        status, _, body = read_response(sock, buffer)
+        assert (status, body) == (200, b"hello")
+
+
+def test_declared_body_over_max_body_size_is_413(serve, mode):
+    server = serve(Routes, mode=mode, max_body_size=1000)
+    status, _, _ = request(server.port, "/echo", "POST", body=b"x" * 1001)
+    assert status == 413
+    status, _, body = request(server.port, "/echo", "POST", body=b"x" * 1000)
+    assert (status, len(body)) == (200, 1000)
+
+
+def test_chunked_body_over_max_body_size_is_413(serve, mode):
+    server = serve(Routes, mode=mode, max_body_size=1000)
+    status, _, _ = request(server.port, "/echo", "POST", headers={"Transfer-Encoding": "chunked"},
+                           body=chunked(b"x" * 600, b"x" * 600))
+    assert status == 413
+
+
+def test_expect_100_continue_over_max_body_size_is_413_without_continue(serve, mode):
+    server = serve(Routes, mode=mode, max_body_size=1000)
+    with connect(server.port) as sock:
+        sock.sendall(b"POST /echo HTTP/1.1\r\nHost: test\r\nContent-Length: 5000\r\nExpect: 100-continue\r\n\r\n")
+        assert read_response(sock, bytearray())[0] == 413
@@ -0,0 +1,47 @@
+import pytest
+
+from client import connect, read_response, request
+from socketpulse.types import Headers
+
+
+class Routes:
+    def hello(self) -> str:
+        return "hello"
+
+
+def test_head_over_max_header_size_is_431(serve, mode):
+    server = serve(Routes, mode=mode, max_header_size=1024)
+    status, _, _ = request(server.port, "/hello", headers={"X-Big": "x" * 2000})
+    assert status == 431
+    status, _, body = request(server.port, "/hello", headers={"X-Small": "x" * 500})
+    assert (status, body) == (200, b"hello")
+
+
+def test_more_than_max_headers_is_431(serve, mode):
+    server = serve(Routes, mode=mode, max_headers=10)
+    status, _, _ = request(server.port, "/hello", headers={f"X-H{i}": "1" for i in range(20)})
+    assert status == 431
+
+
+def test_unterminated_huge_head_is_431(serve, mode):
+    server = serve(Routes, mode=mode, max_header_size=1024)
+    with connect(server.port) as sock:
+        sock.sendall(b"GET /hello HTTP/1.1\r\nX-Big: " + b"x" * 4096)
+        assert read_response(sock, bytearray())[0] == 431
+
+
+def test_malformed_header_line_is_400(serve, mode):
+    server = serve(Routes, mode=mode)
+    with connect(server.port) as sock:
+        sock.sendall(b"GET /hello HTTP/1.1\r\nHost: test\r\nnot a header\r\n\r\n")
+        assert read_response(sock, bytearray())[0] == 400
+
+
+@pytest.mark.parametrize("line", [b"Host", b"Content-Type", b"X-Uncommon", b": no name", b"Bad Name: x"])
+def test_header_line_without_a_valid_name_and_colon_is_400(serve, mode, line):
+    with pytest.raises(ValueError):
+        Headers.parse(b"Accept: */*\r\n" + line + b"\r\n")
+    server = serve(Routes, mode=mode)
+    with connect(server.port) as sock:
+        sock.sendall(b"GET /hello HTTP/1.1\r\n" + line + b"\r\n\r\n")
+        assert read_response(sock, bytearray())[0] == 400
@@ -0,0 +1,92 @@
+import random
+
+from client import request
+from socketpulse.handlers import matches_variadic_route, sort_variadic_routes
+from socketpulse.routing import RouteTrie
+
+
+def trie(*patterns, **kwargs) -> RouteTrie:
+    t = RouteTrie(**kwargs)
+    for pattern in patterns:
+        t.add(pattern, pattern)
+    return t
+
+
+def test_more_static_parts_win():
+    t = trie("/users/{id}/{tab}", "/users/{id}/posts", "/users/me/{tab}")
+    assert t.match("/users/1/posts") == ("/users/{id}/posts", "/users/{id}/posts", {"id": "1"})
+    # as many static parts: more static characters win
+    assert t.match("/users/me/posts")[0] == "/users/{id}/posts"
+    assert t.match("/users/me/likes")[0] == "/users/me/{tab}"
+    assert t.match("/users/1/likes") == ("/users/{id}/{tab}", "/users/{id}/{tab}", {"id": "1", "tab": "likes"})
+    assert t.match("/users/1") is None
+    assert t.match("/users/1/posts/2") is None
+
+
+def test_mixed_segments_and_variadic_tail():
+    t = trie("/files/{name}", "/files/{name}.{ext}", "/x/{a}_{b}")
+    assert t.match("/files/readme") == ("/files/{name}", "/files/{name}", {"name": "readme"})
+    # more static characters win
+    assert t.match("/files/a.txt")[2] == {"name": "a", "ext": "txt"}
+    # a segment ending with a variable captures the rest of the segment, never past a "/"
+    assert t.match("/x/1_2_3")[2] == {"a": "1", "b": "2_3"}
+    assert t.match("/x/1-2") is None
+    assert t.match("/x/1_2/3") is None
+
+
+def test_a_path_spelling_out_the_pattern_is_not_a_match():
+    assert trie("/a/{b}").match("/a/{b}") is None
+
+
+def test_cache_hits_misses_and_eviction():
+    t = trie("/a/{b}", cache_size=2)
+    first = t.match("/a/1")
+    assert "/a/1" in t._cache
+    # hits return copies, so callers can't change what is cached
+    first[2]["b"] = "changed"
+    assert t.match("/a/1")[2] == {"b": "1"}
+    # misses are cached too
+    assert t.match("/nope") is None
+    assert list(t._cache) == ["/a/1", "/nope"]
+    # a hit makes a path the most recently used, so the least recently used one is evicted
+    t.match("/a/1")
+    t.match("/a/2")
+    assert list(t._cache) == ["/a/1", "/a/2"]
+    # adding a route clears the cache, as it may change the best match of a cached path
+    t.add("/a/{b}/c", "/a/{b}/c")
+    assert not t._cache
+
+
+def test_same_precedence_as_sort_variadic_routes():
+    rng = random.Random(0)
+    segments = ["a", "b", "{x}", "{y}", "{x}.{y}", "a{x}", "{z}_b"]
+    for _ in range(50):
+        patterns = set()
+        while len(patterns) < 8:
+            parts = rng.choices(segments, k=rng.randint(1, 3))
+            pattern = "/" + "/".join(parts)
+            if "{" in pattern and len({p for p in parts if "{" in p}) == len([p for p in parts if "{" in p]):
+                names = [n for p in parts for n in ("x", "y", "z") if "{" + n + "}" in p]
+                if len(names) == len(set(names)):
+                    patterns.add(pattern)
+        t = trie(*patterns)
+        ordered = sort_variadic_routes(patterns)
+        for _ in range(30):
+            path = "/" + "/".join(rng.choices(["a", "b", "ab", "a.b", "1_b", "q"], k=rng.randint(1, 3)))
+            expected = next(((p, m) for p in ordered if (m := matches_variadic_route(path, p)) is not False), None)
+            found = t.match(path)
+            assert (found and (found[0], found[2])) == expected, (patterns, path)
+
+
+def test_server_route_precedence(serve, mode):
+    server = serve({
+        "/hello/me": lambda: "static",
+        "/hello/{name}": lambda name: f"param {name}",
+        "/hello/{name}/{rest}": lambda name, rest: f"two {name} {rest}",
+        "/hello/{name}/x": lambda name: f"static tail {name}",
+    }, mode=mode)
+    assert request(server.port, "/hello/me")[2] == b"static"
+    assert request(server.port, "/hello/bob")[2] == b"param bob"
+    assert request(server.port, "/hello/bob/x")[2] == b"static tail bob"
+    assert request(server.port, "/hello/bob/zed")[2] == b"two bob zed"
+    assert request(server.port, "/hello/bob/y/z")[0] == 404
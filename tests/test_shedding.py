@@ -0,0 +1,89 @@
+import threading
+import time
+
+from client import connect, read_response, request
+
+
+def blocking_routes():
+    started, release = threading.Semaphore(0), threading.Event()
+
+    class Routes:
+        def slow(self) -> str:
+            started.release()
+            release.wait(5)
+            return "slow"
+
+        def fast(self) -> str:
+            return "fast"
+
+    return Routes, started, release
+
+
+def wait_for_queue_size(server, size: int) -> None:
+    for _ in range(500):
+        if server.thread_pool_executor.queue_size == size:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"the queue never held {size} items")
+
+
+def occupy(server, started: threading.Semaphore, threads: int = 2) -> list:
+    """Ties up every thread of the pool with a slow request, returning their sockets."""
+    socks = []
+    for _ in range(threads):
+        # one at a time, so that the queue never holds more than one item (even the fixture's readiness probe)
+        wait_for_queue_size(server, 0)
+        socks.append(send_get(server.port, "/slow"))
+        assert started.acquire(timeout=5)
+    return socks
+
+
+def send_get(port: int, path: str):
+    sock = connect(port)
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n".encode())
+    return sock
+
+
+def test_full_queue_is_shed_with_503_and_retry_after(serve, mode):
+    Routes, started, release = blocking_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=2, max_queue=1, retry_after=3)
+    slow = occupy(server, started)
+    try:
+        with send_get(server.port, "/fast") as queued:
+            # the queued request must be taken in before the one that overflows
+            wait_for_queue_size(server, 1)
+            status, headers, _ = request(server.port, "/fast")
+            assert status == 503
+            assert headers["retry-after"] == "3"
+            release.set()
+            for sock in slow:
+                assert read_response(sock, bytearray())[::2] == (200, b"slow")
+            assert read_response(queued, bytearray())[::2] == (200, b"fast")
+    finally:
+        release.set()
+        for sock in slow:
+            sock.close()
+    assert server.thread_pool_executor.stats.rejected == 1
+
+
+def test_work_past_queue_timeout_is_shed(serve, mode):
+    Routes, started, release = blocking_routes()
+    server = serve(Routes, mode=mode, num_connection_threads=2, queue_timeout=0.1)
+    slow = occupy(server, started)
+    try:
+        with send_get(server.port, "/fast") as late:
+            time.sleep(0.3)
+            release.set()
+            status, headers, _ = read_response(late, bytearray())
+            assert status == 503
+            assert "retry-after" in headers
+            for sock in slow:
+                assert read_response(sock, bytearray())[::2] == (200, b"slow")
+    finally:
+        release.set()
+        for sock in slow:
+            sock.close()
+    assert server.thread_pool_executor.stats.expired == 1
+
+    status, _, body = request(server.port, "/fast")
+    assert (status, body) == (200, b"fast")
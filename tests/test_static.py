@@ -0,0 +1,113 @@
+import threading
+
+from client import connect, read_response, request
+from socketpulse import StaticFileHandler
+
+
+def test_directory_listing(serve, mode, tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.txt").write_text("a")
+    (tmp_path / "sub" / "b.txt").write_text("b")
+    server = serve({"/static": tmp_path}, mode=mode)
+
+    status, _, body = request(server.port, "/static/sub")
+    assert status == 200
+    assert b"<a href='/static/sub/a.txt'>a.txt</a>" in body
+    assert b"<a href='/static/sub/b.txt'>b.txt</a>" in body
+
+    # the server is still serving after the listing
+    status, _, body = request(server.port, "/static/sub/a.txt")
+    assert (status, body) == (200, b"a")
+
+
+def test_directory_index(serve, mode, tmp_path):
+    (tmp_path / "index.html").write_text("<p>index</p>")
+    server = serve({"/static": tmp_path}, mode=mode)
+
+    status, headers, body = request(server.port, "/static")
+    assert (status, body) == (200, b"<p>index</p>")
+    assert headers["content-type"].startswith("text/html")
+
+
+def test_missing_file(serve, mode, tmp_path):
+    server = serve({"/static": tmp_path}, mode=mode)
+    status, _, _ = request(server.port, "/static/nope.txt")
+    assert status == 404
+
+
+def test_range_requests(serve, mode, tmp_path):
+    data = bytes(range(256)) * 40
+    (tmp_path / "data.bin").write_bytes(data)
+    server = serve({"/static": tmp_path}, mode=mode, compression=False)
+
+    status, headers, body = request(server.port, "/static/data.bin", headers={"Range": "bytes=100-199"})
+    assert (status, body) == (206, data[100:200])
+    assert headers["content-range"] == f"bytes 100-199/{len(data)}"
+
+    status, _, body = request(server.port, "/static/data.bin", headers={"Range": "bytes=-10"})
+    assert (status, body) == (206, data[-10:])
+
+    status, _, body = request(server.port, "/static/data.bin", headers={"Range": f"bytes={len(data) - 5}-"})
+    assert (status, body) == (206, data[-5:])
+
+    status, headers, body = request(server.port, "/static/data.bin", headers={"Range": "bytes=0-1,10-11"})
+    assert status == 206
+    assert headers["content-type"].startswith("multipart/byteranges")
+    assert data[0:2] in body and data[10:12] in body
+
+
+def test_unsatisfiable_range_is_416(serve, mode, tmp_path):
+    (tmp_path / "data.bin").write_bytes(b"0123456789")
+    server = serve({"/static": tmp_path}, mode=mode, compression=False)
+    status, headers, _ = request(server.port, "/static/data.bin", headers={"Range": "bytes=50-60"})
+    assert status == 416
+    assert headers["content-range"] == "bytes */10"
+
+
+def test_etag_and_last_modified_give_304(serve, mode, tmp_path):
+    (tmp_path / "page.txt").write_text("cached")
+    server = serve({"/static": tmp_path}, mode=mode)
+
+    status, headers, body = request(server.port, "/static/page.txt")
+    assert (status, body) == (200, b"cached")
+    etag, last_modified = headers["etag"], headers["last-modified"]
+
+    status, headers, body = request(server.port, "/static/page.txt", headers={"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+    assert headers["etag"] == etag
+
+    status, _, _ = request(server.port, "/static/page.txt", headers={"If-Modified-Since": last_modified})
+    assert status == 304
+
+    status, _, body = request(server.port, "/static/page.txt", headers={"If-None-Match": '"other"'})
+    assert (status, body) == (200, b"cached")
+
+
+def test_stale_range_is_ignored(serve, mode, tmp_path):
+    (tmp_path / "data.bin").write_bytes(b"0123456789")
+    server = serve({"/static": tmp_path}, mode=mode, compression=False)
+    status, _, body = request(server.port, "/static/data.bin", headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert (status, body) == (200, b"0123456789")
+
+
+def test_slow_static_match_does_not_block_other_requests(serve, mode, tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    matching, release = threading.Event(), threading.Event()
+
+    class SlowDisk(StaticFileHandler):
+        def match(self, route: str) -> bool:
+            matching.set()
+            release.wait(10)
+            return super().match(route)
+
+    server = serve({"/static": SlowDisk(tmp_path, "/static"), "/fast": lambda: "fast"}, mode=mode,
+                   num_connection_threads=4)
+    try:
+        with connect(server.port) as slow:
+            slow.sendall(b"GET /static/a.txt HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+            assert matching.wait(5)
+            assert request(server.port, "/fast")[::2] == (200, b"fast")
+            release.set()
+            assert read_response(slow, bytearray())[::2] == (200, b"a")
+    finally:
+        release.set()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+import time
+
+from client import connect, read_response, request
+from socketpulse import JSONResponse
+
+
+class Routes:
+    def small(self) -> dict:
+        return {"hi": "bob"}
+
+    def big(self) -> list:
+        return [{"i": i} for i in range(JSONResponse.stream_min_items * 20)]
+
+    def items(self):
+        return JSONResponse(iter(range(5)))
+
+    def generated_async(self):
+        async def chunks():
+            for chunk in (b"hello ", b"async ", "world"):
+                await asyncio.sleep(0.01)
+                yield chunk
+        return chunks()
+
+    def fast(self) -> str:
+        return "fast"
+
+    def generated(self):
+        def chunks():
+            yield b"hello "
+            yield "world"
+        return chunks()
+
+
+def test_small_json_has_content_length(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, headers, body = request(server.port, "/small")
+    assert status == 200
+    assert headers["content-length"] == str(len(body))
+    assert json.loads(body) == {"hi": "bob"}
+
+
+def test_large_json_list_is_streamed_chunked(serve, mode):
+    server = serve(Routes, mode=mode, compression=False)
+    status, headers, body = request(server.port, "/big")
+    assert status == 200
+    assert headers["transfer-encoding"] == "chunked"
+    assert json.loads(body) == Routes().big()
+
+
+def test_json_iterator(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, _, body = request(server.port, "/items")
+    assert (status, json.loads(body)) == (200, [0, 1, 2, 3, 4])
+
+
+def test_generator_body_is_chunked(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, headers, body = request(server.port, "/generated")
+    assert status == 200
+    assert headers["transfer-encoding"] == "chunked"
+    assert body == b"hello world"
+
+
+def test_async_generator_body(serve, mode):
+    server = serve(Routes, mode=mode, num_connection_threads=4)
+    status, headers, body = request(server.port, "/generated_async")
+    assert (status, headers["transfer-encoding"], body) == (200, "chunked", b"hello async world")
+
+
+def test_http_1_0_stream_is_delimited_by_close(serve, mode):
+    server = serve(Routes, mode=mode)
+    status, headers, body = request(server.port, "/generated", version="HTTP/1.0")
+    assert status == 200
+    assert "transfer-encoding" not in headers
+    assert body == b"hello world"
+
+
+def test_slow_stream_does_not_stall_other_connections(serve, mode):
+    first_chunk, release = threading.Event(), threading.Event()
+
+    class SlowRoutes(Routes):
+        def slow(self):
+            def chunks():
+                yield b"first "
+                first_chunk.set()
+                release.wait(5)
+                yield b"last"
+            return chunks()
+
+    server = serve(SlowRoutes, mode=mode, num_connection_threads=4)
+    try:
+        with connect(server.port) as slow:
+            slow.sendall(b"GET /slow HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+            assert first_chunk.wait(5)
+            start = time.monotonic()
+            assert request(server.port, "/fast")[::2] == (200, b"fast")
+            assert time.monotonic() - start < 1
+            release.set()
+            assert read_response(slow, bytearray())[::2] == (200, b"first last")
+    finally:
+        release.set()
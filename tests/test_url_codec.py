@@ -0,0 +1,59 @@
+import pytest
+
+from socketpulse.types import Query, url_decode, url_encode
+
+
+def test_plus():
+    assert url_decode("a+b", plus=True) == "a b"
+    assert url_decode("a+b") == "a+b"
+    # an escaped plus is a plus either way
+    assert url_decode("a%2Bb", plus=True) == "a+b"
+    assert url_decode("a%2bb") == "a+b"
+
+
+def test_hex_case():
+    assert url_decode("%2F%2f") == "//"
+    assert url_decode("%C3%A9%c3%a9") == "éé"
+
+
+def test_multibyte_utf8():
+    assert url_decode("%E2%82%AC%20%F0%9F%98%80") == "€ 😀"
+    assert url_encode("€ 😀") == "%E2%82%AC%20%F0%9F%98%80"
+
+
+@pytest.mark.parametrize("s", ["%", "100%", "%4", "%zz", "%%41", "a%2", "%G1x"])
+def test_malformed_escapes_are_kept(s):
+    assert url_decode(s) == s.replace("%41", "A")
+
+
+def test_invalid_utf8_is_replaced():
+    assert url_decode("a%FFb") == "a�b"
+    assert url_decode("%C3") == "�"
+
+
+def test_unreserved_characters_are_not_encoded():
+    safe = "AZaz09-._~"
+    assert url_encode(safe) is safe
+    assert url_encode("a b/c?d=e&f") == "a%20b%2Fc%3Fd%3De%26f"
+
+
+@pytest.mark.parametrize("s", ["", "plain", "a b+c", "100%", "€/😀?&=#", "%41", "\x00\x7f"])
+def test_round_trip(s):
+    assert url_decode(url_encode(s)) == s
+    assert url_decode(url_encode(s), plus=True) == s
+
+
+def test_query_parse():
+    q = Query.parse("a=1&b=x+y&a=2&c&d=%26%3D&&e=")
+    assert q == {"a": "2", "b": "x y", "c": "", "d": "&=", "e": ""}
+    assert q.get_all("a") == ["1", "2"]
+    assert q.get_all("b") == ["x y"]
+    assert q.get_all("missing") == []
+    # copies keep the repeated values
+    assert Query(q).get_all("a") == ["1", "2"]
+
+
+def test_query_round_trip():
+    q = Query.parse("name=J%C3%BCrgen+S&path=%2Fa%2Fb&q=1%2B1")
+    assert q == {"name": "Jürgen S", "path": "/a/b", "q": "1+1"}
+    assert Query.parse(str(q)[1:]) == q
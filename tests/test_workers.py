@@ -0,0 +1,77 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from client import free_port, request
+
+SERVER = """
+import os
+import socket
+import sys
+
+from socketpulse import Server
+
+
+class Routes:
+    def pid(self) -> str:
+        return str(os.getpid())
+
+
+Server(Routes, port=int(sys.argv[1]), host="127.0.0.1", mode=sys.argv[2], workers=2, reuse_port=sys.argv[3] == "1",
+       backlog=64, socket_options={socket.SOL_SOCKET: {socket.SO_REUSEADDR: 1}})
+"""
+
+
+def worker_pid(port: int) -> int:
+    status, _, body = request(port, "/pid")
+    assert status == 200
+    return int(body)
+
+
+@pytest.mark.parametrize("reuse_port", [False, True])
+@pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM])
+def test_workers_accept_connections_and_stop_on_signals(mode, reuse_port, signum, tmp_path):
+    script = tmp_path / "server.py"
+    script.write_text(SERVER)
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parents[1] / "src")}
+    parent = subprocess.Popen([sys.executable, str(script), str(port), mode, str(int(reuse_port))], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                pids = {worker_pid(port)}
+                break
+            except OSError:
+                assert parent.poll() is None and time.monotonic() < deadline
+                time.sleep(0.05)
+        for _ in range(200):
+            if len(pids) > 1:
+                break
+            pids.add(worker_pid(port))
+        # every connection was served by a worker, and more than one worker accepted them
+        assert len(pids) == 2
+        assert parent.pid not in pids
+
+        if signum == signal.SIGINT:
+            # like Ctrl+C in a terminal, which interrupts the workers too
+            os.killpg(parent.pid, signum)
+        else:
+            parent.send_signal(signum)
+        _, stderr = parent.communicate(timeout=10)
+        assert parent.returncode == 0
+        assert b"Traceback" not in stderr and b"KeyboardInterrupt" not in stderr
+        for pid in pids:
+            with pytest.raises(ProcessLookupError):
+                os.kill(pid, 0)
+    finally:
+        if parent.poll() is None:
+            # the workers too
+            os.killpg(parent.pid, signal.SIGKILL)
+            parent.communicate()